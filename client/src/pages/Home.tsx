@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useState, useRef } from 'react'
 import { useAuth } from '../contexts/AuthContext'
 import '../index.css'
 import {
@@ -30,6 +30,8 @@ interface Result {
     };
 }
 
+const MAX_RECONNECTS = 5;
+
 export function Home() {
     const { user } = useAuth();
     const [mode, setMode] = useState<'url' | 'file'>('url');
@@ -44,12 +46,84 @@ export function Home() {
     // @ts-ignore
     const [result, setResult] = useState<Result | null>(null);
     const [error, setError] = useState('');
+    // Text streamed while the job is still running
+    const [liveTranscript, setLiveTranscript] = useState('');
+    const [liveSummary, setLiveSummary] = useState('');
+    // Job id and last SSE event id, used to resume the stream after a dropped connection
+    const streamState = useRef<{ jobId: string | null, lastEventId: number }>({ jobId: null, lastEventId: 0 });
+
+    // Reads typed SSE events from the job stream. Returns true once the result (or an error) arrived.
+    const consumeEvents = async (response: Response) => {
+        const reader = response.body?.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        if (!reader) throw new Error("Failed to read response stream");
+
+        while (true) {
+            const { done, value } = await reader.read().catch(() => ({ done: true, value: undefined }));
+            if (done) return false;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // Split by newlines to handle valid SSE format
+            const lines = buffer.split('\n');
+            // Keep the last part in buffer (it might be incomplete)
+            buffer = lines.pop() || '';
+
+            for (const line of lines) {
+                const trimmedLine = line.trim();
+                if (!trimmedLine || trimmedLine.startsWith(':')) continue; // Skip empty or comment lines
+
+                if (trimmedLine.startsWith('id: ')) {
+                    streamState.current.lastEventId = Number(trimmedLine.slice(4)) || streamState.current.lastEventId;
+                    continue;
+                }
+                if (!trimmedLine.startsWith('data: ')) continue;
+
+                let data;
+                try {
+                    data = JSON.parse(trimmedLine.slice(6));
+                } catch (e) {
+                    console.error('Error parsing SSE line:', trimmedLine, e);
+                    continue;
+                }
+
+                if (data.jobId) streamState.current.jobId = data.jobId;
+
+                switch (data.type) {
+                    case 'transcript.delta':
+                        setLiveTranscript(prev => prev + data.text);
+                        break;
+                    case 'summary.delta':
+                        setLiveSummary(prev => prev + data.text);
+                        break;
+                    case 'text.snapshot':
+                        // Sent on replay when older deltas left the server's buffer: replaces the text so far
+                        setLiveTranscript(data.transcript);
+                        setLiveSummary(data.summary);
+                        break;
+                    case 'result':
+                        setResult(data.result);
+                        setLoading(false); // Ensure loading stops when result arrives
+                        return true;
+                    case 'error':
+                        throw new Error(data.error);
+                    default:
+                        if (data.status) setStatus(data.status);
+                }
+            }
+        }
+    };
 
     const handleSubmit = async () => {
         setLoading(true);
         setStatus('Iniciando...');
         setError('');
         setResult(null);
+        setLiveTranscript('');
+        setLiveSummary('');
+        streamState.current = { jobId: null, lastEventId: 0 };
 
         try {
             // Use stream endpoint for URL mode
@@ -67,9 +141,10 @@ export function Home() {
                 // File upload usually doesn't support SSE easily in this setup without XHR/fetch tricks, 
                 // keeping file upload as standard for now (or minimal update)
                 const formData = new FormData();
-                formData.append('audio', file);
+                // Fields first: the server streams the file part as it arrives
                 formData.append('provider', provider);
                 if (user?.id) formData.append('userId', user.id);
+                formData.append('audio', file);
                 body = formData;
             }
 
@@ -86,47 +161,22 @@ export function Home() {
 
             // Handle Stream for URL mode
             if (mode === 'url') {
-                const reader = response.body?.getReader();
-                const decoder = new TextDecoder();
-                let buffer = '';
-
-                if (!reader) throw new Error("Failed to read response stream");
-
-                while (true) {
-                    const { done, value } = await reader.read();
-                    if (done) break;
-
-                    const chunk = decoder.decode(value, { stream: true });
-                    buffer += chunk;
-
-                    // Split by newlines to handle valid SSE format
-                    const lines = buffer.split('\n');
-                    // Keep the last part in buffer (it might be incomplete)
-                    buffer = lines.pop() || '';
-
-                    for (const line of lines) {
-                        const trimmedLine = line.trim();
-                        if (!trimmedLine || trimmedLine === ':') continue; // Skip empty or comment lines
-
-                        if (trimmedLine.startsWith('data: ')) {
-                            try {
-                                const jsonStr = trimmedLine.slice(6);
-                                const data = JSON.parse(jsonStr);
-
-                                if (data.status) {
-                                    setStatus(data.status);
-                                }
-                                if (data.result) {
-                                    setResult(data.result);
-                                    setLoading(false); // Ensure loading stops when result arrives
-                                }
-                                if (data.error) throw new Error(data.error);
-                            } catch (e) {
-                                console.error('Error parsing SSE line:', trimmedLine, e);
-                            }
-                        }
-                    }
+                let stream: Response = response;
+                let finished = false;
+
+                for (let attempt = 0; ; attempt++) {
+                    finished = await consumeEvents(stream);
+                    if (finished || !streamState.current.jobId || attempt >= MAX_RECONNECTS) break;
+
+                    // Connection dropped mid-job: resume from the last event we saw
+                    await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
+                    stream = await fetch(`/api/jobs/${streamState.current.jobId}/events`, {
+                        headers: { 'Last-Event-ID': String(streamState.current.lastEventId) }
+                    });
+                    if (!stream.ok) break;
                 }
+
+                if (!finished) throw new Error('Conexão perdida com o servidor');
             } else {
                 // Standard File Upload response
                 const data = await response.json();
@@ -425,6 +475,37 @@ export function Home() {
                 </div>
             </div>
 
+            {!result && (liveTranscript || liveSummary) && (
+                <div className="glass-panel fade-in" style={{ marginTop: '2rem' }}>
+                    {liveSummary && (
+                        <>
+                            <div className="result-header">
+                                <div style={{ display: 'flex', alignItems: 'center', gap: '0.5rem' }}>
+                                    <BookOpen size={24} color="#a78bfa" />
+                                    <h2>Resumo Executivo</h2>
+                                </div>
+                                <Loader2 size={20} className="animate-spin" />
+                            </div>
+                            <div className="text-content">
+                                {liveSummary}
+                            </div>
+                            <div style={{ height: '2rem' }}></div>
+                        </>
+                    )}
+
+                    <div className="result-header">
+                        <div style={{ display: 'flex', alignItems: 'center', gap: '0.5rem' }}>
+                            <FileText size={24} color="#2dd4bf" />
+                            <h2>Transcrição (em andamento)</h2>
+                        </div>
+                        {!liveSummary && <Loader2 size={20} className="animate-spin" />}
+                    </div>
+                    <div className="scroll-area text-content" style={{ background: 'rgba(0,0,0,0.2)', padding: '1.5rem', borderRadius: '12px' }}>
+                        {liveTranscript}
+                    </div>
+                </div>
+            )}
+
             {result && (
                 <div className="glass-panel fade-in" style={{ marginTop: '2rem' }}>
                     {/* Summary Section */}
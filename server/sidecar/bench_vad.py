@@ -0,0 +1,83 @@
+"""Benchmarks the VAD sidecar: speech ratio, billed seconds saved and speed.
+
+    python bench_vad.py                 # synthetic lecture-like clips
+    python bench_vad.py a.mp3 b.m4a     # real recordings (needs ffmpeg)
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from vad import SAMPLE_RATE, detect_speech, frame_features, read_features
+
+FRAME_MS = 30
+# Whisper price used by calculateCost in server/src/services/supabase.ts
+WHISPER_USD_PER_MINUTE = 0.006
+
+
+def synth_speech(seconds, rng):
+    """Noise excited by a pitched pulse train with a syllable-rate envelope; crude, but speech-like for energy/ZCR."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voiced = np.sin(2 * np.pi * 140 * t) * 0.5 + np.sin(2 * np.pi * 280 * t) * 0.25 + np.sin(2 * np.pi * 420 * t) * 0.1
+    syllables = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t + rng.uniform(0, np.pi))
+    return (voiced + rng.normal(0, 0.1, t.size)) * syllables * 0.3
+
+
+def synth_clip(layout, rng, noise=0.003):
+    """Concatenates ("speech"|"silence", seconds) parts over a low noise floor."""
+    parts = [synth_speech(sec, rng) if kind == "speech" else np.zeros(int(sec * SAMPLE_RATE)) for kind, sec in layout]
+    audio = np.concatenate(parts) + rng.normal(0, noise, sum(p.size for p in parts))
+    return np.clip(audio * 32767, -32768, 32767).astype("<i2")
+
+
+def synthetic_cases():
+    rng = np.random.default_rng(7)
+    lecture = [("silence", 45)] + [("speech", 20), ("silence", 4)] * 30 + [("speech", 20), ("silence", 60)]
+    return {
+        "lecture with long pauses": synth_clip(lecture, rng),
+        "continuous talk": synth_clip([("speech", 600)], rng),
+        "mostly silence": synth_clip([("silence", 300), ("speech", 30), ("silence", 300)], rng),
+    }
+
+
+def report(name, energy_db, zcr, elapsed_features, total_samples):
+    frame_seconds = FRAME_MS / 1000
+    start = time.perf_counter()
+    intervals = detect_speech(energy_db, zcr, frame_seconds)
+    elapsed = elapsed_features + time.perf_counter() - start
+
+    original = total_samples / SAMPLE_RATE
+    speech = sum(end - begin for begin, end in intervals)
+    saved = original - speech
+    print(f"{name}")
+    print(f"  duration {original:8.1f}s  speech {speech:8.1f}s  ratio {speech / original:6.1%}  segments {len(intervals)}")
+    print(f"  billed seconds saved {saved:8.1f}s ({saved / original:.1%}), Whisper ${saved / 60 * WHISPER_USD_PER_MINUTE:.4f}")
+    print(f"  analysis {elapsed * 1000:8.1f}ms  ({original / elapsed:,.0f}x realtime)")
+    return original, speech
+
+
+def main(paths):
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    totals = [0.0, 0.0]
+
+    if paths:
+        for path in paths:
+            start = time.perf_counter()
+            energy_db, zcr, total_samples = read_features(path, frame_len)
+            original, speech = report(path, energy_db, zcr, time.perf_counter() - start, total_samples)
+            totals[0] += original
+            totals[1] += speech
+    else:
+        for name, samples in synthetic_cases().items():
+            start = time.perf_counter()
+            energy_db, zcr = frame_features(samples, frame_len)
+            original, speech = report(name, energy_db, zcr, time.perf_counter() - start, samples.size)
+            totals[0] += original
+            totals[1] += speech
+
+    print(f"total: {totals[0]:.1f}s -> {totals[1]:.1f}s billed ({1 - totals[1] / totals[0]:.1%} fewer seconds)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,111 @@
+"""Benchmarks per-job overhead of the yt-dlp worker against spawning yt-dlp for every job.
+
+    python bench_ytdlp.py                        # tiny local file over HTTP: almost pure startup overhead
+    python bench_ytdlp.py URL [--runs 5]         # a real video (downloads it once per run and path)
+    python bench_ytdlp.py --yt-dlp /path/to/yt-dlp
+
+Both paths run the same yt-dlp options. Media transfer time is the same for both, so the
+difference between the medians is the startup overhead the worker removes per job.
+"""
+
+import argparse
+import functools
+import http.server
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ytdlp_worker.py")
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_sample(directory):
+    """Serves a 64 KiB file from `directory` on a free localhost port; returns its URL."""
+    with open(os.path.join(directory, "sample.webm"), "wb") as f:
+        f.write(os.urandom(64 * 1024))
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/sample.webm"
+
+
+def spawn_job(command, url, args):
+    start = time.perf_counter()
+    subprocess.run(command + [url] + args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def worker_job(socket_path, url, args):
+    start = time.perf_counter()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall((json.dumps({"op": "download", "url": url, "args": args}) + "\n").encode())
+        for line in conn.makefile("r", encoding="utf-8"):
+            event = json.loads(line)
+            if event["event"] == "error":
+                raise RuntimeError(event["message"])
+            if event["event"] == "done":
+                break
+    return time.perf_counter() - start
+
+
+def report(name, times):
+    print(f"  {name:<22} median {statistics.median(times) * 1000:8.1f}ms  min {min(times) * 1000:8.1f}ms  max {max(times) * 1000:8.1f}ms")
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", nargs="?")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--yt-dlp", dest="binary", default=shutil.which("yt-dlp"), help="yt-dlp binary for the spawn path")
+    options = parser.parse_args()
+    if not options.binary:
+        sys.exit("yt-dlp not found; pass --yt-dlp")
+
+    workdir = tempfile.mkdtemp(prefix="bench_ytdlp_")
+    url = options.url or serve_sample(workdir)
+    # The same options extractAudio passes, minus audio extraction (no ffmpeg involved)
+    args = ["--no-playlist", "--no-warnings", "--force-overwrites", "--format", "bestaudio/best"]
+
+    socket_path = os.path.join(workdir, "worker.sock")
+    started = time.perf_counter()
+    worker = subprocess.Popen(
+        [sys.executable, WORKER, "--socket", socket_path, "--concurrency", "1", "--yt-dlp", options.binary],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    worker.stdout.readline()  # "ready"
+    print(f"worker startup (once per server): {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    try:
+        # The binary may be a zipapp (needs python) or a standalone executable
+        command = [options.binary] if os.access(options.binary, os.X_OK) else [sys.executable, options.binary]
+        spawn_times = [spawn_job(command, url, args + ["-o", os.path.join(workdir, f"spawn{i}.%(ext)s")]) for i in range(options.runs)]
+        # First worker job imports the extractor and fills its caches; later jobs are the steady state
+        first = worker_job(socket_path, url, args + ["-o", os.path.join(workdir, "worker_first.%(ext)s")])
+        worker_times = [worker_job(socket_path, url, args + ["-o", os.path.join(workdir, f"worker{i}.%(ext)s")]) for i in range(options.runs)]
+    finally:
+        worker.stdin.close()
+        worker.wait(timeout=10)
+
+    print(f"{options.runs} runs of {url}")
+    spawn = report("spawn per job", spawn_times)
+    report("worker (first job)", [first])
+    warm = report("worker (warm)", worker_times)
+    print(f"startup overhead removed per job: {(spawn - warm) * 1000:.1f}ms ({spawn / warm:.1f}x faster)")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Local stand-in for a media CDN, to test the range download engine (server/src/services/download.ts).
+
+    python range_server.py FILE [--port 8766] [--rate-kbps 2048] [--fail-after 1048576] [--failures 3] [--pass-first 2] [--no-ranges]
+
+Serves FILE at http://127.0.0.1:PORT/<name> with Range support, like googlevideo does for audio streams:
+- `--rate-kbps` throttles each connection (not the server), so concurrent fragments add up;
+- `--fail-after N --failures K` cuts K responses after N bytes, to exercise retries and resume;
+  `--pass-first P` lets the first P of those responses through, so a download can fail part way;
+- `--no-ranges` ignores Range headers and always sends the whole file, like a server without range support.
+
+Each request is logged to stdout as one JSON line (range, bytes sent, whether it was cut).
+"""
+
+import argparse
+import http.server
+import json
+import os
+import re
+import threading
+import time
+
+CHUNK = 16 * 1024
+
+
+def make_handler(path, rate_bytes, fail_after, failures, pass_first, ranges=True):
+    size = os.path.getsize(path)
+    name = "/" + os.path.basename(path)
+    lock = threading.Lock()
+    remaining_passes = [pass_first]
+    remaining_failures = [failures]
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != name:
+                self.send_error(404)
+                return
+
+            start, end = 0, size - 1
+            match = ranges and re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            if ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+
+            cut_at = None
+            if fail_after is not None and end - start + 1 > fail_after:
+                with lock:
+                    if remaining_passes[0] > 0:
+                        remaining_passes[0] -= 1
+                    elif remaining_failures[0] > 0:
+                        remaining_failures[0] -= 1
+                        cut_at = fail_after
+
+            sent = 0
+            began = time.monotonic()
+            with open(path, "rb") as f:
+                f.seek(start)
+                while sent < end - start + 1:
+                    if cut_at is not None and sent >= cut_at:
+                        break
+                    data = f.read(min(CHUNK, end - start + 1 - sent))
+                    try:
+                        self.wfile.write(data)
+                    except (BrokenPipeError, ConnectionResetError):
+                        break
+                    sent += len(data)
+                    if rate_bytes:
+                        # Sleep until this connection is back under its rate
+                        ahead = sent / rate_bytes - (time.monotonic() - began)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            print(json.dumps({"range": [start, end], "sent": sent, "cut": cut_at is not None}), flush=True)
+            if cut_at is not None:
+                self.close_connection = True
+                self.connection.shutdown(2)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--rate-kbps", type=int, default=0, help="per-connection limit in KiB/s (0 = unlimited)")
+    parser.add_argument("--fail-after", type=int, default=None, help="cut responses after this many bytes")
+    parser.add_argument("--failures", type=int, default=1, help="how many responses to cut")
+    parser.add_argument("--pass-first", type=int, default=0, help="responses served in full before the cuts start")
+    parser.add_argument("--no-ranges", action="store_true", help="ignore Range headers (always 200 with the whole file)")
+    args = parser.parse_args()
+
+    handler = make_handler(args.file, args.rate_kbps * 1024, args.fail_after, args.failures, args.pass_first, not args.no_ranges)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    server.daemon_threads = True
+    # --port 0 picks a free port; the URL has the one actually bound
+    print(json.dumps({"url": f"http://127.0.0.1:{server.server_port}/{os.path.basename(args.file)}"}), flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
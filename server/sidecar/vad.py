@@ -0,0 +1,226 @@
+"""Voice-activity trimming sidecar.
+
+Decodes audio to 16 kHz mono PCM with ffmpeg, finds speech with a vectorized
+energy / zero-crossing detector and writes a copy with the non-speech parts
+removed. Prints a JSON report on stdout, including the map from trimmed
+positions back to the original timeline.
+
+Usage:
+    python vad.py INPUT OUTPUT [options] [-- ENCODER_ARGS...]
+
+Everything after ``--`` is passed to the ffmpeg encoder for OUTPUT
+(e.g. ``-- -c:a libopus -b:a 24k``).
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Frames decoded per read while computing features (~30 s at 30 ms frames)
+FRAMES_PER_BLOCK = 1000
+
+
+def decode_pcm(path, ffmpeg="ffmpeg"):
+    """Starts ffmpeg decoding `path` to raw s16le mono PCM on stdout."""
+    return subprocess.Popen(
+        [ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error",
+         "-i", path, "-vn", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        stdout=subprocess.PIPE,
+    )
+
+
+def frame_features(samples, frame_len):
+    """Per-frame energy (dBFS) and zero-crossing rate for a block of int16 samples."""
+    n_frames = len(samples) // frame_len
+    frames = samples[: n_frames * frame_len].astype(np.float32).reshape(n_frames, frame_len) / 32768.0
+
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+    return energy_db, zcr
+
+
+def read_features(path, frame_len, ffmpeg="ffmpeg"):
+    """Streams the decoded audio once, keeping only per-frame features in memory."""
+    proc = decode_pcm(path, ffmpeg)
+    block_bytes = FRAMES_PER_BLOCK * frame_len * 2
+    energies, zcrs = [], []
+    total_samples = 0
+    tail = b""
+
+    while True:
+        data = proc.stdout.read(block_bytes)
+        if not data:
+            break
+        data = tail + data
+        usable = len(data) - len(data) % (frame_len * 2)
+        tail = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2")
+        total_samples += len(samples)
+        energy_db, zcr = frame_features(samples, frame_len)
+        energies.append(energy_db)
+        zcrs.append(zcr)
+
+    total_samples += len(tail) // 2
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg could not decode {path}")
+
+    if not energies:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32), total_samples
+    return np.concatenate(energies), np.concatenate(zcrs), total_samples
+
+
+def runs(mask):
+    """(start, end) frame index pairs of consecutive True values."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges.reshape(-1, 2)
+
+
+def detect_speech(energy_db, zcr, frame_seconds, margin_db=12.0, min_db=-50.0, dynamic_db=30.0,
+                  min_speech=0.25, min_silence=1.0, padding=0.2):
+    """Speech intervals in seconds from frame features.
+
+    The threshold adapts to the recording: a frame is voiced when it is
+    `margin_db` above the noise floor (10th percentile of frame energy), capped
+    at `dynamic_db` below the loud frames (95th percentile) so recordings with
+    no pauses at all, where the "floor" is itself speech, are kept whole.
+    Quieter frames with a high zero-crossing rate (fricatives such as s, f, x)
+    also count as speech. Pauses shorter than `min_silence` are kept so
+    sentences are not chopped, and every segment is padded by `padding`.
+    """
+    if len(energy_db) == 0:
+        return []
+
+    floor, loud = np.percentile(energy_db, [10, 95])
+    threshold = max(min(floor + margin_db, loud - dynamic_db), min_db)
+    voiced = energy_db > threshold
+    # Noise is also high-ZCR, so fricatives still have to clear the floor
+    fricative = (energy_db > max(threshold - margin_db / 2, floor + margin_db / 2)) & (zcr > 0.3)
+    mask = voiced | fricative
+
+    # Drop isolated blips, then bridge short pauses
+    min_speech_frames = int(round(min_speech / frame_seconds))
+    for start, end in runs(mask):
+        if end - start < min_speech_frames:
+            mask[start:end] = False
+
+    min_silence_frames = int(round(min_silence / frame_seconds))
+    for start, end in runs(~mask):
+        if 0 < start and end < len(mask) and end - start < min_silence_frames:
+            mask[start:end] = True
+
+    duration = len(mask) * frame_seconds
+    intervals = []
+    for start, end in runs(mask):
+        begin = max(0.0, start * frame_seconds - padding)
+        finish = min(duration, end * frame_seconds + padding)
+        if intervals and begin <= intervals[-1][1]:
+            intervals[-1][1] = finish
+        else:
+            intervals.append([begin, finish])
+    return intervals
+
+
+def build_map(intervals):
+    """Segments as {trimmed_start, original_start, duration}, used to map transcript times back."""
+    segments = []
+    position = 0.0
+    for start, end in intervals:
+        segments.append({
+            "trimmed_start": round(position, 3),
+            "original_start": round(start, 3),
+            "duration": round(end - start, 3),
+        })
+        position += end - start
+    return segments
+
+
+def write_trimmed(path, output, intervals, encoder_args, ffmpeg="ffmpeg"):
+    """Second decode pass: streams only the speech samples into the encoder."""
+    decoder = decode_pcm(path, ffmpeg)
+    encoder = subprocess.Popen(
+        [ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error", "-y",
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "-",
+         *encoder_args, output],
+        stdin=subprocess.PIPE,
+    )
+
+    bounds = [(int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)) for start, end in intervals]
+    position = 0  # sample index of the start of the current block
+    current = 0
+    try:
+        while current < len(bounds):
+            data = decoder.stdout.read(SAMPLE_RATE * 2 * 10)
+            if not data:
+                break
+            if len(data) % 2:
+                data += decoder.stdout.read(1)
+            block_end = position + len(data) // 2
+
+            while current < len(bounds) and bounds[current][0] < block_end:
+                start, end = bounds[current]
+                lo = max(start, position) - position
+                hi = min(end, block_end) - position
+                encoder.stdin.write(data[lo * 2: hi * 2])
+                if end > block_end:
+                    break
+                current += 1
+            position = block_end
+    finally:
+        decoder.stdout.close()
+        decoder.kill()
+        decoder.wait()
+        encoder.stdin.close()
+
+    if encoder.wait() != 0:
+        raise RuntimeError(f"ffmpeg could not encode {output}")
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    encoder_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, encoder_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--frame-ms", type=int, default=30)
+    parser.add_argument("--margin-db", type=float, default=12.0)
+    parser.add_argument("--min-speech", type=float, default=0.25)
+    parser.add_argument("--min-silence", type=float, default=1.0)
+    parser.add_argument("--padding", type=float, default=0.2)
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    args = parser.parse_args(argv)
+
+    frame_len = SAMPLE_RATE * args.frame_ms // 1000
+    energy_db, zcr, total_samples = read_features(args.input, frame_len, args.ffmpeg)
+    intervals = detect_speech(
+        energy_db, zcr, frame_len / SAMPLE_RATE,
+        margin_db=args.margin_db, min_speech=args.min_speech,
+        min_silence=args.min_silence, padding=args.padding,
+    )
+
+    original_seconds = total_samples / SAMPLE_RATE
+    speech_seconds = sum(end - start for start, end in intervals)
+    if intervals:
+        write_trimmed(args.input, args.output, intervals, encoder_args, args.ffmpeg)
+
+    json.dump({
+        "output": args.output if intervals else None,
+        "original_seconds": round(original_seconds, 3),
+        "speech_seconds": round(speech_seconds, 3),
+        "speech_ratio": round(speech_seconds / original_seconds, 4) if original_seconds else 0.0,
+        "segments": build_map(intervals),
+    }, sys.stdout)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
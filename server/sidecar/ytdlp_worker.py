@@ -0,0 +1,196 @@
+"""Long-lived yt-dlp worker: runs yt-dlp in-process, so jobs skip interpreter startup and extractor imports,
+and reuse warm extractor state (YouTube player JS and signature functions) from earlier jobs.
+
+    python ytdlp_worker.py --socket /tmp/ytdlp.sock [--concurrency 4] [--yt-dlp /path/to/yt-dlp]
+
+Protocol (newline-delimited JSON over a Unix socket, one job per connection):
+    request  {"id": "...", "op": "download" | "info", "url": "...", "args": [yt-dlp CLI options]}
+    events   {"event": "started"}, {"event": "progress", ...}, {"event": "postprocess", ...}
+    final    {"event": "done", "result": {...}} or {"event": "error", "message": "..."}
+
+`args` are the same options the CLI would get, so a job behaves exactly like spawning yt-dlp with them.
+Closing the connection cancels the job at its next progress update.
+"""
+
+import argparse
+import collections
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+PROGRESS_INTERVAL = 0.5
+
+
+def load_yt_dlp(binary):
+    """Prefers the release binary the server already uses (a zipapp, so importable) to keep versions identical."""
+    if binary and os.path.isfile(binary):
+        sys.path.insert(0, binary)
+        try:
+            import yt_dlp
+            return yt_dlp
+        except ImportError:
+            sys.path.remove(binary)
+    import yt_dlp
+    return yt_dlp
+
+
+class JobLogger:
+    """Keeps the last warnings/errors for the error message instead of printing them."""
+
+    def __init__(self):
+        self.lines = collections.deque(maxlen=20)
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        self.lines.append(msg)
+
+    def error(self, msg):
+        self.lines.append(msg)
+
+
+class Slot:
+    """One unit of concurrency. Extractor instances (and their player/code caches) live as long as the slot."""
+
+    def __init__(self):
+        self.extractors = {}
+        self.jobs = 0
+
+
+def run_job(yt_dlp, slot, request, send):
+    try:
+        opts = yt_dlp.parse_options(request.get("args") or []).ydl_opts
+    except SystemExit:
+        raise ValueError("invalid yt-dlp options")
+
+    last_sent = {"at": 0.0, "status": None}
+
+    def on_progress(d):
+        now = time.monotonic()
+        if d["status"] == last_sent["status"] and now - last_sent["at"] < PROGRESS_INTERVAL:
+            return
+        last_sent.update(at=now, status=d["status"])
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        downloaded = d.get("downloaded_bytes") or 0
+        # A write to a closed connection raises here, which aborts the download
+        send({
+            "event": "progress",
+            "status": d["status"],
+            "downloadedBytes": downloaded,
+            "totalBytes": total,
+            "percent": round(downloaded / total * 100, 1) if total else None,
+            "speed": d.get("speed"),
+            "eta": d.get("eta"),
+        })
+
+    def on_postprocess(d):
+        send({"event": "postprocess", "postprocessor": d.get("postprocessor"), "status": d["status"]})
+
+    logger = JobLogger()
+    opts.update(quiet=True, noprogress=True, logger=logger)
+    opts["progress_hooks"] = list(opts.get("progress_hooks") or []) + [on_progress]
+    opts["postprocessor_hooks"] = list(opts.get("postprocessor_hooks") or []) + [on_postprocess]
+
+    download = request.get("op") == "download"
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        for extractor in slot.extractors.values():
+            ydl.add_info_extractor(extractor)
+        try:
+            info = ydl.extract_info(request["url"], download=download)
+        finally:
+            slot.extractors.update(ydl._ies_instances)
+            slot.jobs += 1
+
+        if info is None:
+            raise RuntimeError("\n".join(logger.lines) or "yt-dlp returned no result")
+        if not download:
+            return ydl.sanitize_info(info)
+
+        downloads = info.get("requested_downloads") or []
+        return {"filepath": downloads[-1].get("filepath") if downloads else None}
+
+
+def make_handler(yt_dlp, slots):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            def send(event):
+                self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+
+            try:
+                request = json.loads(line)
+            except ValueError:
+                send({"event": "error", "message": "invalid request"})
+                return
+
+            queued_at = time.monotonic()
+            slot = slots.get()
+            try:
+                send({"event": "started", "queuedMs": round((time.monotonic() - queued_at) * 1000), "warm": slot.jobs > 0})
+                result = run_job(yt_dlp, slot, request, send)
+                send({"event": "done", "result": result})
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client went away: the job is cancelled
+            except Exception as e:
+                try:
+                    send({"event": "error", "message": str(e)})
+                except OSError:
+                    pass
+            finally:
+                slots.put(slot)
+
+    return Handler
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def exit_with_parent():
+    """The server talks to us over stdin only to keep it open: EOF means the parent is gone."""
+    sys.stdin.read()
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--yt-dlp", dest="binary", default=None, help="yt-dlp release binary to import from")
+    args = parser.parse_args()
+
+    yt_dlp = load_yt_dlp(args.binary)
+
+    # LIFO: the most recently used (warmest) slot takes the next job
+    slots = queue.LifoQueue()
+    for _ in range(max(1, args.concurrency)):
+        slots.put(Slot())
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = Server(args.socket, make_handler(yt_dlp, slots))
+    os.chmod(args.socket, 0o600)
+
+    threading.Thread(target=exit_with_parent, daemon=True).start()
+    print(json.dumps({"event": "ready", "version": yt_dlp.version.__version__}), flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
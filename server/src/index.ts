@@ -1,15 +1,34 @@
 import express from 'express';
 import cors from 'cors';
 import dotenv from 'dotenv';
-import multer from 'multer';
 import path from 'path';
 import fs from 'fs';
-import { extractAudio } from './services/youtube';
-import { processWithGemini } from './services/gemini';
+import { extractAudio, getCanonicalVideoKey, getExtractionStats } from './services/youtube';
+import { getWorkerStats } from './services/ytdlp';
+import { getDownloadStats } from './services/download';
+import { processWithGemini, getGeminiUploadStats } from './services/gemini';
 import { processWithOpenAI } from './services/openai';
-import { saveProcessingResult, getApiKey, saveApiKey, supabase } from './services/supabase';
+import { persistProcessingResult, findResultByContentHash, ProcessingUsage, getApiKey, saveApiKey, getApiKeyCacheStats } from './services/supabase';
+import { JournalQueue } from './services/journal';
+import { receiveAudioUpload, ReceivedUpload, UploadLimitError, InvalidUploadError } from './services/upload';
+import { TieredCache } from './services/cache';
+import { verifyAccessToken, getAuthStats } from './services/auth';
+import { configureHttpAgents, getConnectionStats } from './services/http';
+import { getClientPoolStats } from './services/clients';
+import { normalizeAudio, trimSilence, isVadEnabled, getAudioVariant, getAudioDuration, removeFiles, getNormalizationStats, NormalizedAudio, SpeechMap } from './services/audio';
+import { ArtifactCache } from './services/artifacts';
+import { InFlightRegistry } from './services/inflight';
+import { extractQueue, longExtractQueue, metadataQueue, aiQueue, QueueFullError } from './services/scheduler';
+import { preflightVideo, recordDownload, recordProcessing, getPreflightStats, AdmissionError, PreflightPlan } from './services/preflight';
+import { createJob, getJob, getJobStats, streamJobEvents, Job } from './services/jobs';
+import { processVideoPipelined, isPipelinedEnabled } from './services/pipelined';
+import { ProgressCallback, toPipelineEvent, isStageEvent } from './services/progress';
+import { runHedged, isHedgingEnabled, getHedgeDelay, recordProviderLatency, getHedgingStats } from './services/hedging';
+import { CancelledError } from './services/abort';
 
 dotenv.config();
+// Shared keep-alive connections for the provider SDKs
+configureHttpAgents();
 
 const app = express();
 const PORT = process.env.PORT || 3000;
@@ -23,13 +42,40 @@ if (!fs.existsSync(DOWNLOAD_DIR)) {
     fs.mkdirSync(DOWNLOAD_DIR);
 }
 
-// Setup Multer for uploads
-const upload = multer({ dest: 'uploads/' });
+// Uploads are streamed (and transcoded) straight into this directory
+const UPLOAD_DIR = path.join(__dirname, '../uploads');
+if (!fs.existsSync(UPLOAD_DIR)) {
+    fs.mkdirSync(UPLOAD_DIR);
+}
+
+// Processed results, keyed by canonical video ID + provider (memory LRU in front of a disk tier)
+const resultCache = new TieredCache<any>({
+    name: 'results',
+    dir: path.join(__dirname, '../cache/results'),
+    maxEntries: Number(process.env.RESULT_CACHE_MAX_ENTRIES) || 500,
+    ttlMs: (Number(process.env.RESULT_CACHE_TTL_HOURS) || 24 * 7) * 60 * 60 * 1000,
+});
+setInterval(() => resultCache.prune(), 60 * 60 * 1000).unref();
+
+const getResultCacheKey = (url: string, provider?: string) => `${getCanonicalVideoKey(url)}:${provider || 'gemini'}`;
+
+type PreparedAudio = Omit<NormalizedAudio, 'path'> & { speech?: SpeechMap };
+
+// Downloaded and prepared (normalized/trimmed) audio by canonical video ID + audio variant, so running
+// a video again with the other provider skips download and transcode. Bounded by total bytes.
+const audioArtifacts = new ArtifactCache<PreparedAudio>({
+    name: 'audio',
+    dir: path.join(__dirname, '../cache/audio'),
+    maxBytes: (Number(process.env.AUDIO_CACHE_MAX_MB) || 2048) * 1024 * 1024,
+});
+
+// Concurrent requests for the same video/provider share one extract + transcribe job
+const videoJobs = new InFlightRegistry<any>();
 
 // Helper to validate and select service
 // @ts-ignore
-const processAudio = async (filePath: string, options: any, onProgress?: (status: string) => void) => {
-    const { provider, apiKey, originalUrl, userId } = options;
+const processAudio = async (filePath: string, options: any, onProgress?: ProgressCallback) => {
+    const { provider, apiKey, originalUrl, userId, signal } = options;
 
     console.log(`Processing with ${provider || 'gemini'}...`);
     if (onProgress) onProgress(`Iniciando processamento com ${provider || 'gemini'}...`);
@@ -68,24 +114,295 @@ const processAudio = async (filePath: string, options: any, onProgress?: (status
         };
     }
 
-    if (provider === 'openai') {
-        const keyToUse = effectiveApiKey;
-        if (!keyToUse) {
-            throw new Error("API Key da OpenAI não encontrada. Por favor, configure nos ajustes.");
+    const keyToUse = effectiveApiKey;
+    if (!keyToUse) {
+        throw new Error(provider === 'openai'
+            ? "API Key da OpenAI não encontrada. Por favor, configure nos ajustes."
+            : "API Key do Gemini não encontrada. Por favor, configure nos ajustes.");
+    }
+
+    // Hedging sends the same audio to the other provider too, with the user's stored key for it
+    const primary = provider === 'openai' ? 'openai' : 'gemini';
+    const secondary = primary === 'openai' ? 'gemini' : 'openai';
+    const secondaryKey = isHedgingEnabled() && userId ? await getApiKey(secondary, userId).catch(() => null) : null;
+    const keys: Record<string, string> = { [primary]: keyToUse, ...(secondaryKey ? { [secondary]: secondaryKey } : {}) };
+
+    // Audio from the artifact cache is already prepared
+    const audio: NormalizedAudio & { speech?: SpeechMap } = options.prepared
+        ? { ...options.prepared, path: filePath }
+        : await prepareAudio(filePath, !!options.normalized, onProgress, signal);
+
+    try {
+        // Deadlines and latency samples are per second of audio
+        const audioSeconds = isHedgingEnabled() ? await getAudioDuration(audio.path, signal).catch(() => null) : null;
+
+        // With two providers running, the first one to stream text owns the client's transcript/summary
+        let textOwner: string | null = null;
+        const progressFor = (name: string): ProgressCallback | undefined => onProgress && ((event) => {
+            if (!isStageEvent(event)) {
+                if (textOwner && textOwner !== name) return;
+                textOwner = name;
+            }
+            onProgress(event);
+        });
+
+        const callProvider = async (name: string, attemptSignal: AbortSignal) => {
+            const started = Date.now();
+            try {
+                let result;
+                if (name === 'openai') {
+                    if (onProgress) onProgress('Transcrevendo áudio com Whisper (OpenAI)...');
+                    result = await processWithOpenAI(audio.path, keys[name], undefined, progressFor(name), attemptSignal);
+                } else {
+                    // Gemini (Default)
+                    if (onProgress) onProgress('Enviando para Gemini 1.5 Flash...');
+                    result = await processWithGemini(audio.path, keys[name], progressFor(name), attemptSignal);
+                }
+                if (audioSeconds) recordProviderLatency(name, Date.now() - started, audioSeconds);
+                return result;
+            } catch (e) {
+                // Cancelled because the other provider won: it took at least this long, and leaving
+                // the slow runs out would pull the hedge deadline down
+                if (audioSeconds && attemptSignal.aborted && !(signal && signal.aborted)) {
+                    recordProviderLatency(name, Date.now() - started, audioSeconds);
+                }
+                throw e;
+            }
+        };
+
+        const served = await aiQueue.run(() => runHedged({
+            primary,
+            secondary: secondaryKey ? secondary : null,
+            delayMs: getHedgeDelay(primary, audioSeconds),
+            signal,
+            // The hedge takes an AI slot of its own, so provider concurrency stays within AI_CONCURRENCY
+            run: (name, attemptSignal) => name === primary
+                ? callProvider(name, attemptSignal)
+                : aiQueue.run(() => callProvider(name, attemptSignal), undefined, attemptSignal),
+            onHedge: (name, reason) => onProgress && onProgress(reason === 'failover'
+                ? `${primary} indisponível no momento, usando ${name}...`
+                : `${primary} está demorando mais que o normal, consultando também ${name}...`),
+        }), (position) => onProgress && onProgress(`Na fila para transcrição (posição ${position})...`), signal);
+
+        return {
+            ...served.result,
+            // The provider that actually produced the result (differs from the requested one after hedging/failover)
+            provider: served.provider,
+            ...(served.hedged ? { hedged: true } : {}),
+            audio: { profile: audio.profile, originalBytes: audio.originalBytes, normalizedBytes: audio.normalizedBytes, savedBytes: audio.savedBytes },
+            ...(audio.speech ? { speech: audio.speech } : {}),
+        };
+    } finally {
+        if (audio.path !== filePath) removeFiles([audio.path]);
+    }
+}
+
+// Downmix/resample/re-encode before upload; the caller still owns (and removes) the original file.
+// With VAD enabled, silence is cut in the same pass so it is never billed.
+const prepareAudio = async (filePath: string, normalized: boolean, onProgress?: ProgressCallback, signal?: AbortSignal): Promise<NormalizedAudio & { speech?: SpeechMap }> => {
+    if (onProgress) onProgress('Otimizando áudio...');
+    const trimmed = isVadEnabled()
+        ? await trimSilence(filePath, path.dirname(filePath), undefined, signal).catch((e) => {
+            if (signal && signal.aborted) throw e;
+            console.error('Voice activity trimming failed, using full audio:', e.message);
+            return null;
+        })
+        : null;
+    if (trimmed && onProgress) onProgress(`Silêncio removido: ${Math.round((1 - trimmed.speech.speechRatio) * 100)}% do áudio`);
+
+    const audio = trimmed || await normalizeAudio(filePath, path.dirname(filePath), normalized ? 'original' : undefined, signal);
+    if (audio.savedBytes > 0) {
+        console.log(`Audio normalized (${audio.profile}): ${audio.originalBytes} -> ${audio.normalizedBytes} bytes`);
+    }
+    return audio;
+};
+
+// Explicit key from the request, else the user's stored key for the provider
+const resolveApiKey = async (provider: string | undefined, apiKey: string | undefined, userId?: string): Promise<string> => {
+    const key = apiKey || (userId ? await getApiKey(provider || 'gemini', userId) : null);
+    if (!key) {
+        throw new Error(provider === 'openai'
+            ? "API Key da OpenAI não encontrada. Por favor, configure nos ajustes."
+            : "API Key do Gemini não encontrada. Por favor, configure nos ajustes.");
+    }
+    return key;
+};
+
+type ResultSource = 'processed' | 'cache' | 'shared';
+
+const isTestVideoUrl = (url: string) =>
+    process.env.NODE_ENV === 'test' && (url === 'https://www.youtube.com/watch?v=TEST' || url.includes('TEST_VIDEO_ID'));
+
+// Metadata preflight: admission control, strategy and estimates before anything is downloaded.
+// Only admission errors (and cancellation) are fatal; if the metadata can't be fetched the job runs without a plan.
+const planVideo = async (url: string, provider: string | undefined, signal?: AbortSignal): Promise<PreflightPlan | null> => {
+    if (isTestVideoUrl(url)) return null;
+    try {
+        return await preflightVideo(url, provider, isPipelinedEnabled(), signal);
+    } catch (e: any) {
+        if (e instanceof AdmissionError || (signal && signal.aborted)) throw e;
+        console.error('Metadata preflight failed, continuing without it:', e.message);
+        return null;
+    }
+};
+
+// Preflight, extract + transcribe a video, then store the result in the cache.
+// `options.signal` aborts every stage (queues, yt-dlp, ffmpeg, provider requests).
+const runVideoPipeline = async (url: string, options: any, onProgress?: ProgressCallback) => {
+    const signal: AbortSignal | undefined = options.signal;
+    // Runs inside the shared job, so cache hits and callers attaching to it skip the metadata lookup
+    const plan = await planVideo(url, options.provider, signal);
+    if (plan && onProgress) onProgress(plan.estimate);
+    const downloadQueue = plan && plan.longVideo ? longExtractQueue : extractQueue;
+
+    // Pipelined mode: download and transcription overlap, segment by segment
+    if ((plan ? plan.pipelined : isPipelinedEnabled()) && !isTestVideoUrl(url)) {
+        const apiKey = await resolveApiKey(options.provider, options.apiKey, options.userId);
+        const result = await downloadQueue.run(
+            () => aiQueue.run(() => processVideoPipelined(url, DOWNLOAD_DIR, options.provider, apiKey, onProgress, signal), undefined, signal),
+            (position) => onProgress && onProgress(`Na fila para download (posição ${position})...`),
+            signal
+        );
+        await resultCache.set(getResultCacheKey(url, options.provider), result);
+        return result;
+    }
+
+    // 1. Extract Audio
+    if (isTestVideoUrl(url)) {
+        console.log('Test URL detected: Skipping extractAudio');
+        // processAudio's mock handles the missing file
+        const result = await processAudio(path.join(DOWNLOAD_DIR, 'test_mock_audio.mp3'), { ...options, originalUrl: url }, onProgress);
+        if (result && result.summary) await resultCache.set(getResultCacheKey(url, options.provider), result);
+        return result;
+    }
+
+    // Download and prepare once per video + audio variant; other providers reuse the cached artifact.
+    // The creation is shared too, so it stops only when every job waiting for it is cancelled.
+    const audio = await audioArtifacts.acquire(`${getCanonicalVideoKey(url)}:${getAudioVariant()}`, async (createSignal) => {
+        const audioPath = await downloadQueue.run(
+            async () => {
+                const started = Date.now();
+                const extractedPath = await extractAudio(url, DOWNLOAD_DIR, onProgress, createSignal, plan ? plan.metadata : undefined);
+                recordDownload(fs.statSync(extractedPath).size, Date.now() - started);
+                return extractedPath;
+            },
+            (position) => onProgress && onProgress(`Na fila para download (posição ${position})...`),
+            createSignal
+        );
+        console.log(`Audio extracted to: ${audioPath}`);
+
+        let preparedPath = '';
+        try {
+            const { path: prepared, ...meta } = await prepareAudio(audioPath, false, onProgress, createSignal);
+            preparedPath = prepared;
+            return { path: prepared, meta };
+        } finally {
+            // Cleanup the download unless it is the prepared file itself (normalization disabled or no gain)
+            if (preparedPath !== audioPath) removeFiles([audioPath]);
         }
-        if (onProgress) onProgress('Transcrevendo áudio com Whisper (OpenAI)...');
-        return await processWithOpenAI(filePath, keyToUse);
-    } else {
-        // Gemini (Default)
-        const keyToUse = effectiveApiKey;
-        if (!keyToUse) {
-            throw new Error("API Key do Gemini não encontrada. Por favor, configure nos ajustes.");
+    }, signal);
+
+    if (onProgress) onProgress(audio.cached ? 'Áudio encontrado em cache. Iniciando transcrição...' : 'Áudio extraído. Iniciando transcrição...');
+
+    try {
+        // 2. Transcribe & Summarize (with Provider selection)
+        // We pass the raw apiKey from request here, the helper resolves it from DB if needed
+        const started = Date.now();
+        const result = await processAudio(audio.path, { ...options, originalUrl: url, prepared: audio.meta }, onProgress);
+        console.log('Transcription complete');
+        if (plan && !audio.cached) recordProcessing(plan.metadata.durationSeconds, Date.now() - started);
+
+        // Cached under the provider that answered: after hedging/failover that isn't the requested one
+        if (result && result.summary) {
+            await resultCache.set(getResultCacheKey(url, result.provider || options.provider), result);
         }
-        if (onProgress) onProgress('Enviando para Gemini 1.5 Flash...');
-        return await processWithGemini(filePath, keyToUse);
+        return result;
+    } finally {
+        audio.release();
     }
+};
+
+// Serves a video from the result cache, or attaches to (or starts) the single in-flight job for it
+const getVideoResult = async (url: string, options: any, onProgress?: ProgressCallback): Promise<{ result: any, source: ResultSource }> => {
+    const cacheKey = getResultCacheKey(url, options.provider);
+    const cached = await resultCache.get(cacheKey);
+    if (cached) {
+        console.log(`Result cache hit: ${cacheKey}`);
+        if (onProgress) onProgress('Resultado encontrado em cache.');
+        return { result: cached, source: 'cache' };
+    }
+
+    // The key is resolved before joining: a caller without one fails on its own instead of starting
+    // (and failing) the job shared with callers who have a key
+    const apiKey = isTestVideoUrl(url) ? options.apiKey : await resolveApiKey(options.provider, options.apiKey, options.userId);
+
+    // The pipeline gets the registry's signal: it aborts only when every attached caller has
+    const { promise, shared } = videoJobs.run(
+        cacheKey,
+        (progress, jobSignal) => runVideoPipeline(url, { ...options, apiKey, signal: jobSignal }, progress),
+        onProgress,
+        options.signal
+    );
+    if (shared) console.log(`Attached to in-flight job: ${cacheKey}`);
+
+    return { result: await promise, source: shared ? 'shared' : 'processed' };
+};
+
+// Results are persisted write-behind: journaled locally, then written to Supabase in the background,
+// so responses don't wait on the database and transient DB errors are retried.
+interface PendingResult {
+    userId: string;
+    url: string;
+    transcription: string;
+    summary: string;
+    keyTopics: string[];
+    usageData: ProcessingUsage;
+    contentHash?: string;
 }
 
+const resultWriter = new JournalQueue<PendingResult>({
+    name: 'results',
+    dir: path.join(__dirname, '../data/journal'),
+    // The journal id makes a replayed write (lost ack, crash before the ack) a no-op
+    write: (record, id) => persistProcessingResult(record.userId, record.url, record.transcription, record.summary, record.keyTopics, record.usageData, record.contentHash, id),
+    concurrency: Number(process.env.RESULT_WRITE_CONCURRENCY) || 4,
+});
+resultWriter.start().catch((e) => console.error('Could not start result journal:', e));
+
+// Helper to persist a result for a user.
+// Only the request that actually ran the job is billed; cache hits and attached requests log zero tokens.
+const saveResultForUser = async (userId: string, url: string, provider: string | undefined, result: any, source: ResultSource = 'processed', contentHash?: string) => {
+    const billed = source === 'processed';
+    // Logged under the provider that served the result, which hedging may have switched
+    const servedBy = result.provider || provider || 'gemini';
+    const usageData = {
+        provider: servedBy,
+        model: servedBy === 'openai' ? 'gpt-5-mini' : 'gemini-2.5-flash',
+        serviceType: source === 'cache' ? 'cache_hit' : source === 'shared' ? 'shared_job' : 'transcription_and_summary',
+        inputTokens: billed ? result.usage?.promptTokenCount || 0 : 0,
+        outputTokens: billed ? result.usage?.candidatesTokenCount || 0 : 0,
+        audioDuration: billed ? result.duration || 0 : 0
+    };
+
+    const record: PendingResult = {
+        userId,
+        url,
+        transcription: result.transcription,
+        summary: result.summary,
+        keyTopics: result.key_topics || [],
+        usageData,
+        contentHash
+    };
+
+    try {
+        await resultWriter.enqueue(record);
+    } catch (e: any) {
+        // Journal not started yet (or failed to start / unwritable): write synchronously instead
+        console.error('Could not journal result, writing it directly:', e.message);
+        await persistProcessingResult(record.userId, record.url, record.transcription, record.summary, record.keyTopics, record.usageData, record.contentHash);
+    }
+};
+
 // Helper to validate user from token
 const validateUser = async (req: express.Request): Promise<string> => {
     const authHeader = req.headers.authorization;
@@ -100,10 +417,8 @@ const validateUser = async (req: express.Request): Promise<string> => {
         return 'test-user-id';
     }
 
-    const { data: { user }, error } = await supabase.auth.getUser(token);
-    if (error || !user) throw new Error("Invalid token");
-
-    return user.id;
+    // Verified locally (secret/JWKS) when possible, remote getUser only as a fallback
+    return verifyAccessToken(token);
 };
 
 // Settings Endpoints
@@ -133,90 +448,75 @@ app.post('/api/settings/keys', async (req, res) => {
     }
 });
 
-app.post('/api/process-video/stream', async (req, res): Promise<any> => {
-    // SSE Setup
-    res.setHeader('Content-Type', 'text/event-stream');
-    res.setHeader('Cache-Control', 'no-cache');
-    res.setHeader('Connection', 'keep-alive');
+// Runs a video job in the background, publishing progress and the final result as job events
+const runVideoJob = async (job: Job, body: any) => {
+    const { url, provider, apiKey, userId } = body;
 
-    const sendEvent = (data: any) => {
-        res.write(`data: ${JSON.stringify(data)}\n\n`);
-    };
+    console.log(`Processing URL (Job ${job.id}): ${url}`);
+    job.push({ type: 'stage', status: 'Inicializando...', jobId: job.id });
 
-    try {
-        const { url, provider, apiKey, userId } = req.body;
-        if (!url) {
-            sendEvent({ error: 'URL is required' });
-            return res.end();
-        }
-
-        console.log(`Processing URL (Stream): ${url}`);
-        sendEvent({ status: 'Inicializando...' });
-
-        // 1. Extract Audio
-        let audioPath = '';
-        if (process.env.NODE_ENV === 'test' && (url === 'https://www.youtube.com/watch?v=TEST' || url.includes('TEST_VIDEO_ID'))) {
-            console.log('Test URL detected: Skipping extractAudio');
-            audioPath = path.join(DOWNLOAD_DIR, 'test_mock_audio.mp3');
-            // Create dummy file if needed, or processAudio mock will handle it
-        } else {
-            // @ts-ignore
-            audioPath = await extractAudio(url, DOWNLOAD_DIR, (status) => {
-                sendEvent({ status });
-            });
-        }
+    // The estimate (when the preflight succeeds) arrives as a progress event before the download starts
+    const { result, source } = await getVideoResult(url, { provider, apiKey, userId, signal: job.signal }, (event) => {
+        job.push(toPipelineEvent(event));
+    });
 
-        console.log(`Audio extracted to: ${audioPath}`);
-        sendEvent({ status: 'Áudio extraído. Iniciando transcrição...' });
+    // 3. Save to Supabase (each attached user gets their own rows)
+    if (result && result.summary && userId) {
+        job.push({ type: 'stage', status: 'Transcrição concluída. Salvando...' });
+        await saveResultForUser(userId, url, provider, result, source);
+        console.log('Queued result for Supabase');
+    }
 
-        // 2. Transcribe & Summarize (with Provider selection)
-        // @ts-ignore
-        const result = await processAudio(audioPath, { provider, apiKey, originalUrl: url, userId }, (status) => {
-            sendEvent({ status });
-        });
-        console.log('Transcription complete');
-        sendEvent({ status: 'Transcrição concluída. Salvando...' });
+    job.complete(result, { cached: source === 'cache' });
+};
 
-        // 3. Save to Supabase
-        if (result && result.summary) {
-            const usageData = {
-                provider: provider || 'gemini',
-                model: provider === 'openai' ? 'gpt-5-mini' : 'gemini-2.5-flash',
-                serviceType: 'transcription_and_summary',
-                inputTokens: result.usage?.promptTokenCount || 0,
-                outputTokens: result.usage?.candidatesTokenCount || 0,
-                audioDuration: result.duration || 0
-            };
+// Async job API: returns immediately, progress is read from /api/jobs/:id/events
+app.post('/api/jobs', (req, res): any => {
+    if (!req.body.url) {
+        return res.status(400).json({ error: 'URL is required' });
+    }
 
-            // If userId is present, save to DB
-            if (userId) {
-                await saveProcessingResult(
-                    userId,
-                    url,
-                    result.transcription,
-                    result.summary,
-                    result.key_topics || [],
-                    usageData
-                );
-                console.log('Saved to Supabase');
-            }
-        }
+    const job = createJob((job) => runVideoJob(job, req.body), { keepRunning: req.body.keepRunning === true });
+    res.status(202).json({ jobId: job.id, eventsUrl: `/api/jobs/${job.id}/events` });
+});
 
-        // Cleanup audio file
-        if (fs.existsSync(audioPath)) fs.unlinkSync(audioPath);
+app.get('/api/jobs/:id', (req, res): any => {
+    const job = getJob(req.params.id);
+    if (!job) return res.status(404).json({ error: 'Job not found' });
+    res.json(job);
+});
 
-        // Send Final Result
-        sendEvent({ status: 'Concluído!', result });
-        res.end();
+app.get('/api/jobs/:id/events', (req, res): any => {
+    const job = getJob(req.params.id);
+    if (!job) return res.status(404).json({ error: 'Job not found' });
+    streamJobEvents(job, req, res);
+});
 
-    } catch (error: any) {
-        console.error('Error processing video:', error);
-        sendEvent({ error: error.message || 'Internal server error' });
-        res.end();
+// Legacy streaming endpoint: starts a job and streams it on the same connection.
+// If the connection drops, the job can be resumed via /api/jobs/:id/events; it is cancelled if nobody
+// reconnects within JOB_ABANDON_GRACE_SECONDS, unless the request set `keepRunning`.
+app.post('/api/process-video/stream', async (req, res): Promise<any> => {
+    if (!req.body.url) {
+        res.setHeader('Content-Type', 'text/event-stream');
+        res.write(`event: error\ndata: ${JSON.stringify({ type: 'error', error: 'URL is required' })}\n\n`);
+        return res.end();
     }
+
+    const job = createJob((job) => runVideoJob(job, req.body), { keepRunning: req.body.keepRunning === true });
+    streamJobEvents(job, req, res);
 });
 
+// Aborts when the client goes away before the response is sent, so a plain request stops its job too
+const cancelOnDisconnect = (res: express.Response) => {
+    const controller = new AbortController();
+    res.on('close', () => {
+        if (!res.writableFinished) controller.abort(new CancelledError());
+    });
+    return controller.signal;
+};
+
 app.post('/api/process-video', async (req, res): Promise<any> => {
+    const signal = cancelOnDisconnect(res);
     try {
         const { url, provider, apiKey } = req.body;
         if (!url) {
@@ -225,83 +525,115 @@ app.post('/api/process-video', async (req, res): Promise<any> => {
 
         console.log(`Processing URL: ${url}`);
 
-        // 1. Extract Audio
-        let audioPath = '';
-        if (process.env.NODE_ENV === 'test' && (url === 'https://www.youtube.com/watch?v=TEST' || url.includes('TEST_VIDEO_ID'))) {
-            console.log('Test URL detected: Skipping extractAudio');
-            audioPath = path.join(DOWNLOAD_DIR, 'test_mock_audio.mp3');
-        } else {
-            audioPath = await extractAudio(url, DOWNLOAD_DIR);
-        }
-        console.log(`Audio extracted to: ${audioPath}`);
-
-        // 2. Transcribe & Summarize (with Provider selection)
-        // We pass the raw apiKey from request here, the helper resolves it from DB if needed
-        const result = await processAudio(audioPath, { provider, apiKey, originalUrl: url, userId: req.body.userId });
-        console.log('Transcription complete');
+        const { result, source } = await getVideoResult(url, { provider, apiKey, userId: req.body.userId, signal });
 
         // 3. Save to Supabase
         if (result && result.summary) {
-            const usageData = {
-                provider: provider || 'gemini',
-                model: provider === 'openai' ? 'gpt-5-mini' : 'gemini-2.5-flash',
-                serviceType: 'transcription_and_summary',
-                inputTokens: result.usage?.promptTokenCount || 0,
-                outputTokens: result.usage?.candidatesTokenCount || 0,
-                audioDuration: result.duration || 0
-            };
-
             // If userId is present, save to DB
             if (req.body.userId) {
-                await saveProcessingResult(
-                    req.body.userId,
-                    url,
-                    result.transcription,
-                    result.summary,
-                    result.key_topics || [],
-                    usageData
-                );
-                console.log('Saved to Supabase');
+                await saveResultForUser(req.body.userId, url, provider, result, source);
+                console.log('Queued result for Supabase');
             } else {
                 console.warn('No userId provided, skipping DB save');
             }
         }
 
-        // Cleanup audio file
-        if (fs.existsSync(audioPath)) fs.unlinkSync(audioPath);
-
+        res.setHeader('X-Cache', source === 'cache' ? 'HIT' : 'MISS');
         return res.json(result);
     } catch (error: any) {
         console.error('Error processing video:', error);
-        return res.status(500).json({ error: error.message || 'Internal server error' });
+        const status = error instanceof AdmissionError ? 422 : error instanceof QueueFullError ? 503 : 500;
+        return res.status(status).json({ error: error.message || 'Internal server error' });
     }
 });
 
-app.post('/api/process-file', upload.single('audio'), async (req, res): Promise<any> => {
-    try {
-        if (!req.file) {
-            return res.status(400).json({ error: 'No file uploaded' });
+// Uploaded audio is content-addressed: identical bytes (under any filename) + provider reuse one result,
+// from the result cache or, after a restart, from the hash stored with the saved rows
+const getUploadResult = async (upload: ReceivedUpload, options: any): Promise<{ result: any, source: ResultSource }> => {
+    const provider = options.provider || 'gemini';
+    const cacheKey = `sha256:${upload.sha256}:${provider}`;
+
+    const cached = await resultCache.get(cacheKey) || await findResultByContentHash(upload.sha256, provider);
+    if (cached) {
+        console.log(`Upload result cache hit: ${cacheKey}`);
+        await resultCache.set(cacheKey, cached);
+        return { result: cached, source: 'cache' };
+    }
+
+    // Resolved before joining, like video jobs
+    const apiKey = await resolveApiKey(options.provider, options.apiKey, options.userId);
+
+    // The job is shared with other requests for the same bytes, so it reads its own link to the file:
+    // the request that started it removes its upload when it ends (or disconnects), the job when it settles
+    const { promise, shared } = videoJobs.run(cacheKey, async (progress, jobSignal) => {
+        const ext = path.extname(upload.path);
+        // Same extension: the providers pick the audio format from it
+        const jobPath = path.join(path.dirname(upload.path), `${path.basename(upload.path, ext)}.job${ext}`);
+        await fs.promises.link(upload.path, jobPath).catch(() => fs.promises.copyFile(upload.path, jobPath));
+        try {
+            const result = await processAudio(jobPath, { ...options, apiKey, normalized: upload.normalized, signal: jobSignal }, progress);
+            // Keyed by the provider that answered, like video results
+            if (result && result.summary) await resultCache.set(`sha256:${upload.sha256}:${result.provider || provider}`, result);
+            return result;
+        } finally {
+            removeFiles([jobPath]);
         }
+    }, undefined, options.signal);
+    return { result: await promise, source: shared ? 'shared' : 'processed' };
+};
+
+app.post('/api/process-file', async (req, res): Promise<any> => {
+    const signal = cancelOnDisconnect(res);
+    let upload: ReceivedUpload | null = null;
+    try {
+        upload = await receiveAudioUpload(req, UPLOAD_DIR);
 
-        console.log(`Processing File: ${req.file.path}`);
-        const { provider, apiKey } = req.body;
+        console.log(`Processing File: ${upload.path} (${upload.receivedBytes} bytes received, sha256 ${upload.sha256})`);
+        const { provider, apiKey, userId } = upload.fields;
 
         // Process with selected provider
-        const result = await processAudio(req.file.path, { provider, apiKey, userId: req.body.userId });
+        const { result, source } = await getUploadResult(upload, { provider, apiKey, userId, signal });
 
-        // Cleanup
-        if (fs.existsSync(req.file.path)) fs.unlinkSync(req.file.path);
+        if (result && result.summary && userId) {
+            await saveResultForUser(userId, `file:${upload.filename}`, provider, result, source, upload.sha256);
+        }
 
+        res.setHeader('X-Cache', source === 'cache' ? 'HIT' : 'MISS');
         return res.json(result);
     } catch (error: any) {
         console.error('Error processing file:', error);
-        if (req.file && fs.existsSync(req.file.path)) {
-            fs.unlinkSync(req.file.path);
-        }
-        return res.status(500).json({ error: error.message || 'Server error' });
+        const status = error instanceof UploadLimitError ? 413
+            : error instanceof InvalidUploadError ? 400
+            : error instanceof QueueFullError ? 503 : 500;
+        return res.status(status).json({ error: error.message || 'Server error' });
+    } finally {
+        // Only this request's own upload: a job started from it works on its own link
+        if (upload) removeFiles([upload.path]);
     }
 });
 
+app.get('/api/metrics', (req, res) => {
+    res.json({
+        resultCache: resultCache.stats(),
+        audioCache: audioArtifacts.stats(),
+        inFlight: videoJobs.stats(),
+        queues: [metadataQueue.stats(), extractQueue.stats(), longExtractQueue.stats(), aiQueue.stats()],
+        preflight: getPreflightStats(),
+        hedging: getHedgingStats(),
+        jobs: getJobStats(),
+        resultWriter: resultWriter.stats(),
+        geminiUploads: getGeminiUploadStats(),
+        audioExtraction: getExtractionStats(),
+        ytdlpWorker: getWorkerStats(),
+        downloads: getDownloadStats(),
+        audioNormalization: getNormalizationStats(),
+        apiKeyCache: getApiKeyCacheStats(),
+        auth: getAuthStats(),
+        clients: getClientPoolStats(),
+        connections: getConnectionStats(),
+    });
+});
+
 // Serve static files from the public directory (client build)
 app.use(express.static(path.join(__dirname, '../public')));
 
@@ -0,0 +1,21 @@
+// Work for a job nobody is waiting on anymore is cancelled through an AbortSignal, threaded from the job
+// down to child processes (yt-dlp, ffmpeg) and provider requests. This is the reason it aborts with.
+export class CancelledError extends Error {
+    constructor() {
+        super('Processamento cancelado: o cliente desconectou.');
+        this.name = 'CancelledError';
+    }
+}
+
+// Settles like `promise`, but rejects as soon as `signal` aborts. The underlying work is not stopped,
+// so this is for waiting on something shared (a queue slot, another caller's task).
+export const abortable = <T>(promise: Promise<T>, signal?: AbortSignal): Promise<T> => {
+    if (!signal) return promise;
+    if (signal.aborted) return Promise.reject(signal.reason);
+
+    return new Promise<T>((resolve, reject) => {
+        const onAbort = () => reject(signal.reason);
+        signal.addEventListener('abort', onAbort, { once: true });
+        promise.then(resolve, reject).finally(() => signal.removeEventListener('abort', onAbort));
+    });
+};
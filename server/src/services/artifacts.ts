@@ -0,0 +1,212 @@
+import fs from 'fs';
+import path from 'path';
+import crypto from 'crypto';
+import { abortable } from './abort';
+
+const fsPromises = fs.promises;
+
+export interface ArtifactCacheOptions {
+    name: string;
+    dir: string;
+    maxBytes: number;
+}
+
+interface ArtifactEntry<M> {
+    id: string;
+    key: string;
+    path: string;
+    bytes: number;
+    meta: M;
+    lastUsed: number;
+    refs: number;
+}
+
+export interface ArtifactHandle<M> {
+    path: string;
+    meta: M;
+    // False for the caller that created the artifact
+    cached: boolean;
+    // Must be called once the file is no longer read; until then it can't be evicted
+    release: () => void;
+}
+
+// Moves a finished file into the cache directory (copy + delete across filesystems)
+const moveFile = async (source: string, target: string) => {
+    try {
+        await fsPromises.rename(source, target);
+    } catch (e: any) {
+        if (e.code !== 'EXDEV') throw e;
+        await fsPromises.copyFile(source, target);
+        await fsPromises.unlink(source);
+    }
+};
+
+// Disk cache for large files (prepared audio), bounded by total bytes. Least recently used entries are
+// evicted first, but never while a job holds a reference. Entries (file + JSON sidecar with key and
+// metadata) survive restarts; file mtimes keep the LRU order across them.
+export class ArtifactCache<M> {
+    private entries = new Map<string, ArtifactEntry<M>>();
+    private pending = new Map<string, { promise: Promise<ArtifactEntry<M>>, controller: AbortController }>();
+    // Callers waiting on a pending creation; the new entry can't be evicted before they take their reference.
+    // When all of them have aborted, so is the creation.
+    private waiting = new Map<string, number>();
+    private totalBytes = 0;
+    private ready: Promise<void>;
+    private counters = { hits: 0, misses: 0, shared: 0, evictions: 0, evictedBytes: 0 };
+
+    constructor(private options: ArtifactCacheOptions) {
+        this.ready = this.load().catch((e) => console.error(`Artifact cache (${options.name}) failed to load:`, e.message));
+    }
+
+    private idFor(key: string) {
+        return crypto.createHash('sha256').update(key).digest('hex').slice(0, 32);
+    }
+
+    private async load() {
+        await fsPromises.mkdir(this.options.dir, { recursive: true });
+        const names = await fsPromises.readdir(this.options.dir);
+        const referenced = new Set<string>();
+
+        for (const name of names.filter((file) => file.endsWith('.json'))) {
+            try {
+                const sidecar = JSON.parse(await fsPromises.readFile(path.join(this.options.dir, name), 'utf8'));
+                const filePath = path.join(this.options.dir, sidecar.file);
+                const stat = await fsPromises.stat(filePath);
+                const id = path.basename(name, '.json');
+                this.entries.set(id, { id, key: sidecar.key, path: filePath, bytes: stat.size, meta: sidecar.meta, lastUsed: stat.mtimeMs, refs: 0 });
+                this.totalBytes += stat.size;
+                referenced.add(name).add(sidecar.file);
+            } catch {
+                // Torn sidecar or missing file: dropped below
+            }
+        }
+
+        // Leftovers from crashes (files without a sidecar and vice versa)
+        for (const name of names) {
+            if (!referenced.has(name)) await fsPromises.unlink(path.join(this.options.dir, name)).catch(() => undefined);
+        }
+        this.evict();
+    }
+
+    // Returns the artifact for `key`, calling `create` (once, however many callers ask concurrently)
+    // when it isn't cached. `create` returns a file that the cache then takes ownership of; its signal
+    // aborts once every caller waiting for it has aborted its own `signal`.
+    async acquire(key: string, create: (signal: AbortSignal) => Promise<{ path: string, meta: M }>, signal?: AbortSignal): Promise<ArtifactHandle<M>> {
+        await abortable(this.ready, signal);
+        const id = this.idFor(key);
+
+        let entry = this.entries.get(id);
+        if (entry && !fs.existsSync(entry.path)) {
+            this.remove(entry);
+            entry = undefined;
+        }
+
+        let cached = true;
+        if (entry) {
+            this.counters.hits++;
+        } else {
+            let creation = this.pending.get(id);
+            if (creation) {
+                this.counters.shared++;
+            } else {
+                this.counters.misses++;
+                cached = false;
+                const controller = new AbortController();
+                const promise = this.store(id, key, () => create(controller.signal)).finally(() => {
+                    if (this.pending.get(id) === pending) this.pending.delete(id);
+                });
+                const pending = { promise, controller };
+                creation = pending;
+                this.pending.set(id, pending);
+            }
+
+            this.waiting.set(id, (this.waiting.get(id) || 0) + 1);
+            try {
+                entry = await abortable(creation.promise, signal);
+            } finally {
+                const count = (this.waiting.get(id) || 1) - 1;
+                if (count > 0) {
+                    this.waiting.set(id, count);
+                } else {
+                    this.waiting.delete(id);
+                    if (signal && signal.aborted && this.pending.get(id) === creation) {
+                        this.pending.delete(id);
+                        creation.controller.abort(signal.reason);
+                    }
+                }
+            }
+        }
+
+        const held = entry;
+        held.refs++;
+        held.lastUsed = Date.now();
+        const now = new Date();
+        fsPromises.utimes(held.path, now, now).catch(() => undefined);
+
+        let released = false;
+        return {
+            path: held.path,
+            meta: held.meta,
+            cached,
+            release: () => {
+                if (released) return;
+                released = true;
+                held.refs--;
+                this.evict();
+            },
+        };
+    }
+
+    private async store(id: string, key: string, create: () => Promise<{ path: string, meta: M }>) {
+        const { path: sourcePath, meta } = await create();
+        const file = `${id}${path.extname(sourcePath)}`;
+        const target = path.join(this.options.dir, file);
+        await moveFile(sourcePath, target);
+        await fsPromises.writeFile(path.join(this.options.dir, `${id}.json`), JSON.stringify({ key, file, meta }));
+
+        const entry: ArtifactEntry<M> = { id, key, path: target, bytes: (await fsPromises.stat(target)).size, meta, lastUsed: Date.now(), refs: 0 };
+        this.entries.set(id, entry);
+        this.totalBytes += entry.bytes;
+        this.evict();
+        return entry;
+    }
+
+    private remove(entry: ArtifactEntry<M>) {
+        this.entries.delete(entry.id);
+        this.totalBytes -= entry.bytes;
+        fsPromises.unlink(entry.path).catch(() => undefined);
+        fsPromises.unlink(path.join(this.options.dir, `${entry.id}.json`)).catch(() => undefined);
+    }
+
+    // Over budget: drop unreferenced entries, oldest use first. Entries in use may keep the cache
+    // over its budget until they are released.
+    private evict() {
+        if (this.totalBytes <= this.options.maxBytes) return;
+
+        const candidates = Array.from(this.entries.values())
+            .filter((entry) => entry.refs === 0 && !this.waiting.has(entry.id))
+            .sort((a, b) => a.lastUsed - b.lastUsed);
+        for (const entry of candidates) {
+            if (this.totalBytes <= this.options.maxBytes) break;
+            this.remove(entry);
+            this.counters.evictions++;
+            this.counters.evictedBytes += entry.bytes;
+        }
+    }
+
+    stats() {
+        const lookups = this.counters.hits + this.counters.misses + this.counters.shared;
+        let inUse = 0;
+        for (const entry of this.entries.values()) if (entry.refs > 0) inUse++;
+
+        return {
+            name: this.options.name,
+            entries: this.entries.size,
+            bytes: this.totalBytes,
+            maxBytes: this.options.maxBytes,
+            inUse,
+            ...this.counters,
+            hitRate: lookups ? (this.counters.hits + this.counters.shared) / lookups : 0,
+        };
+    }
+}
@@ -0,0 +1,302 @@
+import { spawn } from 'child_process';
+import path from 'path';
+import fs from 'fs';
+import { mapWithConcurrency } from './scheduler';
+
+// Keep only the tail of ffmpeg's stderr for error messages
+const MAX_STDERR_CHARS = 8000;
+
+export interface AudioChunk {
+    path: string;
+    index: number;
+    start: number;
+    end: number;
+}
+
+export interface SilenceInterval {
+    start: number;
+    end: number;
+}
+
+export interface AudioProfile {
+    ext: string;
+    // ffmpeg output options (channels, sample rate, codec, bitrate)
+    args: string[];
+}
+
+// Speech models work at 16 kHz mono, so everything above that is wasted upload and audio tokens.
+// `original` disables normalization.
+export const AUDIO_PROFILES: Record<string, AudioProfile | null> = {
+    original: null,
+    speech: { ext: '.ogg', args: ['-ac', '1', '-ar', '16000', '-c:a', 'libopus', '-b:a', '24k', '-application', 'voip'] },
+    compact: { ext: '.ogg', args: ['-ac', '1', '-ar', '16000', '-c:a', 'libopus', '-b:a', '16k', '-application', 'voip'] },
+    // For providers or tools that only take mp3
+    mp3: { ext: '.mp3', args: ['-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', '32k'] },
+};
+
+const AUDIO_PROFILE = process.env.AUDIO_PROFILE || 'speech';
+
+const MIME_TYPES: Record<string, string> = {
+    '.mp3': 'audio/mp3',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg',
+    '.wav': 'audio/wav',
+    '.flac': 'audio/flac',
+    '.m4a': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.webm': 'audio/webm',
+};
+
+export const getAudioMimeType = (audioPath: string) => MIME_TYPES[path.extname(audioPath).toLowerCase()] || 'audio/mp3';
+
+export const getAudioProfile = (name: string = AUDIO_PROFILE): AudioProfile | null => {
+    if (!(name in AUDIO_PROFILES)) throw new Error(`Unknown audio profile: ${name}`);
+    return AUDIO_PROFILES[name];
+};
+
+export interface NormalizedAudio {
+    path: string;
+    profile: string;
+    originalBytes: number;
+    normalizedBytes: number;
+    savedBytes: number;
+}
+
+export interface SpeechSegment {
+    trimmedStart: number;
+    originalStart: number;
+    duration: number;
+}
+
+export interface SpeechMap {
+    originalSeconds: number;
+    speechSeconds: number;
+    speechRatio: number;
+    segments: SpeechSegment[];
+}
+
+// Voice-activity trimming (sidecar/vad.py) is opt-in; it needs python3 with numpy
+export const isVadEnabled = () => process.env.VAD_ENABLED === 'true';
+
+// Identifies how prepared audio was produced (profile + silence trimming), for caching it
+export const getAudioVariant = () => isVadEnabled() ? `${AUDIO_PROFILE}+vad` : AUDIO_PROFILE;
+const VAD_PYTHON = process.env.VAD_PYTHON || 'python3';
+const VAD_SCRIPT = path.join(__dirname, '../../sidecar/vad.py');
+
+const normalizationCounters = { jobs: 0, originalBytes: 0, normalizedBytes: 0 };
+const vadCounters = { jobs: 0, originalSeconds: 0, speechSeconds: 0 };
+
+export const getNormalizationStats = () => ({
+    ...normalizationCounters,
+    savedBytes: normalizationCounters.originalBytes - normalizationCounters.normalizedBytes,
+    vad: { ...vadCounters, trimmedSeconds: vadCounters.originalSeconds - vadCounters.speechSeconds },
+});
+
+// `signal` kills the process; the promise then rejects with the abort reason
+const runProcess = (binary: string, args: string[], signal?: AbortSignal): Promise<{ stdout: string, stderr: string }> => {
+    return new Promise((resolve, reject) => {
+        const child = spawn(binary, args, { shell: false, signal });
+        let stdout = '';
+        let stderr = '';
+
+        child.stdout.on('data', (data) => {
+            stdout += data.toString();
+        });
+        child.stderr.on('data', (data) => {
+            stderr = (stderr + data.toString()).slice(-MAX_STDERR_CHARS);
+        });
+
+        child.on('close', (code) => {
+            if (code === 0) {
+                resolve({ stdout, stderr });
+            } else {
+                reject(signal && signal.aborted ? signal.reason : new Error(`${binary} exited with code ${code}: ${stderr}`));
+            }
+        });
+        child.on('error', (e) => reject(signal && signal.aborted ? signal.reason : e));
+    });
+};
+
+export const runFfmpeg = (args: string[], signal?: AbortSignal) => runProcess('ffmpeg', ['-hide_banner', '-nostdin', '-y', ...args], signal);
+
+export const getAudioDuration = async (audioPath: string, signal?: AbortSignal): Promise<number> => {
+    const { stdout } = await runProcess('ffprobe', [
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        audioPath,
+    ], signal);
+    const duration = parseFloat(stdout.trim());
+    if (!Number.isFinite(duration)) throw new Error(`Could not read duration of ${audioPath}`);
+    return duration;
+};
+
+// Runs ffmpeg's silencedetect filter and parses the reported intervals
+export const detectSilences = async (audioPath: string, noiseDb: number = -35, minSilenceSeconds: number = 0.4, signal?: AbortSignal): Promise<SilenceInterval[]> => {
+    const { stderr } = await runProcess('ffmpeg', [
+        '-hide_banner', '-nostdin',
+        '-i', audioPath,
+        '-af', `silencedetect=noise=${noiseDb}dB:d=${minSilenceSeconds}`,
+        '-f', 'null', '-',
+    ], signal).catch((e) => {
+        if (signal && signal.aborted) throw e;
+        console.error('Silence detection failed, cutting at fixed offsets:', e.message);
+        return { stdout: '', stderr: '' };
+    });
+
+    const silences: SilenceInterval[] = [];
+    let pendingStart: number | null = null;
+    for (const line of stderr.split('\n')) {
+        const startMatch = line.match(/silence_start:\s*(-?\d+\.?\d*)/);
+        if (startMatch) pendingStart = Math.max(0, parseFloat(startMatch[1]));
+
+        const endMatch = line.match(/silence_end:\s*(\d+\.?\d*)/);
+        if (endMatch && pendingStart !== null) {
+            silences.push({ start: pendingStart, end: parseFloat(endMatch[1]) });
+            pendingStart = null;
+        }
+    }
+    return silences;
+};
+
+// Picks cut points roughly every `chunkSeconds`, snapped to the middle of the nearest silence
+// within a window around each target so words are not split.
+export const planCutPoints = (duration: number, silences: SilenceInterval[], chunkSeconds: number): number[] => {
+    const window = chunkSeconds * 0.15;
+    const cuts: number[] = [];
+    let last = 0;
+
+    while (duration - last > chunkSeconds * 1.2) {
+        const target = last + chunkSeconds;
+        let best = target;
+        let bestDistance = Infinity;
+
+        for (const silence of silences) {
+            const middle = (silence.start + silence.end) / 2;
+            const distance = Math.abs(middle - target);
+            if (distance <= window && distance < bestDistance && middle > last) {
+                best = middle;
+                bestDistance = distance;
+            }
+        }
+
+        cuts.push(best);
+        last = best;
+    }
+    return cuts;
+};
+
+// Splits audio into chunks of about `chunkSeconds`, cut at silences, each starting
+// `overlapSeconds` before the previous cut so boundary words appear in both chunks.
+export const splitAudio = async (audioPath: string, outputDir: string, chunkSeconds: number, overlapSeconds: number, signal?: AbortSignal): Promise<AudioChunk[]> => {
+    const duration = await getAudioDuration(audioPath, signal);
+    const silences = await detectSilences(audioPath, undefined, undefined, signal);
+    const cuts = planCutPoints(duration, silences, chunkSeconds);
+    const boundaries = [0, ...cuts, duration];
+
+    const ext = path.extname(audioPath) || '.mp3';
+    const base = path.join(outputDir, `${path.basename(audioPath, ext)}_chunk`);
+
+    const chunks: AudioChunk[] = [];
+    for (let i = 0; i < boundaries.length - 1; i++) {
+        const start = Math.max(0, boundaries[i] - (i > 0 ? overlapSeconds : 0));
+        const end = boundaries[i + 1];
+        chunks.push({ path: `${base}${i}${ext}`, index: i, start, end });
+    }
+
+    // Stream copy: cutting is I/O bound, no re-encode needed
+    await mapWithConcurrency(chunks, 4, (chunk, _index, chunkSignal) => runFfmpeg([
+        '-ss', chunk.start.toFixed(3),
+        '-i', audioPath,
+        '-t', (chunk.end - chunk.start).toFixed(3),
+        '-vn', '-c', 'copy',
+        chunk.path,
+    ], chunkSignal), signal);
+
+    return chunks;
+};
+
+// Re-encodes audio with the given profile into `outputDir`. The input is left untouched; if the profile
+// is disabled or wouldn't shrink the file, the input path is returned as-is.
+export const normalizeAudio = async (audioPath: string, outputDir: string, profileName: string = AUDIO_PROFILE, signal?: AbortSignal): Promise<NormalizedAudio> => {
+    const profile = getAudioProfile(profileName);
+    const originalBytes = (await fs.promises.stat(audioPath)).size;
+    const unchanged = { path: audioPath, profile: profileName, originalBytes, normalizedBytes: originalBytes, savedBytes: 0 };
+    if (!profile) return unchanged;
+
+    const ext = path.extname(audioPath);
+    const outputPath = path.join(outputDir, `${path.basename(audioPath, ext)}_${profileName}${profile.ext}`);
+    try {
+        await runFfmpeg(['-i', audioPath, '-vn', '-map_metadata', '-1', ...profile.args, outputPath], signal);
+    } catch (e) {
+        removeFiles([outputPath]);
+        throw e;
+    }
+
+    const normalizedBytes = (await fs.promises.stat(outputPath)).size;
+    if (normalizedBytes >= originalBytes) {
+        removeFiles([outputPath]);
+        return unchanged;
+    }
+
+    normalizationCounters.jobs++;
+    normalizationCounters.originalBytes += originalBytes;
+    normalizationCounters.normalizedBytes += normalizedBytes;
+
+    return { path: outputPath, profile: profileName, originalBytes, normalizedBytes, savedBytes: originalBytes - normalizedBytes };
+};
+
+// Removes non-speech (silence, long pauses) with the VAD sidecar and encodes the rest with the normalization
+// profile, in one pass. The returned speech map (which spans of the original were kept) is informational:
+// it is reported with the result, but transcripts carry no timestamps to translate back.
+export const trimSilence = async (audioPath: string, outputDir: string, profileName: string = AUDIO_PROFILE, signal?: AbortSignal): Promise<NormalizedAudio & { speech: SpeechMap }> => {
+    const profile = getAudioProfile(profileName) || { ext: '.mp3', args: ['-c:a', 'libmp3lame', '-b:a', '64k'] };
+    const ext = path.extname(audioPath);
+    const outputPath = path.join(outputDir, `${path.basename(audioPath, ext)}_speech${profile.ext}`);
+
+    const args = [VAD_SCRIPT, audioPath, outputPath];
+    if (process.env.VAD_MIN_SILENCE_SECONDS) args.push('--min-silence', process.env.VAD_MIN_SILENCE_SECONDS);
+    let report: any;
+    try {
+        const { stdout } = await runProcess(VAD_PYTHON, [...args, '--', ...profile.args], signal);
+        report = JSON.parse(stdout);
+        if (!report.output) throw new Error('No speech detected');
+    } catch (e) {
+        removeFiles([outputPath]);
+        throw e;
+    }
+
+    const originalBytes = (await fs.promises.stat(audioPath)).size;
+    const normalizedBytes = (await fs.promises.stat(outputPath)).size;
+
+    vadCounters.jobs++;
+    vadCounters.originalSeconds += report.original_seconds;
+    vadCounters.speechSeconds += report.speech_seconds;
+    normalizationCounters.jobs++;
+    normalizationCounters.originalBytes += originalBytes;
+    normalizationCounters.normalizedBytes += normalizedBytes;
+
+    return {
+        path: outputPath,
+        profile: profileName,
+        originalBytes,
+        normalizedBytes,
+        savedBytes: originalBytes - normalizedBytes,
+        speech: {
+            originalSeconds: report.original_seconds,
+            speechSeconds: report.speech_seconds,
+            speechRatio: report.speech_ratio,
+            segments: report.segments.map((segment: any) => ({
+                trimmedStart: segment.trimmed_start,
+                originalStart: segment.original_start,
+                duration: segment.duration,
+            })),
+        },
+    };
+};
+
+export const removeFiles = (paths: string[]) => {
+    for (const file of paths) {
+        if (fs.existsSync(file)) fs.unlinkSync(file);
+    }
+};
@@ -0,0 +1,159 @@
+import crypto from 'crypto';
+import { LruCache } from './cache';
+import { supabase } from './supabase';
+
+// Legacy Supabase projects sign access tokens with HS256 and the project's JWT secret;
+// projects on asymmetric signing keys publish them as JWKS.
+const JWT_SECRET = process.env.SUPABASE_JWT_SECRET;
+const JWKS_URL = process.env.SUPABASE_JWKS_URL || (process.env.SUPABASE_URL ? `${process.env.SUPABASE_URL}/auth/v1/.well-known/jwks.json` : '');
+const JWKS_TTL_MS = (Number(process.env.JWKS_CACHE_MINUTES) || 10) * 60 * 1000;
+// Unknown `kid`s trigger a refetch (key rotation), at most this often
+const JWKS_REFRESH_MIN_MS = 30 * 1000;
+const JWT_AUDIENCE = process.env.SUPABASE_JWT_AUDIENCE || 'authenticated';
+// Supabase Auth issues tokens as `${SUPABASE_URL}/auth/v1`; not checked when neither is set
+const JWT_ISSUER = process.env.SUPABASE_JWT_ISSUER || (process.env.SUPABASE_URL ? `${process.env.SUPABASE_URL.replace(/\/+$/, '')}/auth/v1` : '');
+const CLOCK_SKEW_SECONDS = 30;
+// Verified tokens are remembered until they expire, but never longer than this
+const SESSION_CACHE_MAX_MS = 5 * 60 * 1000;
+
+interface JwtHeader {
+    alg: string;
+    kid?: string;
+}
+
+interface JwtPayload {
+    sub?: string;
+    exp?: number;
+    nbf?: number;
+    aud?: string | string[];
+    iss?: string;
+}
+
+// Raised when a token is definitely invalid (bad signature, expired); the remote check is not tried
+export class InvalidTokenError extends Error { }
+
+const sessions = new LruCache<string>(Number(process.env.AUTH_SESSION_CACHE_MAX_ENTRIES) || 10000, SESSION_CACHE_MAX_MS);
+const authCounters = { cached: 0, local: 0, remote: 0, rejected: 0 };
+
+export const getAuthStats = () => ({ ...authCounters, cachedSessions: sessions.size });
+
+let jwks: { keys: Map<string, crypto.KeyObject>, fetchedAt: number } | null = null;
+let jwksRequest: Promise<void> | null = null;
+
+const loadJwks = async () => {
+    if (!JWKS_URL) return;
+    if (!jwksRequest) {
+        jwksRequest = (async () => {
+            try {
+                const response = await fetch(JWKS_URL);
+                if (!response.ok) throw new Error(`JWKS request failed with ${response.status}`);
+                const body: any = await response.json();
+
+                const keys = new Map<string, crypto.KeyObject>();
+                for (const jwk of body.keys || []) {
+                    if (jwk.kid) keys.set(jwk.kid, crypto.createPublicKey({ key: jwk, format: 'jwk' }));
+                }
+                jwks = { keys, fetchedAt: Date.now() };
+            } catch (e: any) {
+                console.error('Could not load JWKS:', e.message);
+                // Back off like a successful fetch so failures don't hit the endpoint on every request
+                jwks = { keys: jwks ? jwks.keys : new Map(), fetchedAt: Date.now() };
+            } finally {
+                jwksRequest = null;
+            }
+        })();
+    }
+    await jwksRequest;
+};
+
+const getSigningKey = async (kid: string): Promise<crypto.KeyObject | undefined> => {
+    const age = jwks ? Date.now() - jwks.fetchedAt : Infinity;
+    if (age > JWKS_TTL_MS || (!jwks!.keys.has(kid) && age > JWKS_REFRESH_MIN_MS)) {
+        await loadJwks();
+    }
+    return jwks ? jwks.keys.get(kid) : undefined;
+};
+
+const decodeSegment = (segment: string) => JSON.parse(Buffer.from(segment, 'base64url').toString('utf8'));
+
+// Returns the verified payload, or null when this token can't be checked locally
+const verifyLocally = async (token: string): Promise<JwtPayload | null> => {
+    const parts = token.split('.');
+    if (parts.length !== 3) throw new InvalidTokenError('Malformed token');
+
+    let header: JwtHeader;
+    let payload: JwtPayload;
+    try {
+        header = decodeSegment(parts[0]);
+        payload = decodeSegment(parts[1]);
+    } catch {
+        throw new InvalidTokenError('Malformed token');
+    }
+
+    const signingInput = Buffer.from(`${parts[0]}.${parts[1]}`);
+    const signature = Buffer.from(parts[2], 'base64url');
+    let valid: boolean;
+
+    if (header.alg === 'HS256') {
+        if (!JWT_SECRET) return null;
+        const expected = crypto.createHmac('sha256', JWT_SECRET).update(signingInput).digest();
+        valid = expected.length === signature.length && crypto.timingSafeEqual(expected, signature);
+    } else if (header.alg === 'ES256' || header.alg === 'RS256') {
+        const key = header.kid ? await getSigningKey(header.kid) : undefined;
+        if (!key) return null;
+        valid = crypto.verify('sha256', signingInput, header.alg === 'ES256' ? { key, dsaEncoding: 'ieee-p1363' } : key, signature);
+    } else {
+        return null;
+    }
+
+    if (!valid) throw new InvalidTokenError('Invalid token signature');
+
+    const now = Date.now() / 1000;
+    if (!payload.exp || payload.exp + CLOCK_SKEW_SECONDS < now) throw new InvalidTokenError('Token expired');
+    if (payload.nbf && payload.nbf - CLOCK_SKEW_SECONDS > now) throw new InvalidTokenError('Token not yet valid');
+    const audiences = Array.isArray(payload.aud) ? payload.aud : [payload.aud];
+    if (!audiences.includes(JWT_AUDIENCE)) throw new InvalidTokenError('Invalid token audience');
+    if (JWT_ISSUER && payload.iss !== JWT_ISSUER) throw new InvalidTokenError('Invalid token issuer');
+    if (!payload.sub) throw new InvalidTokenError('Token has no subject');
+
+    return payload;
+};
+
+// Resolves an access token to its user id: recently verified tokens come from memory, signatures are
+// checked locally when the secret/JWKS allows it, and the auth server is only asked as a fallback.
+export const verifyAccessToken = async (token: string): Promise<string> => {
+    const tokenHash = crypto.createHash('sha256').update(token).digest('hex');
+    const cached = sessions.get(tokenHash);
+    if (cached) {
+        authCounters.cached++;
+        return cached;
+    }
+
+    let userId: string;
+    let expiresAt: number | undefined;
+    try {
+        const payload = await verifyLocally(token);
+        if (payload) {
+            authCounters.local++;
+            userId = payload.sub!;
+            expiresAt = payload.exp! * 1000;
+        } else {
+            const { data: { user }, error } = await supabase.auth.getUser(token);
+            if (error || !user) throw new InvalidTokenError('Invalid token');
+            authCounters.remote++;
+            userId = user.id;
+            try {
+                expiresAt = decodeSegment(token.split('.')[1]).exp * 1000;
+            } catch {
+                expiresAt = undefined;
+            }
+        }
+    } catch (e) {
+        if (e instanceof InvalidTokenError) authCounters.rejected++;
+        throw e;
+    }
+
+    const ttl = Math.min(SESSION_CACHE_MAX_MS, (expiresAt || 0) - Date.now());
+    if (ttl > 0) sessions.set(tokenHash, userId, ttl);
+    return userId;
+};
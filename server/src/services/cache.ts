@@ -0,0 +1,182 @@
+import fs from 'fs';
+import path from 'path';
+import crypto from 'crypto';
+
+const fsPromises = fs.promises;
+
+interface MemoryEntry<V> {
+    value: V;
+    expiresAt: number;
+}
+
+// In-memory LRU with per-entry TTL.
+// Map preserves insertion order, so re-inserting on read keeps the most recently used entry at the end.
+export class LruCache<V> {
+    private entries = new Map<string, MemoryEntry<V>>();
+    public evictions = 0;
+
+    constructor(private maxEntries: number, private ttlMs: number) { }
+
+    get(key: string): V | undefined {
+        const entry = this.entries.get(key);
+        if (!entry) return undefined;
+
+        if (entry.expiresAt <= Date.now()) {
+            this.entries.delete(key);
+            return undefined;
+        }
+
+        this.entries.delete(key);
+        this.entries.set(key, entry);
+        return entry.value;
+    }
+
+    set(key: string, value: V, ttlMs: number = this.ttlMs) {
+        this.entries.delete(key);
+        this.entries.set(key, { value, expiresAt: Date.now() + ttlMs });
+
+        while (this.entries.size > this.maxEntries) {
+            const oldestKey = this.entries.keys().next().value as string;
+            this.entries.delete(oldestKey);
+            this.evictions++;
+        }
+    }
+
+    delete(key: string) {
+        this.entries.delete(key);
+    }
+
+    clear() {
+        this.entries.clear();
+    }
+
+    get size() {
+        return this.entries.size;
+    }
+}
+
+export interface TieredCacheOptions {
+    name: string;
+    maxEntries: number;
+    ttlMs: number;
+    // Directory for the disk tier. Memory-only when omitted.
+    dir?: string;
+}
+
+interface DiskEntry<V> {
+    key: string;
+    expiresAt: number;
+    value: V;
+}
+
+// Two-tier cache: a bounded memory LRU in front of one JSON file per key on disk.
+// The disk tier survives restarts; disk hits are promoted back into memory.
+export class TieredCache<V> {
+    private memory: LruCache<V>;
+    private counters = { hits: 0, memoryHits: 0, diskHits: 0, misses: 0, writes: 0, expired: 0 };
+
+    constructor(private options: TieredCacheOptions) {
+        this.memory = new LruCache<V>(options.maxEntries, options.ttlMs);
+
+        if (options.dir && !fs.existsSync(options.dir)) {
+            fs.mkdirSync(options.dir, { recursive: true });
+        }
+    }
+
+    private filePath(key: string) {
+        const hash = crypto.createHash('sha256').update(key).digest('hex');
+        return path.join(this.options.dir as string, `${hash}.json`);
+    }
+
+    async get(key: string): Promise<V | undefined> {
+        const inMemory = this.memory.get(key);
+        if (inMemory !== undefined) {
+            this.counters.hits++;
+            this.counters.memoryHits++;
+            return inMemory;
+        }
+
+        if (this.options.dir) {
+            const file = this.filePath(key);
+            try {
+                const entry: DiskEntry<V> = JSON.parse(await fsPromises.readFile(file, 'utf-8'));
+                if (entry.key === key) {
+                    const remainingMs = entry.expiresAt - Date.now();
+                    if (remainingMs > 0) {
+                        this.memory.set(key, entry.value, remainingMs);
+                        this.counters.hits++;
+                        this.counters.diskHits++;
+                        return entry.value;
+                    }
+                    this.counters.expired++;
+                    await fsPromises.unlink(file).catch(() => undefined);
+                }
+            } catch (e: any) {
+                if (e.code !== 'ENOENT') {
+                    console.error(`Cache (${this.options.name}) read error:`, e.message);
+                }
+            }
+        }
+
+        this.counters.misses++;
+        return undefined;
+    }
+
+    async set(key: string, value: V, ttlMs: number = this.options.ttlMs) {
+        this.memory.set(key, value, ttlMs);
+        this.counters.writes++;
+
+        if (!this.options.dir) return;
+
+        // Write to a temp file and rename so readers never see a partial entry
+        const file = this.filePath(key);
+        const tmpFile = `${file}.${process.pid}.tmp`;
+        const entry: DiskEntry<V> = { key, expiresAt: Date.now() + ttlMs, value };
+        try {
+            await fsPromises.writeFile(tmpFile, JSON.stringify(entry));
+            await fsPromises.rename(tmpFile, file);
+        } catch (e: any) {
+            console.error(`Cache (${this.options.name}) write error:`, e.message);
+            await fsPromises.unlink(tmpFile).catch(() => undefined);
+        }
+    }
+
+    async delete(key: string) {
+        this.memory.delete(key);
+        if (this.options.dir) {
+            await fsPromises.unlink(this.filePath(key)).catch(() => undefined);
+        }
+    }
+
+    // Removes expired entries from the disk tier
+    async prune() {
+        if (!this.options.dir) return;
+
+        const files = await fsPromises.readdir(this.options.dir).catch(() => [] as string[]);
+        const now = Date.now();
+        for (const name of files) {
+            if (!name.endsWith('.json')) continue;
+            const file = path.join(this.options.dir, name);
+            try {
+                const entry: DiskEntry<V> = JSON.parse(await fsPromises.readFile(file, 'utf-8'));
+                if (entry.expiresAt <= now) {
+                    await fsPromises.unlink(file);
+                    this.counters.expired++;
+                }
+            } catch {
+                await fsPromises.unlink(file).catch(() => undefined);
+            }
+        }
+    }
+
+    stats() {
+        const lookups = this.counters.hits + this.counters.misses;
+        return {
+            name: this.options.name,
+            ...this.counters,
+            evictions: this.memory.evictions,
+            memoryEntries: this.memory.size,
+            hitRate: lookups ? this.counters.hits / lookups : 0,
+        };
+    }
+}
@@ -0,0 +1,75 @@
+import crypto from 'crypto';
+import OpenAI from 'openai';
+import { GoogleGenerativeAI, GenerativeModel, ModelParams } from '@google/generative-ai';
+import { GoogleAIFileManager } from '@google/generative-ai/server';
+import { LruCache } from './cache';
+
+const CLIENT_POOL_MAX = Number(process.env.CLIENT_POOL_MAX) || 200;
+// Clients unused for this long are dropped
+const CLIENT_IDLE_MS = (Number(process.env.CLIENT_IDLE_MINUTES) || 30) * 60 * 1000;
+
+interface GeminiClients {
+    genAI: GoogleGenerativeAI;
+    fileManager: GoogleAIFileManager;
+    models: Map<string, GenerativeModel>;
+}
+
+// Per-API-key client pool. Reading an entry renews its idle timeout.
+class ClientPool<T> {
+    private cache = new LruCache<T>(CLIENT_POOL_MAX, CLIENT_IDLE_MS);
+    private counters = { hits: 0, misses: 0 };
+
+    constructor(private create: (apiKey: string) => T) { }
+
+    get(apiKey: string): T {
+        // Keys are held hashed so raw secrets don't sit in the map keys
+        const id = crypto.createHash('sha256').update(apiKey).digest('hex');
+        let client = this.cache.get(id);
+        if (client) {
+            this.counters.hits++;
+        } else {
+            this.counters.misses++;
+            client = this.create(apiKey);
+        }
+        this.cache.set(id, client);
+        return client;
+    }
+
+    stats() {
+        const lookups = this.counters.hits + this.counters.misses;
+        return {
+            ...this.counters,
+            hitRate: lookups ? this.counters.hits / lookups : 0,
+            size: this.cache.size,
+            evictions: this.cache.evictions,
+        };
+    }
+}
+
+const openaiClients = new ClientPool((apiKey) => new OpenAI({ apiKey }));
+
+const geminiClients = new ClientPool<GeminiClients>((apiKey) => ({
+    genAI: new GoogleGenerativeAI(apiKey),
+    fileManager: new GoogleAIFileManager(apiKey),
+    models: new Map(),
+}));
+
+export const getOpenAIClient = (apiKey: string) => openaiClients.get(apiKey);
+
+export const getGeminiFileManager = (apiKey: string) => geminiClients.get(apiKey).fileManager;
+
+// Models are cached per key under `name`, which must identify `params` (model + generation config)
+export const getGeminiModel = (apiKey: string, name: string, params: ModelParams): GenerativeModel => {
+    const clients = geminiClients.get(apiKey);
+    let model = clients.models.get(name);
+    if (!model) {
+        model = clients.genAI.getGenerativeModel(params);
+        clients.models.set(name, model);
+    }
+    return model;
+};
+
+export const getClientPoolStats = () => ({
+    openai: openaiClients.stats(),
+    gemini: geminiClients.stats(),
+});
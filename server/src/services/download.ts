@@ -0,0 +1,241 @@
+import fs from 'fs';
+import path from 'path';
+import { mapWithConcurrency } from './scheduler';
+
+const fsPromises = fs.promises;
+
+const FRAGMENT_BYTES = (Number(process.env.DOWNLOAD_FRAGMENT_MB) || 4) * 1024 * 1024;
+const FRAGMENT_CONCURRENCY = Number(process.env.DOWNLOAD_CONCURRENCY) || 4;
+const FRAGMENT_MAX_ATTEMPTS = Number(process.env.DOWNLOAD_MAX_ATTEMPTS) || 5;
+const RETRY_BASE_MS = 500;
+const RETRY_MAX_MS = 15 * 1000;
+
+export interface RangeDownloadOptions {
+    headers?: Record<string, string>;
+    fragmentBytes?: number;
+    concurrency?: number;
+    onProgress?: (downloadedBytes: number, totalBytes: number) => void;
+    // Aborts the transfer; the partial file is kept, so a later attempt resumes it
+    signal?: AbortSignal;
+}
+
+// Persisted next to the partial file, so a later attempt (even after a restart) skips finished fragments
+interface DownloadState {
+    totalBytes: number;
+    fragmentBytes: number;
+    done: number[];
+}
+
+const downloadCounters = { downloads: 0, resumed: 0, resumedBytes: 0, bytes: 0, fragmentRetries: 0, totalMs: 0 };
+
+export const getDownloadStats = () => ({
+    ...downloadCounters,
+    avgBytesPerSecond: downloadCounters.totalMs ? Math.round(downloadCounters.bytes / (downloadCounters.totalMs / 1000)) : 0,
+});
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+class RetryableError extends Error { }
+
+// Size and range support, from a one-byte range request (some CDNs don't answer HEAD)
+const probe = async (url: string, headers: Record<string, string>, signal?: AbortSignal) => {
+    const response = await fetch(url, { headers: { ...headers, Range: 'bytes=0-0' }, signal });
+    await response.body?.cancel();
+    if (response.status === 206) {
+        const match = /\/(\d+)$/.exec(response.headers.get('content-range') || '');
+        if (match) return { totalBytes: Number(match[1]), ranges: true };
+    }
+    if (!response.ok) throw new Error(`Download failed with HTTP ${response.status}`);
+    return { totalBytes: Number(response.headers.get('content-length')) || 0, ranges: false };
+};
+
+const readState = async (statePath: string): Promise<DownloadState | null> => {
+    try {
+        return JSON.parse(await fsPromises.readFile(statePath, 'utf8'));
+    } catch {
+        return null;
+    }
+};
+
+const writeState = async (statePath: string, state: DownloadState) => {
+    const tmpPath = `${statePath}.tmp`;
+    await fsPromises.writeFile(tmpPath, JSON.stringify(state));
+    await fsPromises.rename(tmpPath, statePath);
+};
+
+// Downloads bytes [start, end] into `file` at the same offset, streaming the body to disk
+const fetchFragment = async (url: string, headers: Record<string, string>, file: fs.promises.FileHandle, start: number, end: number, onBytes: (count: number) => void, signal?: AbortSignal) => {
+    let response: Response;
+    try {
+        response = await fetch(url, { headers: { ...headers, Range: `bytes=${start}-${end}` }, signal });
+    } catch (e: any) {
+        if (signal && signal.aborted) throw signal.reason;
+        throw new RetryableError(e.message);
+    }
+    if (response.status !== 206) {
+        await response.body?.cancel();
+        const message = `Fragment ${start}-${end} failed with HTTP ${response.status}`;
+        throw response.status >= 500 || response.status === 429 ? new RetryableError(message) : new Error(message);
+    }
+
+    let position = start;
+    try {
+        for await (const chunk of response.body as any as AsyncIterable<Uint8Array>) {
+            await file.write(chunk, 0, chunk.length, position);
+            position += chunk.length;
+            onBytes(chunk.length);
+        }
+    } catch (e: any) {
+        onBytes(start - position);
+        if (signal && signal.aborted) throw signal.reason;
+        throw new RetryableError(e.message);
+    }
+    if (position !== end + 1) {
+        onBytes(start - position);
+        throw new RetryableError(`Fragment ${start}-${end} ended early at ${position}`);
+    }
+};
+
+// Plain GET for servers without range support: no fragments and nothing to resume
+const downloadWhole = async (url: string, headers: Record<string, string>, outputPath: string, signal?: AbortSignal) => {
+    const response = await fetch(url, { headers, signal });
+    if (!response.ok || !response.body) throw new Error(`Download failed with HTTP ${response.status}`);
+    const output = fs.createWriteStream(outputPath);
+    try {
+        for await (const chunk of response.body as any as AsyncIterable<Uint8Array>) {
+            if (!output.write(chunk)) await new Promise<void>((resolve) => output.once('drain', () => resolve()));
+        }
+    } catch (e) {
+        // Nothing to resume without ranges
+        output.destroy();
+        await fsPromises.unlink(outputPath).catch(() => undefined);
+        throw signal && signal.aborted ? signal.reason : e;
+    }
+    await new Promise<void>((resolve, reject) => output.end((e?: Error | null) => e ? reject(e) : resolve()));
+    return (await fsPromises.stat(outputPath)).size;
+};
+
+// Only one download per partial file at a time; a second caller waits and then starts its own
+const activeDownloads = new Map<string, Promise<unknown>>();
+
+// Fetches `url` in concurrent byte-range fragments into `outputPath`. Progress is kept in
+// `outputPath`.part (+ .part.json), so an interrupted download resumes from its finished fragments
+// when called again with the same `outputPath`. Failed fragments are retried with backoff.
+export const downloadWithRanges = async (url: string, outputPath: string, options: RangeDownloadOptions = {}): Promise<string> => {
+    while (activeDownloads.has(outputPath)) {
+        await activeDownloads.get(outputPath)!.catch(() => undefined);
+    }
+    const download = runRangeDownload(url, outputPath, options);
+    activeDownloads.set(outputPath, download);
+    try {
+        return await download;
+    } finally {
+        activeDownloads.delete(outputPath);
+    }
+};
+
+const runRangeDownload = async (url: string, outputPath: string, options: RangeDownloadOptions): Promise<string> => {
+    const headers = options.headers || {};
+    const partPath = `${outputPath}.part`;
+    const statePath = `${partPath}.json`;
+    const started = Date.now();
+
+    const { signal } = options;
+    const { totalBytes, ranges } = await probe(url, headers, signal);
+    if (!ranges || !totalBytes) {
+        const bytes = await downloadWhole(url, headers, partPath, signal);
+        await fsPromises.rename(partPath, outputPath);
+        downloadCounters.downloads++;
+        downloadCounters.bytes += bytes;
+        downloadCounters.totalMs += Date.now() - started;
+        return outputPath;
+    }
+
+    // Resume only if the partial file is for the same content (a new URL for the same format is fine)
+    const fragmentBytes = options.fragmentBytes || FRAGMENT_BYTES;
+    const saved = await readState(statePath);
+    const resumable = !!saved && saved.totalBytes === totalBytes && saved.fragmentBytes === fragmentBytes && fs.existsSync(partPath);
+    const state: DownloadState = resumable ? saved! : { totalBytes, fragmentBytes, done: [] };
+
+    const file = await fsPromises.open(partPath, resumable ? 'r+' : 'w');
+    try {
+        await file.truncate(totalBytes);
+
+        const fragmentCount = Math.ceil(totalBytes / fragmentBytes);
+        const done = new Set(state.done);
+        const fragmentSize = (index: number) => Math.min(fragmentBytes, totalBytes - index * fragmentBytes);
+        const pending = Array.from({ length: fragmentCount }, (_, index) => index).filter((index) => !done.has(index));
+
+        let downloadedBytes = Array.from(done).reduce((total, index) => total + fragmentSize(index), 0);
+        if (resumable && downloadedBytes > 0) {
+            downloadCounters.resumed++;
+            downloadCounters.resumedBytes += downloadedBytes;
+            console.log(`Resuming download of ${path.basename(outputPath)} at ${downloadedBytes}/${totalBytes} bytes`);
+        }
+        const onBytes = (count: number) => {
+            downloadedBytes += count;
+            if (options.onProgress) options.onProgress(downloadedBytes, totalBytes);
+        };
+
+        // State writes are serialized so the last one always has every finished fragment; the data is
+        // synced first, so a fragment is never recorded as done before its bytes are on disk
+        let stateWrite: Promise<unknown> = writeState(statePath, state);
+        // After a fragment gives up, the others stop taking new work (the in-flight ones still finish
+        // and are recorded, so the next attempt resumes after them)
+        let failure: Error | null = null;
+
+        await mapWithConcurrency(pending, options.concurrency || FRAGMENT_CONCURRENCY, async (index) => {
+            if (failure || (signal && signal.aborted)) return;
+            const start = index * fragmentBytes;
+            const end = start + fragmentSize(index) - 1;
+
+            for (let attempt = 1; ; attempt++) {
+                try {
+                    await fetchFragment(url, headers, file, start, end, onBytes, signal);
+                    break;
+                } catch (e: any) {
+                    if (!(e instanceof RetryableError) || attempt >= FRAGMENT_MAX_ATTEMPTS || failure || (signal && signal.aborted)) {
+                        failure = failure || e;
+                        return;
+                    }
+                    downloadCounters.fragmentRetries++;
+                    const delay = Math.min(RETRY_MAX_MS, RETRY_BASE_MS * 2 ** (attempt - 1));
+                    console.error(`Fragment ${index} failed (attempt ${attempt}), retrying in ${delay}ms:`, e.message);
+                    await sleep(delay * (0.5 + Math.random() / 2));
+                }
+            }
+
+            state.done.push(index);
+            const snapshot = { ...state, done: [...state.done] };
+            stateWrite = stateWrite.then(async () => {
+                await file.datasync();
+                await writeState(statePath, snapshot);
+            });
+        });
+        await stateWrite;
+        if (failure) throw failure;
+        if (signal) signal.throwIfAborted();
+    } finally {
+        await file.close();
+    }
+
+    await fsPromises.rename(partPath, outputPath);
+    await fsPromises.unlink(statePath).catch(() => undefined);
+
+    downloadCounters.downloads++;
+    downloadCounters.bytes += totalBytes;
+    downloadCounters.totalMs += Date.now() - started;
+    return outputPath;
+};
+
+// Partial downloads nobody came back for
+export const prunePartialDownloads = async (dir: string, maxAgeMs: number) => {
+    const files = await fsPromises.readdir(dir).catch(() => [] as string[]);
+    for (const name of files) {
+        const filePath = path.join(dir, name);
+        const stat = await fsPromises.stat(filePath).catch(() => null);
+        if (stat && Date.now() - stat.mtimeMs > maxAgeMs && !activeDownloads.has(filePath.replace(/\.part(\.json)?$/, ''))) {
+            await fsPromises.unlink(filePath).catch(() => undefined);
+        }
+    }
+};
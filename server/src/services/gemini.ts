@@ -1,40 +1,249 @@
-import { GoogleGenerativeAI, SchemaType } from '@google/generative-ai';
+import { SchemaType } from '@google/generative-ai';
+import { FileState } from '@google/generative-ai/server';
 import fs from 'fs';
+import https from 'https';
+import crypto from 'crypto';
+import { LruCache } from './cache';
+import { getGeminiModel, getGeminiFileManager } from './clients';
+import { httpsAgent } from './http';
+import { getAudioMimeType } from './audio';
+import { shouldChunk, transcribeInChunks, addUsage, ChunkTranscript } from './transcription';
+import { ProgressCallback, createJsonFieldStreamer } from './progress';
+import { abortable } from './abort';
 
 const fsPromises = fs.promises;
 
-export const uploadToGemini = async (path: string, mimeType: string) => {
-    // For MVP: Inline processing is faster for typical < 1 hr YouTube videos (audio < 20MB)
-    // If we wanted to use File API: import { GoogleAIFileManager } ... 
-    // usage: fileManager.uploadFile(...)
-    // We'll stick to inline for simplicity as 'youtube-dl-exec' output is usually manageable.
-    // But we will ensure the Schema is robust.
+// Files up to this size go inline (base64 in the request); larger ones are streamed to the File API
+const GEMINI_INLINE_MAX_BYTES = Number(process.env.GEMINI_INLINE_MAX_BYTES) || 8 * 1024 * 1024;
+const UPLOAD_URL = 'https://generativelanguage.googleapis.com/upload/v1beta/files';
+// Gemini deletes uploaded files after 48h; reuse handles for a bit less than that
+const FILE_HANDLE_TTL_MS = 47 * 60 * 60 * 1000;
+const FILE_POLL_INTERVAL_MS = 1000;
+const FILE_POLL_TIMEOUT_MS = 5 * 60 * 1000;
 
-    const fileData = await fsPromises.readFile(path);
-    return {
-        inlineData: {
-            data: fileData.toString('base64'),
-            mimeType,
+type GeminiFilePart = { fileData: { fileUri: string, mimeType: string } };
+
+// Uploaded file handles by API key + content hash, so retries and re-runs of the same audio skip the upload.
+// Pending uploads are cached too, so concurrent requests for the same content share one upload.
+const fileHandles = new LruCache<Promise<GeminiFilePart>>(500, FILE_HANDLE_TTL_MS);
+const uploadCounters = { inline: 0, uploaded: 0, reused: 0, bytesUploaded: 0 };
+
+export const getGeminiUploadStats = () => ({ ...uploadCounters, cachedHandles: fileHandles.size });
+
+const hashFile = (path: string) => new Promise<string>((resolve, reject) => {
+    const hash = crypto.createHash('sha256');
+    fs.createReadStream(path)
+        .on('data', (chunk) => hash.update(chunk))
+        .on('end', () => resolve(hash.digest('hex')))
+        .on('error', reject);
+});
+
+const request = (url: string, options: https.RequestOptions, body?: fs.ReadStream | string) =>
+    new Promise<{ status: number, headers: Record<string, any>, body: string }>((resolve, reject) => {
+        const req = https.request(url, { agent: httpsAgent, ...options }, (res) => {
+            let data = '';
+            res.setEncoding('utf8');
+            res.on('data', (chunk) => data += chunk);
+            res.on('end', () => resolve({ status: res.statusCode || 0, headers: res.headers, body: data }));
+            res.on('error', reject);
+        });
+        req.on('error', reject);
+
+        if (body && typeof body !== 'string') {
+            body.on('error', (e) => req.destroy(e));
+            body.pipe(req);
+        } else {
+            req.end(body);
+        }
+    });
+
+// Resumable upload protocol: one request opens the session, the second streams the file from disk,
+// so memory use doesn't depend on the audio length.
+const streamUpload = async (path: string, mimeType: string, apiKey: string, size: number): Promise<GeminiFilePart> => {
+    const metadata = JSON.stringify({ file: { display_name: path.split(/[\\/]/).pop() } });
+    const start = await request(UPLOAD_URL, {
+        method: 'POST',
+        headers: {
+            'x-goog-api-key': apiKey,
+            'X-Goog-Upload-Protocol': 'resumable',
+            'X-Goog-Upload-Command': 'start',
+            'X-Goog-Upload-Header-Content-Length': size,
+            'X-Goog-Upload-Header-Content-Type': mimeType,
+            'Content-Type': 'application/json',
+            'Content-Length': Buffer.byteLength(metadata),
+        },
+    }, metadata);
+
+    const uploadUrl = start.headers['x-goog-upload-url'];
+    if (start.status !== 200 || !uploadUrl) {
+        throw new Error(`Gemini upload session failed (${start.status}): ${start.body.slice(0, 500)}`);
+    }
+
+    const upload = await request(uploadUrl, {
+        method: 'POST',
+        headers: {
+            'Content-Length': size,
+            'X-Goog-Upload-Offset': 0,
+            'X-Goog-Upload-Command': 'upload, finalize',
         },
+    }, fs.createReadStream(path));
+
+    if (upload.status !== 200) {
+        throw new Error(`Gemini upload failed (${upload.status}): ${upload.body.slice(0, 500)}`);
+    }
+    uploadCounters.uploaded++;
+    uploadCounters.bytesUploaded += size;
+
+    // Audio is usually ACTIVE right away, but the API may still be processing it
+    let file = JSON.parse(upload.body).file;
+    const fileManager = getGeminiFileManager(apiKey);
+    const deadline = Date.now() + FILE_POLL_TIMEOUT_MS;
+    while (file.state === FileState.PROCESSING) {
+        if (Date.now() > deadline) throw new Error(`Gemini file ${file.name} is still processing`);
+        await new Promise((resolve) => setTimeout(resolve, FILE_POLL_INTERVAL_MS));
+        file = await fileManager.getFile(file.name);
+    }
+    if (file.state === FileState.FAILED) throw new Error(`Gemini could not process file ${file.name}`);
+
+    return { fileData: { fileUri: file.uri, mimeType: file.mimeType || mimeType } };
+};
+
+// Small clips are sent inline; anything larger is uploaded once through the File API and referenced by URI.
+// Uploads are shared, so `signal` only stops waiting for one (the handle is still cached for a retry).
+export const uploadToGemini = async (path: string, mimeType: string, apiKey: string, signal?: AbortSignal) => {
+    const { size } = await fsPromises.stat(path);
+
+    if (size <= GEMINI_INLINE_MAX_BYTES) {
+        uploadCounters.inline++;
+        const fileData = await fsPromises.readFile(path);
+        return {
+            inlineData: {
+                data: fileData.toString('base64'),
+                mimeType,
+            },
+        };
+    }
+
+    const keyHash = crypto.createHash('sha256').update(apiKey).digest('hex').slice(0, 16);
+    const cacheKey = `${keyHash}:${await hashFile(path)}`;
+
+    const cached = fileHandles.get(cacheKey);
+    if (cached) {
+        uploadCounters.reused++;
+        return abortable(cached, signal);
+    }
+
+    const upload = streamUpload(path, mimeType, apiKey, size);
+    fileHandles.set(cacheKey, upload);
+    upload.catch(() => fileHandles.delete(cacheKey));
+    return abortable(upload, signal);
+};
+
+// Long audio is transcribed in parallel chunks and summarized from the stitched text;
+// short clips go out as a single transcribe + summarize request.
+export const processWithGemini = async (audioPath: string, apiKey?: string, onProgress?: ProgressCallback, signal?: AbortSignal) => {
+    if (!apiKey || !(await shouldChunk(audioPath, undefined, signal))) {
+        return transcribeAndSummarize(audioPath, apiKey, onProgress, signal);
+    }
+
+    const chunked = await transcribeInChunks(audioPath, (chunkPath, chunkSignal) => transcribeWithGemini(chunkPath, apiKey, chunkSignal), onProgress, signal);
+
+    if (onProgress) onProgress('Gerando resumo...');
+    const analysis = await summarizeWithGemini(chunked.text, apiKey, (text) => {
+        if (onProgress) onProgress({ type: 'summary.delta', text });
+    }, signal);
+
+    return {
+        transcription: chunked.text,
+        summary: analysis.summary,
+        key_topics: analysis.key_topics,
+        usage: addUsage(chunked.usage, analysis.usage),
     };
 };
 
-// Alias for consistency with other services
-export const processWithGemini = async (audioPath: string, apiKey?: string) => {
-    return transcribeAndSummarize(audioPath, apiKey);
+// Transcription only, used per chunk
+export const transcribeWithGemini = async (audioPath: string, apiKey: string, signal?: AbortSignal): Promise<ChunkTranscript> => {
+    const model = getGeminiModel(apiKey, 'transcribe', {
+        model: "gemini-2.5-flash",
+        generationConfig: {
+            responseMimeType: "application/json",
+            responseSchema: {
+                type: SchemaType.OBJECT,
+                properties: {
+                    transcription: { type: SchemaType.STRING }
+                },
+                required: ["transcription"]
+            }
+        }
+    });
+
+    const audioData = await uploadToGemini(audioPath, getAudioMimeType(audioPath), apiKey, signal);
+    const prompt = `
+    You are an expert transcriber.
+    Transcribe the following audio intelligently in Portuguese (PT-BR). Ignore filler words.
+    This audio may start or end mid-sentence; transcribe it as-is.
+    `;
+
+    const result = await model.generateContent([prompt, audioData], { signal });
+    const { transcription } = JSON.parse(result.response.text());
+    return { text: transcription, usage: result.response.usageMetadata };
 };
 
-export const transcribeAndSummarize = async (audioPath: string, apiKey?: string) => {
+// Summary + key topics from an existing transcription.
+// The response is streamed so the summary can be shown while it is generated.
+export const summarizeWithGemini = async (transcription: string, apiKey: string, onSummaryDelta?: (text: string) => void, signal?: AbortSignal) => {
+    const model = getGeminiModel(apiKey, 'summarize', {
+        model: "gemini-2.5-flash",
+        generationConfig: {
+            responseMimeType: "application/json",
+            responseSchema: {
+                type: SchemaType.OBJECT,
+                properties: {
+                    summary: { type: SchemaType.STRING },
+                    key_topics: {
+                        type: SchemaType.ARRAY,
+                        items: { type: SchemaType.STRING }
+                    }
+                },
+                required: ["summary", "key_topics"]
+            }
+        }
+    });
+
+    const prompt = `
+    You are an expert content analyst.
+    1. Provide a concise, structured executive summary of the key points IN PORTUGUESE.
+    2. Extract a list of key topics discussed.
+
+    Transcription:
+    ${transcription}
+    `;
+
+    const result = await model.generateContentStream(prompt, { signal });
+    const summaryStreamer = onSummaryDelta ? createJsonFieldStreamer('summary', onSummaryDelta) : null;
+
+    let text = '';
+    for await (const chunk of result.stream) {
+        text += chunk.text();
+        if (summaryStreamer) summaryStreamer.update(text);
+    }
+    if (summaryStreamer) summaryStreamer.flush();
+
+    const response = await result.response;
+    const analysis: { summary: string, key_topics: string[] } = JSON.parse(text);
+    return { ...analysis, usage: response.usageMetadata };
+};
+
+// Single request for transcription + summary, streamed so both fields are shown while they are generated
+export const transcribeAndSummarize = async (audioPath: string, apiKey?: string, onProgress?: ProgressCallback, signal?: AbortSignal) => {
     const key = apiKey;
     if (!key) {
         throw new Error("API Key do Gemini não fornecida. Configure nos ajustes.");
     }
 
-    const genAI = new GoogleGenerativeAI(key);
-
     // Using the experimental model for best performance with structured outputs
     // or standard flash
-    const model = genAI.getGenerativeModel({
+    const model = getGeminiModel(key, 'transcribe_and_summarize', {
         model: "gemini-2.5-flash",
         generationConfig: {
             responseMimeType: "application/json",
@@ -53,7 +262,7 @@ export const transcribeAndSummarize = async (audioPath: string, apiKey?: string)
         }
     });
 
-    const audioData = await uploadToGemini(audioPath, "audio/mp3");
+    const audioData = await uploadToGemini(audioPath, getAudioMimeType(audioPath), key, signal);
 
     const prompt = `
     You are an expert transcriber and summarizer.
@@ -63,16 +272,25 @@ export const transcribeAndSummarize = async (audioPath: string, apiKey?: string)
     `;
 
     try {
-        const result = await model.generateContent([prompt, audioData]);
-        const response = await result.response;
-        const text = response.text();
-        const usage = result.response.usageMetadata;
+        const result = await model.generateContentStream([prompt, audioData], { signal });
+        const streamers = onProgress ? [
+            createJsonFieldStreamer('transcription', (text) => onProgress({ type: 'transcript.delta', text })),
+            createJsonFieldStreamer('summary', (text) => onProgress({ type: 'summary.delta', text })),
+        ] : [];
+
+        let text = '';
+        for await (const chunk of result.stream) {
+            text += chunk.text();
+            for (const streamer of streamers) streamer.update(text);
+        }
+        for (const streamer of streamers) streamer.flush();
 
+        const response = await result.response;
         const jsonResponse = JSON.parse(text);
 
         return {
             ...jsonResponse,
-            usage: usage
+            usage: response.usageMetadata
         };
     } catch (e) {
         console.error("Gemini Error:", e);
@@ -0,0 +1,148 @@
+// Hedged provider requests (`PROVIDER_HEDGING=true`): if the primary provider hasn't answered by a deadline
+// taken from its own recent latency, the same audio also goes to the other provider and the first success wins.
+// A transient error from the primary (5xx/429) sends it to the other provider right away.
+const HEDGING_ENABLED = process.env.PROVIDER_HEDGING === 'true';
+// Latency percentile (per second of audio) after which the second request is sent
+const HEDGE_PERCENTILE = Number(process.env.HEDGE_PERCENTILE) || 95;
+const HEDGE_MIN_DELAY_MS = (Number(process.env.HEDGE_MIN_DELAY_SECONDS) || 10) * 1000;
+// Used until a provider has enough samples (or when the audio duration is unknown)
+const HEDGE_DEFAULT_DELAY_MS = (Number(process.env.HEDGE_DEFAULT_DELAY_SECONDS) || 120) * 1000;
+const LATENCY_WINDOW = 200;
+const MIN_SAMPLES = 10;
+
+export type HedgeReason = 'deadline' | 'failover';
+
+export interface HedgeOptions<T> {
+    primary: string;
+    // No secondary (e.g. the user has no key for the other provider): the primary runs alone
+    secondary?: string | null;
+    delayMs: number;
+    signal?: AbortSignal;
+    run: (provider: string, signal: AbortSignal) => Promise<T>;
+    onHedge?: (provider: string, reason: HedgeReason, error?: any) => void;
+}
+
+export interface HedgedResult<T> {
+    result: T;
+    // The provider that served the result
+    provider: string;
+    hedged: boolean;
+    latencyMs: number;
+}
+
+// Recent milliseconds of processing per second of audio, by provider
+const latencies = new Map<string, number[]>();
+const hedgeCounters = { requests: 0, hedged: 0, failovers: 0, secondaryWins: 0, cancelledLosers: 0 };
+
+export const isHedgingEnabled = () => HEDGING_ENABLED;
+
+// Provider SDKs put the HTTP status on the error (OpenAI `status`, Gemini `status` or "[503 ...]" in the message)
+export const isRetryableProviderError = (e: any) => {
+    const status = Number(e && e.status) || Number((/\[(\d{3})[ \]]/.exec(String(e && e.message)) || [])[1]);
+    return status === 429 || status >= 500;
+};
+
+export const recordProviderLatency = (provider: string, latencyMs: number, audioSeconds: number) => {
+    if (!(audioSeconds > 0)) return;
+    const samples = latencies.get(provider) || [];
+    samples.push(latencyMs / audioSeconds);
+    if (samples.length > LATENCY_WINDOW) samples.shift();
+    latencies.set(provider, samples);
+};
+
+const percentile = (samples: number[], p: number) => {
+    const sorted = [...samples].sort((a, b) => a - b);
+    return sorted[Math.min(sorted.length - 1, Math.ceil(p / 100 * sorted.length) - 1)];
+};
+
+// How long to wait for `provider` before hedging, scaled to the audio length
+export const getHedgeDelay = (provider: string, audioSeconds: number | null) => {
+    const samples = latencies.get(provider) || [];
+    if (!audioSeconds || samples.length < MIN_SAMPLES) return HEDGE_DEFAULT_DELAY_MS;
+    return Math.max(HEDGE_MIN_DELAY_MS, Math.round(percentile(samples, HEDGE_PERCENTILE) * audioSeconds));
+};
+
+// Runs `primary`, adding `secondary` after `delayMs` or as soon as the primary fails with a transient error.
+// The first success wins and the other request is aborted. If every attempt fails, the primary's error is thrown.
+export const runHedged = <T>(options: HedgeOptions<T>): Promise<HedgedResult<T>> => {
+    const { primary, secondary, delayMs, signal, run, onHedge } = options;
+    hedgeCounters.requests++;
+
+    return new Promise((resolve, reject) => {
+        const attempts: { provider: string, controller: AbortController, done: boolean }[] = [];
+        const errors = new Map<string, any>();
+        let settled = false;
+        let timer: NodeJS.Timeout | null = null;
+
+        const finish = (error: any, value?: HedgedResult<T>) => {
+            if (settled) return;
+            settled = true;
+            if (timer) clearTimeout(timer);
+            if (signal) signal.removeEventListener('abort', onAbort);
+            for (const attempt of attempts) {
+                if (attempt.done) continue;
+                attempt.controller.abort(new Error(`Hedged request lost to ${value ? value.provider : 'an error'}`));
+                hedgeCounters.cancelledLosers++;
+            }
+            if (error) reject(error);
+            else resolve(value!);
+        };
+
+        const start = (provider: string) => {
+            const controller = new AbortController();
+            const attempt = { provider, controller, done: false };
+            attempts.push(attempt);
+            const started = Date.now();
+
+            run(provider, signal ? AbortSignal.any([signal, controller.signal]) : controller.signal).then((result) => {
+                attempt.done = true;
+                if (settled) return;
+                if (provider !== primary) hedgeCounters.secondaryWins++;
+                finish(null, { result, provider, hedged: attempts.length > 1, latencyMs: Date.now() - started });
+            }, (e) => {
+                attempt.done = true;
+                if (settled) return;
+                if (signal && signal.aborted) return finish(signal.reason);
+                errors.set(provider, e);
+
+                if (provider === primary && secondary && attempts.length === 1 && isRetryableProviderError(e)) {
+                    hedgeCounters.failovers++;
+                    console.error(`${primary} failed with a transient error, failing over to ${secondary}:`, e.message);
+                    if (onHedge) onHedge(secondary, 'failover', e);
+                    return start(secondary);
+                }
+                // Nothing else running: give up (a non-transient primary error is not hedged)
+                if (attempts.every((other) => other.done)) finish(errors.get(primary) || e);
+            });
+        };
+
+        const onAbort = () => finish(signal!.reason);
+        if (signal) {
+            if (signal.aborted) return reject(signal.reason);
+            signal.addEventListener('abort', onAbort, { once: true });
+        }
+
+        if (secondary) {
+            timer = setTimeout(() => {
+                timer = null;
+                if (settled || attempts.length > 1) return;
+                hedgeCounters.hedged++;
+                console.log(`${primary} over its ${delayMs}ms deadline, hedging with ${secondary}`);
+                if (onHedge) onHedge(secondary, 'deadline');
+                start(secondary);
+            }, delayMs);
+        }
+        start(primary);
+    });
+};
+
+export const getHedgingStats = () => {
+    const deadlines: Record<string, any> = {};
+    for (const [provider, samples] of latencies) {
+        deadlines[provider] = {
+            samples: samples.length,
+            msPerAudioSecond: samples.length ? Math.round(percentile(samples, HEDGE_PERCENTILE)) : null,
+        };
+    }
+    return { enabled: HEDGING_ENABLED, percentile: HEDGE_PERCENTILE, ...hedgeCounters, deadlines };
+};
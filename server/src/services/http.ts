@@ -0,0 +1,71 @@
+import https from 'https';
+import diagnosticsChannel from 'diagnostics_channel';
+import { Agent, setGlobalDispatcher } from 'undici';
+
+// How long idle provider connections are kept open for the next request
+const KEEP_ALIVE_MS = (Number(process.env.HTTP_KEEP_ALIVE_SECONDS) || 60) * 1000;
+const MAX_SOCKETS_PER_ORIGIN = Number(process.env.HTTP_MAX_SOCKETS_PER_ORIGIN) || 32;
+
+// Used for raw https requests (Gemini resumable uploads)
+export const httpsAgent = new https.Agent({
+    keepAlive: true,
+    maxSockets: MAX_SOCKETS_PER_ORIGIN,
+    maxFreeSockets: MAX_SOCKETS_PER_ORIGIN,
+    timeout: KEEP_ALIVE_MS,
+});
+
+// Both provider SDKs go through global fetch, so one shared dispatcher gives every client
+// (and every API key) the same pool of warm TLS connections per origin.
+const fetchDispatcher = new Agent({
+    keepAliveTimeout: KEEP_ALIVE_MS,
+    keepAliveMaxTimeout: KEEP_ALIVE_MS,
+    connections: MAX_SOCKETS_PER_ORIGIN,
+});
+
+const openSockets = new Map<string, Set<any>>();
+const connectionCounters = { requests: 0, connections: 0, connectErrors: 0 };
+
+export const configureHttpAgents = () => {
+    setGlobalDispatcher(fetchDispatcher);
+
+    // Count fetch connections: a request that doesn't open a new connection reused a pooled one
+    diagnosticsChannel.subscribe('undici:request:create', () => {
+        connectionCounters.requests++;
+    });
+    diagnosticsChannel.subscribe('undici:client:connectError', () => {
+        connectionCounters.connectErrors++;
+    });
+    diagnosticsChannel.subscribe('undici:client:connected', (message: any) => {
+        connectionCounters.connections++;
+        const origin = `${message.connectParams.protocol}//${message.connectParams.host}`;
+        const sockets = openSockets.get(origin) || new Set();
+        openSockets.set(origin, sockets);
+        sockets.add(message.socket);
+        message.socket.once('close', () => {
+            sockets.delete(message.socket);
+            if (sockets.size === 0) openSockets.delete(origin);
+        });
+    });
+};
+
+const countSockets = (sockets: NodeJS.ReadOnlyDict<unknown[]>) =>
+    Object.values(sockets).reduce((total, list) => total + (list ? list.length : 0), 0);
+
+export const getConnectionStats = () => {
+    const open: Record<string, number> = {};
+    for (const [origin, sockets] of openSockets) open[origin] = sockets.size;
+
+    return {
+        fetch: {
+            ...connectionCounters,
+            reuseRate: connectionCounters.requests
+                ? Math.max(0, 1 - connectionCounters.connections / connectionCounters.requests)
+                : 0,
+            open,
+        },
+        https: {
+            active: countSockets(httpsAgent.sockets),
+            idle: countSockets(httpsAgent.freeSockets),
+        },
+    };
+};
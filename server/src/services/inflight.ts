@@ -0,0 +1,109 @@
+import { PipelineEvent, ProgressCallback, isStageEvent } from './progress';
+import { abortable } from './abort';
+
+interface InFlightEntry<T> {
+    promise: Promise<T>;
+    listeners: Set<ProgressCallback>;
+    lastStage?: string | PipelineEvent;
+    // Transcript/summary deltas (and the preflight estimate) so far, replayed in full to late joiners
+    deltas: PipelineEvent[];
+    // Callers still waiting for the result; the task is aborted when the last one gives up
+    holders: number;
+    controller: AbortController;
+}
+
+// Single-flight registry: concurrent callers with the same key attach to one running task
+// and all receive its progress updates and final result (or error).
+// A caller whose `signal` aborts detaches (its promise rejects with the abort reason); the task's
+// own signal aborts only once no caller is left, so a shared job keeps running for the others.
+export class InFlightRegistry<T> {
+    private entries = new Map<string, InFlightEntry<T>>();
+    private counters = { started: 0, deduplicated: 0, detached: 0, cancelled: 0 };
+
+    run(
+        key: string,
+        task: (onProgress: ProgressCallback, signal: AbortSignal) => Promise<T>,
+        onProgress?: ProgressCallback,
+        signal?: AbortSignal
+    ): { promise: Promise<T>, shared: boolean } {
+        if (signal && signal.aborted) return { promise: Promise.reject(signal.reason), shared: false };
+
+        const existing = this.entries.get(key);
+        if (existing) {
+            this.counters.deduplicated++;
+            if (onProgress) {
+                existing.listeners.add(onProgress);
+                // Late joiners catch up on the text produced so far and the current stage
+                for (const delta of existing.deltas) onProgress(delta);
+                if (existing.lastStage) onProgress(existing.lastStage);
+                existing.promise.then(
+                    () => existing.listeners.delete(onProgress),
+                    () => existing.listeners.delete(onProgress)
+                );
+            }
+            return { promise: this.hold(key, existing, onProgress, signal), shared: true };
+        }
+
+        const listeners = new Set<ProgressCallback>();
+        if (onProgress) listeners.add(onProgress);
+
+        const entry = { listeners, deltas: [] as PipelineEvent[], holders: 0, controller: new AbortController() } as InFlightEntry<T>;
+        const broadcast = (event: string | PipelineEvent) => {
+            if (isStageEvent(event)) {
+                entry.lastStage = event;
+            } else if (typeof event !== 'string') {
+                entry.deltas.push(event);
+            }
+            for (const listener of listeners) {
+                try {
+                    listener(event);
+                } catch (e) {
+                    console.error('Progress listener error:', e);
+                }
+            }
+        };
+
+        this.counters.started++;
+        entry.promise = task(broadcast, entry.controller.signal).finally(() => {
+            if (this.entries.get(key) === entry) this.entries.delete(key);
+            listeners.clear();
+        });
+        this.entries.set(key, entry);
+
+        return { promise: this.hold(key, entry, onProgress, signal), shared: false };
+    }
+
+    // The caller's view of the entry: detaches it when its signal aborts, and aborts the task with the last one
+    private hold(key: string, entry: InFlightEntry<T>, onProgress?: ProgressCallback, signal?: AbortSignal): Promise<T> {
+        entry.holders++;
+        if (!signal) return entry.promise;
+
+        const onAbort = () => {
+            entry.holders--;
+            this.counters.detached++;
+            if (onProgress) entry.listeners.delete(onProgress);
+            if (entry.holders === 0) {
+                this.counters.cancelled++;
+                // A new caller for the same key starts a fresh task instead of joining the cancelled one
+                if (this.entries.get(key) === entry) this.entries.delete(key);
+                entry.controller.abort(signal.reason);
+            }
+        };
+        signal.addEventListener('abort', onAbort, { once: true });
+        entry.promise.then(
+            () => signal.removeEventListener('abort', onAbort),
+            () => signal.removeEventListener('abort', onAbort)
+        );
+        return abortable(entry.promise, signal);
+    }
+
+    stats() {
+        let subscribers = 0;
+        for (const entry of this.entries.values()) subscribers += entry.listeners.size;
+        return {
+            ...this.counters,
+            inFlight: this.entries.size,
+            subscribers,
+        };
+    }
+}
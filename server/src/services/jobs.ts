@@ -0,0 +1,216 @@
+import { EventEmitter } from 'events';
+import crypto from 'crypto';
+import express from 'express';
+import { CancelledError } from './abort';
+
+export interface JobEvent {
+    id: number;
+    data: any;
+}
+
+export type JobState = 'running' | 'completed' | 'failed' | 'cancelled';
+
+export interface JobOptions {
+    // Keep processing after every client disconnected (the result is still saved for the user)
+    keepRunning?: boolean;
+}
+
+// Events kept per job for Last-Event-ID replay
+const JOB_REPLAY_BUFFER = Number(process.env.JOB_REPLAY_BUFFER) || 200;
+// How long finished jobs (and their results) stay retrievable
+const JOB_TTL_MS = (Number(process.env.JOB_TTL_MINUTES) || 60) * 60 * 1000;
+const HEARTBEAT_MS = 15000;
+// A running job whose last subscriber disconnected is cancelled after this long, unless someone reconnects
+const JOB_ABANDON_GRACE_MS = (Number(process.env.JOB_ABANDON_GRACE_SECONDS) || 30) * 1000;
+
+const jobCounters = { cancelled: 0 };
+
+// A processing job that outlives the HTTP connection that created it.
+// Every event gets a monotonically increasing id so clients can resume after a reconnect.
+// Once every SSE subscriber is gone (and none comes back within the grace period) the job's
+// signal aborts, so downloads, transcodes and provider calls stop instead of running for nobody.
+export class Job extends EventEmitter {
+    readonly id = crypto.randomUUID();
+    readonly createdAt = Date.now();
+    readonly keepRunning: boolean;
+    state: JobState = 'running';
+    result?: any;
+    error?: string;
+    finishedAt?: number;
+
+    private events: JobEvent[] = [];
+    private nextEventId = 1;
+    // Text of the transcript/summary deltas evicted from the buffer, and the newest evicted delta's id
+    private evictedText = { transcript: '', summary: '' };
+    private lastEvictedDeltaId = 0;
+    private controller = new AbortController();
+    private subscribers = 0;
+    private abandonTimer: NodeJS.Timeout | null = null;
+
+    constructor(options: JobOptions = {}) {
+        super();
+        this.setMaxListeners(0);
+        this.keepRunning = !!options.keepRunning;
+    }
+
+    get signal(): AbortSignal {
+        return this.controller.signal;
+    }
+
+    // Registers a connected client; call the returned function when it disconnects
+    subscribe() {
+        this.subscribers++;
+        if (this.abandonTimer) {
+            clearTimeout(this.abandonTimer);
+            this.abandonTimer = null;
+        }
+
+        let subscribed = true;
+        return () => {
+            if (!subscribed) return;
+            subscribed = false;
+            this.subscribers--;
+            if (this.subscribers > 0 || this.keepRunning || this.state !== 'running') return;
+
+            this.abandonTimer = setTimeout(() => {
+                this.abandonTimer = null;
+                if (this.subscribers === 0) this.cancel();
+            }, JOB_ABANDON_GRACE_MS);
+            this.abandonTimer.unref();
+        };
+    }
+
+    cancel() {
+        if (this.state !== 'running') return;
+        const reason = new CancelledError();
+        this.state = 'cancelled';
+        this.error = reason.message;
+        this.finishedAt = Date.now();
+        jobCounters.cancelled++;
+        console.log(`Job ${this.id} cancelled: no subscribers left`);
+        this.push({ type: 'error', error: reason.message, cancelled: true });
+        this.emit('end');
+        this.controller.abort(reason);
+    }
+
+    push(data: any) {
+        const event = { id: this.nextEventId++, data };
+        this.events.push(event);
+        if (this.events.length > JOB_REPLAY_BUFFER) {
+            // Progress stages are superseded by later ones, so drop those before any transcript/summary text
+            const oldestStage = this.events.findIndex((buffered) => buffered.data.type === 'stage');
+            const [evicted] = this.events.splice(oldestStage >= 0 ? oldestStage : 0, 1);
+            if (evicted.data.type === 'transcript.delta' || evicted.data.type === 'summary.delta') {
+                this.evictedText[evicted.data.type === 'transcript.delta' ? 'transcript' : 'summary'] += evicted.data.text;
+                this.lastEvictedDeltaId = evicted.id;
+            }
+        }
+        this.emit('event', event);
+    }
+
+    // Buffered events after `lastEventId`. If the client fell further behind than the buffer, it gets
+    // everything still buffered (the terminal event is always the newest, so it is never lost), preceded
+    // by a snapshot of the text it missed, which replaces the client's text so far.
+    eventsSince(lastEventId: number) {
+        const events = this.events.filter((event) => event.id > lastEventId);
+        if (lastEventId >= this.lastEvictedDeltaId) return events;
+        return [{ id: this.lastEvictedDeltaId, data: { type: 'text.snapshot', ...this.evictedText } }, ...events];
+    }
+
+    complete(result: any, extra: Record<string, any> = {}) {
+        if (this.state !== 'running') return;
+        this.state = 'completed';
+        this.result = result;
+        this.finishedAt = Date.now();
+        this.push({ type: 'result', status: 'Concluído!', result, ...extra });
+        this.emit('end');
+    }
+
+    fail(message: string) {
+        if (this.state !== 'running') return;
+        this.state = 'failed';
+        this.error = message;
+        this.finishedAt = Date.now();
+        this.push({ type: 'error', error: message });
+        this.emit('end');
+    }
+
+    toJSON() {
+        return {
+            id: this.id,
+            state: this.state,
+            createdAt: this.createdAt,
+            finishedAt: this.finishedAt,
+            lastEventId: this.nextEventId - 1,
+            result: this.result,
+            error: this.error,
+        };
+    }
+}
+
+const jobs = new Map<string, Job>();
+
+// Starts `run` in the background and returns the job immediately
+export const createJob = (run: (job: Job) => Promise<void>, options: JobOptions = {}) => {
+    const job = new Job(options);
+    jobs.set(job.id, job);
+
+    run(job).catch((error: any) => {
+        if (job.state === 'cancelled') return;
+        console.error(`Job ${job.id} failed:`, error);
+        job.fail(error.message || 'Internal server error');
+    });
+
+    return job;
+};
+
+export const getJob = (id: string) => jobs.get(id);
+
+export const getJobStats = () => {
+    let running = 0;
+    for (const job of jobs.values()) if (job.state === 'running') running++;
+    return { tracked: jobs.size, running, ...jobCounters };
+};
+
+setInterval(() => {
+    const now = Date.now();
+    for (const [id, job] of jobs) {
+        if (job.finishedAt && now - job.finishedAt > JOB_TTL_MS) jobs.delete(id);
+    }
+}, 60 * 1000).unref();
+
+// Streams a job's events as SSE, replaying anything after Last-Event-ID first
+export const streamJobEvents = (job: Job, req: express.Request, res: express.Response) => {
+    res.setHeader('Content-Type', 'text/event-stream');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('Connection', 'keep-alive');
+
+    const lastEventId = Number(req.header('Last-Event-ID') || req.query.lastEventId) || 0;
+
+    const writeEvent = (event: JobEvent) => {
+        const type = event.data.type ? `event: ${event.data.type}\n` : '';
+        res.write(`id: ${event.id}\n${type}data: ${JSON.stringify(event.data)}\n\n`);
+    };
+
+    for (const event of job.eventsSince(lastEventId)) writeEvent(event);
+
+    if (job.state !== 'running') {
+        res.end();
+        return;
+    }
+
+    const heartbeat = setInterval(() => res.write(':\n\n'), HEARTBEAT_MS);
+    const onEnd = () => res.end();
+    const unsubscribe = job.subscribe();
+
+    const detach = () => {
+        clearInterval(heartbeat);
+        job.off('event', writeEvent);
+        job.off('end', onEnd);
+        unsubscribe();
+    };
+
+    job.on('event', writeEvent);
+    job.once('end', onEnd);
+    res.on('close', detach);
+};
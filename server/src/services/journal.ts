@@ -0,0 +1,185 @@
+import fs from 'fs';
+import path from 'path';
+import crypto from 'crypto';
+import { mapWithConcurrency } from './scheduler';
+
+const fsPromises = fs.promises;
+
+export interface JournalQueueOptions<T> {
+    name: string;
+    dir: string;
+    // `id` is stable across retries and replays, so the write can be made idempotent with it
+    write: (record: T, id: string) => Promise<unknown>;
+    // Writes in flight at once (each record is its own write)
+    concurrency?: number;
+    maxAttempts?: number;
+}
+
+interface PendingEntry<T> {
+    id: string;
+    record: T;
+    enqueuedAt: number;
+    attempts: number;
+    nextAttemptAt: number;
+}
+
+const RETRY_BASE_MS = 1000;
+const RETRY_MAX_MS = 5 * 60 * 1000;
+const RETRY_CHECK_MS = 1000;
+
+// Write-behind queue backed by an append-only journal. `enqueue` resolves once the record is on disk,
+// so callers can respond right away; records are written in the background, a few at a time, with exponential
+// backoff on failure. Unacknowledged records are replayed from the journal on restart. Records that keep
+// failing go to a dead-letter file instead of being dropped.
+export class JournalQueue<T> {
+    private pending = new Map<string, PendingEntry<T>>();
+    private journalPath: string;
+    private deadLetterPath: string;
+    private journal: fs.promises.FileHandle | null = null;
+    private appendChain: Promise<unknown> = Promise.resolve();
+    private flushing = false;
+    private timer: NodeJS.Timeout | null = null;
+    private concurrency: number;
+    private maxAttempts: number;
+    private counters = { enqueued: 0, written: 0, failedAttempts: 0, deadLettered: 0, replayed: 0 };
+    private latency = { lastFlushMs: 0, totalFlushMs: 0, flushes: 0 };
+
+    constructor(private options: JournalQueueOptions<T>) {
+        this.journalPath = path.join(options.dir, `${options.name}.jsonl`);
+        this.deadLetterPath = path.join(options.dir, `${options.name}.failed.jsonl`);
+        this.concurrency = options.concurrency || 4;
+        this.maxAttempts = options.maxAttempts || 12;
+    }
+
+    // Replays records left in the journal by a previous run and starts the flush loop
+    async start() {
+        await fsPromises.mkdir(this.options.dir, { recursive: true });
+
+        const content = await fsPromises.readFile(this.journalPath, 'utf8').catch(() => '');
+        for (const line of content.split('\n')) {
+            if (!line.trim()) continue;
+            let entry: any;
+            try {
+                entry = JSON.parse(line);
+            } catch {
+                continue; // torn write from a crash
+            }
+            if (entry.op === 'put') {
+                this.pending.set(entry.id, { id: entry.id, record: entry.record, enqueuedAt: entry.at, attempts: 0, nextAttemptAt: 0 });
+            } else if (entry.op === 'ack') {
+                this.pending.delete(entry.id);
+            }
+        }
+        this.counters.replayed = this.pending.size;
+        if (this.pending.size > 0) console.log(`Replaying ${this.pending.size} pending ${this.options.name} writes from journal`);
+
+        // Compact: rewrite the journal with only the records still pending
+        const tmpPath = `${this.journalPath}.${process.pid}.tmp`;
+        const lines = Array.from(this.pending.values()).map((entry) => this.putLine(entry));
+        await fsPromises.writeFile(tmpPath, lines.join(''));
+        await fsPromises.rename(tmpPath, this.journalPath);
+
+        this.journal = await fsPromises.open(this.journalPath, 'a');
+        this.timer = setInterval(() => this.flush(), RETRY_CHECK_MS);
+        this.timer.unref();
+        this.flush();
+    }
+
+    async enqueue(record: T) {
+        // Tracked (but not flushable) before the append, so an empty-queue truncate can't race it
+        const entry: PendingEntry<T> = { id: crypto.randomUUID(), record, enqueuedAt: Date.now(), attempts: 0, nextAttemptAt: Infinity };
+        this.pending.set(entry.id, entry);
+        try {
+            await this.append(this.putLine(entry));
+        } catch (e) {
+            this.pending.delete(entry.id);
+            throw e;
+        }
+        entry.nextAttemptAt = 0;
+        this.counters.enqueued++;
+        setImmediate(() => this.flush());
+        return entry.id;
+    }
+
+    private putLine(entry: PendingEntry<T>) {
+        return JSON.stringify({ op: 'put', id: entry.id, at: entry.enqueuedAt, record: entry.record }) + '\n';
+    }
+
+    // Appends are serialized and synced, so an acknowledged enqueue survives a crash
+    private append(line: string) {
+        const next = this.appendChain.then(async () => {
+            if (!this.journal) throw new Error(`${this.options.name} journal is not started`);
+            await this.journal.appendFile(line);
+            await this.journal.datasync();
+        });
+        this.appendChain = next.catch(() => undefined);
+        return next;
+    }
+
+    private async flush() {
+        if (this.flushing || !this.journal) return;
+        this.flushing = true;
+
+        try {
+            while (true) {
+                const now = Date.now();
+                const due = Array.from(this.pending.values()).filter((entry) => entry.nextAttemptAt <= now);
+                if (due.length === 0) break;
+
+                const started = Date.now();
+                await mapWithConcurrency(due, this.concurrency, (entry) => this.writeEntry(entry));
+                this.latency.lastFlushMs = Date.now() - started;
+                this.latency.totalFlushMs += this.latency.lastFlushMs;
+                this.latency.flushes++;
+            }
+
+            // Nothing left to replay: start the journal over instead of letting acks pile up
+            if (this.pending.size === 0) {
+                await this.appendChain;
+                if (this.pending.size === 0) await this.journal.truncate(0);
+            }
+        } catch (e) {
+            console.error(`${this.options.name} journal flush failed:`, e);
+        } finally {
+            this.flushing = false;
+        }
+    }
+
+    private async writeEntry(entry: PendingEntry<T>) {
+        try {
+            await this.options.write(entry.record, entry.id);
+            this.counters.written++;
+        } catch (e: any) {
+            entry.attempts++;
+            this.counters.failedAttempts++;
+
+            if (entry.attempts < this.maxAttempts) {
+                const delay = Math.min(RETRY_MAX_MS, RETRY_BASE_MS * 2 ** (entry.attempts - 1));
+                entry.nextAttemptAt = Date.now() + delay * (0.5 + Math.random() / 2);
+                console.error(`${this.options.name} write failed (attempt ${entry.attempts}), retrying:`, e.message || e);
+                return;
+            }
+
+            console.error(`${this.options.name} write failed ${entry.attempts} times, moving to dead-letter file:`, e.message || e);
+            await fsPromises.appendFile(this.deadLetterPath, JSON.stringify({ id: entry.id, at: entry.enqueuedAt, error: e.message || String(e), record: entry.record }) + '\n');
+            this.counters.deadLettered++;
+        }
+
+        await this.append(JSON.stringify({ op: 'ack', id: entry.id }) + '\n');
+        this.pending.delete(entry.id);
+    }
+
+    stats() {
+        let oldest = Infinity;
+        for (const entry of this.pending.values()) oldest = Math.min(oldest, entry.enqueuedAt);
+
+        return {
+            name: this.options.name,
+            depth: this.pending.size,
+            oldestPendingMs: this.pending.size ? Date.now() - oldest : 0,
+            ...this.counters,
+            lastFlushMs: this.latency.lastFlushMs,
+            avgFlushMs: this.latency.flushes ? Math.round(this.latency.totalFlushMs / this.latency.flushes) : 0,
+        };
+    }
+}
@@ -2,35 +2,113 @@ import OpenAI from "openai";
 import fs from "fs";
 import { z } from "zod";
 import { zodResponseFormat } from "openai/helpers/zod";
+import { shouldChunk, transcribeInChunks, ChunkTranscript, addUsage } from "./transcription";
+import { ProgressCallback, createJsonFieldStreamer } from "./progress";
+import { condenseTranscript } from "./summarize";
+import { getOpenAIClient } from "./clients";
 
-export const processWithOpenAI = async (
-  audioPath: string,
-  apiKey: string,
-  userPrompt: string = "Summarize this content"
-) => {
-  const openai = new OpenAI({
-    apiKey: apiKey,
-  });
+// Whisper rejects uploads above 25 MB
+const WHISPER_MAX_BYTES = 24 * 1024 * 1024;
 
-  // Step 1: Transcribe with Whisper (Standard)
-  const transcriptionResponse = await openai.audio.transcriptions.create({
+export const transcribeWithWhisper = async (openai: OpenAI, audioPath: string, signal?: AbortSignal): Promise<ChunkTranscript> => {
+  const response = await openai.audio.transcriptions.create({
     file: fs.createReadStream(audioPath),
     model: "whisper-1",
     language: "pt",
     response_format: "verbose_json", // Changed to get duration
-  });
+  }, { signal });
+
+  return { text: response.text, duration: response.duration || 0 };
+};
+
+export const processWithOpenAI = async (
+  audioPath: string,
+  apiKey: string,
+  userPrompt: string = "Summarize this content",
+  onProgress?: ProgressCallback,
+  signal?: AbortSignal
+) => {
+  const openai = getOpenAIClient(apiKey);
 
-  const fullTranscription = transcriptionResponse.text;
-  const duration = transcriptionResponse.duration || 0; // Capture duration
+  // Step 1: Transcribe with Whisper (Standard), in parallel chunks for long or oversized audio
+  const chunked = await shouldChunk(audioPath, WHISPER_MAX_BYTES, signal);
+  const transcript = chunked
+    ? await transcribeInChunks(audioPath, (chunkPath, chunkSignal) => transcribeWithWhisper(openai, chunkPath, chunkSignal), onProgress, signal)
+    : await transcribeWithWhisper(openai, audioPath, signal);
+
+  const fullTranscription = transcript.text;
+  const duration = transcript.duration || 0; // Capture duration
+
+  // Chunked transcription already streamed its text; otherwise show it before the summary starts
+  if (onProgress && !chunked) {
+    onProgress({ type: "transcript.delta", text: fullTranscription });
+  }
 
   // Step 2: Summarize with GPT-4o using Zod Structured Output
+  const analysis = await summarizeWithOpenAI(openai, fullTranscription, (text) => {
+    if (onProgress) onProgress({ type: "summary.delta", text });
+  }, onProgress, signal);
+
+  return {
+    transcription: fullTranscription, // Use the whisper transcription (more accurate than re-generated)
+    summary: analysis.summary,
+    key_topics: analysis.key_topics,
+    duration: duration,
+    usage: analysis.usage
+  };
+};
 
-  const AnalysisSchema = z.object({
-    summary: z.string().describe("A professional executive summary in Portuguese"),
-    key_topics: z.array(z.string()).describe("Main topics discussed")
-  });
+const AnalysisSchema = z.object({
+  summary: z.string().describe("A professional executive summary in Portuguese"),
+  key_topics: z.array(z.string()).describe("Main topics discussed")
+});
 
-  const completion = await openai.chat.completions.parse({
+const toUsage = (usage?: { prompt_tokens?: number, completion_tokens?: number, total_tokens?: number } | null) => ({
+  promptTokenCount: usage?.prompt_tokens || 0,
+  candidatesTokenCount: usage?.completion_tokens || 0,
+  totalTokenCount: usage?.total_tokens || 0,
+});
+
+// Map step for long transcripts: plain-text summary of one section
+const summarizeSection = async (openai: OpenAI, section: string, index: number, total: number, signal?: AbortSignal) => {
+  const completion = await openai.chat.completions.create({
+    model: "gpt-5-mini",
+    messages: [
+      {
+        role: "system",
+        content: `You are an expert content analyst. You will receive part ${index + 1} of ${total} of a long transcription. Write a detailed summary of this part in Portuguese, keeping every key point, name and figure, so it can later be merged with the summaries of the other parts.`
+      },
+      {
+        role: "user",
+        content: `Transcription (part ${index + 1}/${total}):\n${section}`
+      }
+    ],
+  }, { signal });
+
+  return { text: completion.choices[0].message.content || "", usage: toUsage(completion.usage) };
+};
+
+// Long transcripts are condensed section by section first (map), then analyzed as a whole (reduce).
+// The final call is streamed so the summary can be shown while it is generated.
+export const summarizeWithOpenAI = async (
+  openai: OpenAI,
+  transcription: string,
+  onSummaryDelta?: (text: string) => void,
+  onProgress?: ProgressCallback,
+  signal?: AbortSignal
+) => {
+  const condensed = await condenseTranscript(
+    transcription,
+    (section, index, total) => summarizeSection(openai, section, index, total, signal),
+    onProgress
+  );
+  if (condensed.rounds > 0 && onProgress) onProgress("Consolidando resumo final...");
+
+  const input = condensed.rounds > 0
+    ? `Section summaries of a long transcription, in order:\n${condensed.text}`
+    : `Transcription:\n${condensed.text}`;
+
+  const stream = openai.chat.completions.stream({
     model: "gpt-5-mini", // Reverted to user preference
     messages: [
       {
@@ -39,26 +117,28 @@ export const processWithOpenAI = async (
       },
       {
         role: "user",
-        content: `Transcription:\n${fullTranscription.substring(0, 100000)}`
+        content: input
       }
     ],
     response_format: zodResponseFormat(AnalysisSchema, "analysis_response"),
-  });
+    stream_options: { include_usage: true },
+  }, { signal });
+
+  const summaryStreamer = onSummaryDelta ? createJsonFieldStreamer("summary", onSummaryDelta) : null;
+  if (summaryStreamer) {
+    stream.on("content.delta", ({ snapshot }: { snapshot: string }) => summaryStreamer.update(snapshot));
+  }
+
+  const completion = await stream.finalChatCompletion();
+  if (summaryStreamer) summaryStreamer.flush();
 
   const analysis = completion.choices[0].message.parsed;
-  const usage = completion.usage;
 
   if (!analysis) throw new Error("Failed to parse OpenAI response");
 
   return {
-    transcription: fullTranscription, // Use the whisper transcription (more accurate than re-generated)
-    summary: analysis.summary,
-    key_topics: analysis.key_topics,
-    duration: duration,
-    usage: {
-      promptTokenCount: usage?.prompt_tokens || 0,
-      candidatesTokenCount: usage?.completion_tokens || 0,
-      totalTokenCount: usage?.total_tokens || 0,
-    }
+    summary: analysis.summary as string,
+    key_topics: analysis.key_topics as string[],
+    usage: addUsage(condensed.usage, toUsage(completion.usage))
   };
 };
@@ -0,0 +1,55 @@
+import { extractAudioSegments } from './youtube';
+import { createSegmentTranscriber, addUsage } from './transcription';
+import { transcribeWithGemini, summarizeWithGemini } from './gemini';
+import { transcribeWithWhisper, summarizeWithOpenAI } from './openai';
+import { ProgressCallback } from './progress';
+import { getOpenAIClient } from './clients';
+
+// Length of each segment handed to the AI stage while the download is still running
+const SEGMENT_SECONDS = Number(process.env.PIPELINED_SEGMENT_SECONDS) || 300;
+
+export const isPipelinedEnabled = () => process.env.PIPELINED_TRANSCRIPTION === 'true';
+
+// Download and transcription overlap: each segment is transcribed as soon as ffmpeg closes it,
+// so time-to-first-transcript no longer includes the full download.
+export const processVideoPipelined = async (
+    videoUrl: string,
+    outputDir: string,
+    provider: string | undefined,
+    apiKey: string,
+    onProgress?: ProgressCallback,
+    signal?: AbortSignal
+) => {
+    const openai = provider === 'openai' ? getOpenAIClient(apiKey) : null;
+
+    const transcriber = createSegmentTranscriber(
+        (segmentPath) => openai ? transcribeWithWhisper(openai, segmentPath, signal) : transcribeWithGemini(segmentPath, apiKey, signal),
+        onProgress
+    );
+
+    try {
+        await extractAudioSegments(videoUrl, outputDir, SEGMENT_SECONDS, transcriber.add, onProgress, signal);
+    } catch (e) {
+        // Let segments already in flight settle (and clean up their files) before failing
+        await transcriber.finish().catch(() => undefined);
+        throw e;
+    }
+
+    const transcript = await transcriber.finish();
+
+    if (onProgress) onProgress('Gerando resumo...');
+    const onSummaryDelta = (text: string) => {
+        if (onProgress) onProgress({ type: 'summary.delta', text });
+    };
+    const analysis = openai
+        ? await summarizeWithOpenAI(openai, transcript.text, onSummaryDelta, onProgress, signal)
+        : await summarizeWithGemini(transcript.text, apiKey, onSummaryDelta, signal);
+
+    return {
+        transcription: transcript.text,
+        summary: analysis.summary,
+        key_topics: analysis.key_topics,
+        duration: transcript.duration,
+        usage: addUsage(transcript.usage, analysis.usage),
+    };
+};
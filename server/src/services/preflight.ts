@@ -0,0 +1,168 @@
+import path from 'path';
+import { TieredCache } from './cache';
+import { metadataQueue } from './scheduler';
+import { abortable } from './abort';
+import { calculateCost } from './supabase';
+import { fetchVideoMetadata, getCanonicalVideoKey, VideoMetadata } from './youtube';
+
+// Videos longer than this are rejected before anything is downloaded or billed
+const MAX_VIDEO_MINUTES = Number(process.env.MAX_VIDEO_MINUTES) || 240;
+// Videos longer than this download in the long-video lane (longExtractQueue)
+const LONG_VIDEO_MINUTES = Number(process.env.LONG_VIDEO_MINUTES) || 60;
+// Videos at least this long use pipelined transcription even when it isn't enabled globally (0 = never)
+const PIPELINED_MIN_MINUTES = Number(process.env.PIPELINED_MIN_MINUTES) || 0;
+
+// Token model for estimates: Gemini bills audio at 32 tokens/s; speech transcribes to roughly
+// 250 tokens/min; prompts and the summary are about the same size for every video.
+const GEMINI_AUDIO_TOKENS_PER_SECOND = 32;
+const TRANSCRIPT_TOKENS_PER_MINUTE = 250;
+const PROMPT_TOKENS = 500;
+const SUMMARY_TOKENS = 1500;
+
+// Starting points for the ETA, replaced by measured rates as jobs finish
+const DEFAULT_DOWNLOAD_BYTES_PER_SECOND = (Number(process.env.PREFLIGHT_DOWNLOAD_MBPS) || 2) * 1024 * 1024;
+const DEFAULT_PROCESSING_SECONDS_PER_AUDIO_SECOND = 0.1;
+const FIXED_OVERHEAD_SECONDS = 5;
+const RATE_SMOOTHING = 0.3;
+
+// Raised when a video is refused by admission control; mapped to HTTP 422
+export class AdmissionError extends Error { }
+
+export interface PreflightEstimate {
+    type: 'estimate';
+    status: string;
+    durationSeconds: number;
+    model: string;
+    inputTokens: number;
+    outputTokens: number;
+    costBrl: number;
+    etaSeconds: number;
+}
+
+export interface PreflightPlan {
+    metadata: VideoMetadata;
+    estimate: PreflightEstimate;
+    longVideo: boolean;
+    pipelined: boolean;
+}
+
+const metadataCache = new TieredCache<VideoMetadata>({
+    name: 'metadata',
+    dir: path.join(__dirname, '../../cache/metadata'),
+    maxEntries: Number(process.env.METADATA_CACHE_MAX_ENTRIES) || 2000,
+    ttlMs: (Number(process.env.METADATA_CACHE_TTL_HOURS) || 24 * 7) * 60 * 60 * 1000,
+});
+setInterval(() => metadataCache.prune(), 60 * 60 * 1000).unref();
+
+const pendingLookups = new Map<string, Promise<VideoMetadata>>();
+const rates = {
+    downloadBytesPerSecond: DEFAULT_DOWNLOAD_BYTES_PER_SECOND,
+    processingSecondsPerAudioSecond: DEFAULT_PROCESSING_SECONDS_PER_AUDIO_SECOND,
+};
+const preflightCounters = { admitted: 0, rejected: 0, longVideos: 0, failed: 0 };
+
+const smooth = (current: number, sample: number) => current + RATE_SMOOTHING * (sample - current);
+
+// Measured after each job so ETAs follow this server's actual throughput
+export const recordDownload = (bytes: number, elapsedMs: number) => {
+    if (bytes > 0 && elapsedMs > 0) rates.downloadBytesPerSecond = smooth(rates.downloadBytesPerSecond, bytes / (elapsedMs / 1000));
+};
+
+export const recordProcessing = (audioSeconds: number, elapsedMs: number) => {
+    if (audioSeconds > 0 && elapsedMs > 0) rates.processingSecondsPerAudioSecond = smooth(rates.processingSecondsPerAudioSecond, elapsedMs / 1000 / audioSeconds);
+};
+
+// Metadata by canonical video key; concurrent lookups for one video share a single yt-dlp call,
+// which waits for a slot in metadataQueue. `signal` only stops this caller from waiting on it.
+export const getVideoMetadata = async (url: string, signal?: AbortSignal): Promise<VideoMetadata> => {
+    const key = getCanonicalVideoKey(url);
+    const cached = await metadataCache.get(key);
+    if (cached) return cached;
+
+    let lookup = pendingLookups.get(key);
+    if (!lookup) {
+        lookup = metadataQueue.run(() => fetchVideoMetadata(url)).then(async (metadata) => {
+            // A live stream's duration and status change once it ends
+            if (!metadata.isLive) await metadataCache.set(key, metadata);
+            return metadata;
+        }).finally(() => pendingLookups.delete(key));
+        pendingLookups.set(key, lookup);
+    }
+    return abortable(lookup, signal);
+};
+
+const formatMinutes = (seconds: number) => `${Math.max(1, Math.round(seconds / 60))} min`;
+
+export const estimateVideoCost = (metadata: VideoMetadata, provider: string | undefined, pipelined: boolean): PreflightEstimate => {
+    const durationSeconds = metadata.durationSeconds;
+    const transcriptTokens = Math.round(durationSeconds / 60 * TRANSCRIPT_TOKENS_PER_MINUTE);
+
+    let model: string;
+    let inputTokens: number;
+    let outputTokens: number;
+    let costBrl: number;
+    if (provider === 'openai') {
+        // Whisper bills per minute; the summary model reads the transcript
+        model = 'gpt-5-mini';
+        inputTokens = transcriptTokens + PROMPT_TOKENS;
+        outputTokens = SUMMARY_TOKENS;
+        costBrl = calculateCost(model, inputTokens, outputTokens, durationSeconds);
+    } else {
+        model = 'gemini-2.5-flash';
+        inputTokens = Math.round(durationSeconds * GEMINI_AUDIO_TOKENS_PER_SECOND) + PROMPT_TOKENS;
+        outputTokens = transcriptTokens + SUMMARY_TOKENS;
+        costBrl = calculateCost(model, inputTokens, outputTokens);
+    }
+
+    // Pipelined jobs transcribe while downloading, so the slower stage dominates
+    const downloadSeconds = metadata.estimatedAudioBytes / rates.downloadBytesPerSecond;
+    const processingSeconds = durationSeconds * rates.processingSecondsPerAudioSecond;
+    const etaSeconds = Math.round(FIXED_OVERHEAD_SECONDS
+        + (pipelined ? Math.max(downloadSeconds, processingSeconds) : downloadSeconds + processingSeconds));
+
+    return {
+        type: 'estimate',
+        status: `Vídeo de ${formatMinutes(durationSeconds)} · custo estimado R$ ${costBrl.toFixed(2).replace('.', ',')} · tempo estimado ~${formatMinutes(etaSeconds)}`,
+        durationSeconds,
+        model,
+        inputTokens,
+        outputTokens,
+        costBrl,
+        etaSeconds,
+    };
+};
+
+// Fetches (cached) metadata before any download: refuses videos over the limits, picks the download lane
+// and transcription mode from the duration, and estimates cost and time for the client.
+export const preflightVideo = async (url: string, provider: string | undefined, pipelinedByDefault: boolean, signal?: AbortSignal): Promise<PreflightPlan> => {
+    let metadata: VideoMetadata;
+    try {
+        metadata = await getVideoMetadata(url, signal);
+    } catch (e) {
+        preflightCounters.failed++;
+        throw e;
+    }
+
+    if (metadata.isLive) {
+        preflightCounters.rejected++;
+        throw new AdmissionError('Transmissões ao vivo não são suportadas. Tente novamente quando a transmissão terminar.');
+    }
+    if (metadata.durationSeconds > MAX_VIDEO_MINUTES * 60) {
+        preflightCounters.rejected++;
+        throw new AdmissionError(`O vídeo tem ${formatMinutes(metadata.durationSeconds)}; o limite é de ${MAX_VIDEO_MINUTES} minutos.`);
+    }
+
+    const longVideo = metadata.durationSeconds > LONG_VIDEO_MINUTES * 60;
+    const pipelined = pipelinedByDefault || (PIPELINED_MIN_MINUTES > 0 && metadata.durationSeconds >= PIPELINED_MIN_MINUTES * 60);
+    preflightCounters.admitted++;
+    if (longVideo) preflightCounters.longVideos++;
+
+    return { metadata, estimate: estimateVideoCost(metadata, provider, pipelined), longVideo, pipelined };
+};
+
+export const getPreflightStats = () => ({
+    ...preflightCounters,
+    downloadBytesPerSecond: Math.round(rates.downloadBytesPerSecond),
+    processingSecondsPerAudioSecond: Number(rates.processingSecondsPerAudioSecond.toFixed(3)),
+    metadataCache: metadataCache.stats(),
+});
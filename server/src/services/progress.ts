@@ -0,0 +1,89 @@
+import { PreflightEstimate } from './preflight';
+
+// Typed events streamed to clients while a job runs
+export type PipelineEvent =
+    | { type: 'stage', status: string }
+    | PreflightEstimate
+    | { type: 'transcript.delta', text: string }
+    | { type: 'summary.delta', text: string };
+
+// Progress callbacks accept plain status strings (stages) or typed events
+export type ProgressCallback = (event: string | PipelineEvent) => void;
+
+export const toPipelineEvent = (event: string | PipelineEvent): PipelineEvent =>
+    typeof event === 'string' ? { type: 'stage', status: event } : event;
+
+export const isStageEvent = (event: string | PipelineEvent) => typeof event === 'string' || event.type === 'stage';
+
+// Decodes the (possibly still incomplete) value of a top-level JSON string field
+const readPartialJsonString = (json: string, field: string): string | null => {
+    const match = new RegExp(`"${field}"\\s*:\\s*"`).exec(json);
+    if (!match) return null;
+
+    const escapes: Record<string, string> = { n: '\n', t: '\t', r: '\r', b: '\b', f: '\f' };
+    let value = '';
+    for (let i = match.index + match[0].length; i < json.length; i++) {
+        const char = json[i];
+        if (char === '"') break;
+        if (char !== '\\') {
+            value += char;
+            continue;
+        }
+
+        const next = json[i + 1];
+        if (next === undefined) break;
+        if (next === 'u') {
+            const hex = json.slice(i + 2, i + 6);
+            if (hex.length < 4) break;
+            value += String.fromCharCode(parseInt(hex, 16));
+            i += 5;
+        } else {
+            value += escapes[next] ?? next;
+            i++;
+        }
+    }
+    return value;
+};
+
+// Emits the growing value of one string field while a structured (JSON) response streams in.
+// Deltas are throttled so token-level streaming doesn't flood the SSE replay buffer.
+export const createJsonFieldStreamer = (field: string, onDelta: (text: string) => void, intervalMs: number = 250) => {
+    let snapshot = '';
+    let emittedLength = 0;
+    let lastEmit = 0;
+
+    const flush = () => {
+        lastEmit = Date.now();
+        const value = readPartialJsonString(snapshot, field);
+        if (value && value.length > emittedLength) {
+            onDelta(value.slice(emittedLength));
+            emittedLength = value.length;
+        }
+    };
+
+    const update = (jsonSnapshot: string) => {
+        snapshot = jsonSnapshot;
+        if (Date.now() - lastEmit >= intervalMs) flush();
+    };
+
+    return { update, flush };
+};
+
+// Chunks finish out of order; this emits the joined text in order, as soon as a contiguous prefix is ready.
+// `join` must be prefix-stable (appending a part never changes the text already emitted).
+export const createOrderedTextEmitter = (join: (parts: string[]) => string, onText: (text: string) => void) => {
+    const parts: string[] = [];
+    let contiguous = 0;
+    let emitted = '';
+
+    return (index: number, text: string) => {
+        parts[index] = text;
+        while (parts[contiguous] !== undefined) contiguous++;
+
+        const current = join(parts.slice(0, contiguous));
+        if (current.length > emitted.length) {
+            onText(current.slice(emitted.length));
+            emitted = current;
+        }
+    };
+};
@@ -0,0 +1,152 @@
+export class QueueFullError extends Error {
+    constructor(stage: string) {
+        super(`Servidor ocupado: fila de ${stage} cheia. Tente novamente em instantes.`);
+        this.name = 'QueueFullError';
+    }
+}
+
+interface Waiter {
+    start: () => void;
+    onPosition?: (position: number) => void;
+    enqueuedAt: number;
+}
+
+// FIFO worker pool for one pipeline stage: at most `concurrency` tasks run at once,
+// at most `maxQueued` wait behind them, and waiters are told their position as the queue moves.
+export class StageQueue {
+    private active = 0;
+    private waiting: Waiter[] = [];
+    private counters = { completed: 0, failed: 0, rejected: 0, cancelled: 0, totalWaitMs: 0, waited: 0 };
+
+    constructor(public readonly name: string, private concurrency: number, private maxQueued: number) { }
+
+    // A waiter whose `signal` aborts leaves the queue without taking a slot
+    async run<T>(task: () => Promise<T>, onQueued?: (position: number) => void, signal?: AbortSignal): Promise<T> {
+        if (signal) signal.throwIfAborted();
+
+        if (this.active < this.concurrency) {
+            this.active++;
+        } else {
+            if (this.waiting.length >= this.maxQueued) {
+                this.counters.rejected++;
+                throw new QueueFullError(this.name);
+            }
+
+            const enqueuedAt = Date.now();
+            await new Promise<void>((resolve, reject) => {
+                const onAbort = () => {
+                    this.waiting.splice(this.waiting.indexOf(waiter), 1);
+                    this.counters.cancelled++;
+                    this.notifyPositions();
+                    reject(signal!.reason);
+                };
+                const waiter: Waiter = {
+                    start: () => {
+                        if (signal) signal.removeEventListener('abort', onAbort);
+                        resolve();
+                    },
+                    onPosition: onQueued,
+                    enqueuedAt,
+                };
+                if (signal) signal.addEventListener('abort', onAbort, { once: true });
+                this.waiting.push(waiter);
+                if (onQueued) onQueued(this.waiting.length);
+            });
+            this.counters.waited++;
+            this.counters.totalWaitMs += Date.now() - enqueuedAt;
+        }
+
+        try {
+            const result = await task();
+            this.counters.completed++;
+            return result;
+        } catch (e) {
+            this.counters.failed++;
+            throw e;
+        } finally {
+            this.release();
+        }
+    }
+
+    private release() {
+        const next = this.waiting.shift();
+        if (!next) {
+            this.active--;
+            return;
+        }
+
+        // The slot is handed straight to the next waiter, so `active` stays the same
+        next.start();
+        this.notifyPositions();
+    }
+
+    private notifyPositions() {
+        this.waiting.forEach((waiter, index) => {
+            if (waiter.onPosition) waiter.onPosition(index + 1);
+        });
+    }
+
+    stats() {
+        return {
+            name: this.name,
+            concurrency: this.concurrency,
+            active: this.active,
+            queued: this.waiting.length,
+            maxQueued: this.maxQueued,
+            completed: this.counters.completed,
+            failed: this.counters.failed,
+            rejected: this.counters.rejected,
+            cancelled: this.counters.cancelled,
+            avgWaitMs: this.counters.waited ? Math.round(this.counters.totalWaitMs / this.counters.waited) : 0,
+        };
+    }
+}
+
+const MAX_QUEUED_JOBS = Number(process.env.MAX_QUEUED_JOBS) || 50;
+
+// Download/transcode (yt-dlp + ffmpeg) is CPU and disk bound
+export const extractQueue = new StageQueue('download', Number(process.env.EXTRACT_CONCURRENCY) || 2, MAX_QUEUED_JOBS);
+
+// Videos over LONG_VIDEO_MINUTES (known from the metadata preflight) download in their own lane,
+// so a few long downloads can't hold every slot while short jobs wait
+export const longExtractQueue = new StageQueue('download (vídeos longos)', Number(process.env.LONG_EXTRACT_CONCURRENCY) || 1, MAX_QUEUED_JOBS);
+
+// Metadata lookups (yt-dlp --dump-json) run before a job is admitted, so they get a small lane of their own
+export const metadataQueue = new StageQueue('metadados', Number(process.env.METADATA_CONCURRENCY) || 4, MAX_QUEUED_JOBS);
+
+// Provider calls are bound by API quota
+export const aiQueue = new StageQueue('transcrição', Number(process.env.AI_CONCURRENCY) || 4, MAX_QUEUED_JOBS);
+
+// Runs `worker` over `items` with at most `limit` calls in flight, preserving result order.
+// After the first failure (or once `signal` aborts) no new items are started and the signal passed
+// to the workers still in flight aborts; it returns only after they have all settled, with the first error.
+export const mapWithConcurrency = async <T, R>(
+    items: T[],
+    limit: number,
+    worker: (item: T, index: number, signal: AbortSignal) => Promise<R>,
+    signal?: AbortSignal
+): Promise<R[]> => {
+    const results = new Array<R>(items.length);
+    const controller = new AbortController();
+    const stop = signal ? AbortSignal.any([signal, controller.signal]) : controller.signal;
+    let next = 0;
+
+    const runners = Array.from({ length: Math.max(1, Math.min(limit, items.length)) }, async () => {
+        while (next < items.length && !stop.aborted) {
+            const index = next++;
+            try {
+                results[index] = await worker(items[index], index, stop);
+            } catch (e) {
+                if (!controller.signal.aborted) controller.abort(e);
+                throw e;
+            }
+        }
+    });
+
+    const settled = await Promise.allSettled(runners);
+    if (controller.signal.aborted) throw controller.signal.reason;
+    if (signal) signal.throwIfAborted();
+    const failed = settled.find((runner): runner is PromiseRejectedResult => runner.status === 'rejected');
+    if (failed) throw failed.reason;
+    return results;
+};
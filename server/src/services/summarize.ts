@@ -0,0 +1,73 @@
+import { mapWithConcurrency } from './scheduler';
+import { Usage, emptyUsage, addUsage } from './transcription';
+import { ProgressCallback } from './progress';
+
+// Transcripts up to this size (estimated tokens) are summarized in a single call
+export const SUMMARY_CONTEXT_TOKENS = Number(process.env.SUMMARY_CONTEXT_TOKENS) || 60000;
+// Size of each section summarized in the map step
+const SUMMARY_SECTION_TOKENS = Number(process.env.SUMMARY_SECTION_TOKENS) || 12000;
+// Parallel map calls per transcript
+const SUMMARY_MAP_CONCURRENCY = Number(process.env.SUMMARY_MAP_CONCURRENCY) || 4;
+// Each round shrinks the text ~10x; this only guards against a model that doesn't condense
+const MAX_REDUCE_ROUNDS = 3;
+
+// Rough local estimate (~4 chars per token for PT/EN text), good enough for budgeting
+export const estimateTokens = (text: string) => Math.ceil(text.length / 4);
+
+// Splits text into sections of at most `maxTokens`, preferring paragraph and sentence boundaries
+export const splitByTokens = (text: string, maxTokens: number): string[] => {
+    const maxChars = maxTokens * 4;
+    const sentences = text.match(/[^.!?\n]*(?:[.!?]+|\n+|$)\s*/g) || [text];
+
+    const sections: string[] = [];
+    let current = '';
+    for (const sentence of sentences) {
+        if (current && current.length + sentence.length > maxChars) {
+            if (current.trim()) sections.push(current.trim());
+            current = '';
+        }
+        // A single run-on "sentence" longer than a section gets hard-split
+        for (let start = 0; start < sentence.length; start += maxChars) {
+            const piece = sentence.slice(start, start + maxChars);
+            if (current.length + piece.length > maxChars) {
+                if (current.trim()) sections.push(current.trim());
+                current = '';
+            }
+            current += piece;
+        }
+    }
+    if (current.trim()) sections.push(current.trim());
+    return sections;
+};
+
+// Map step of the hierarchical summarizer: while the text is over the context budget, it is split
+// into sections that are summarized in parallel, and the joined section summaries replace it.
+// The caller runs the reduce step (final structured analysis) on the returned text.
+export const condenseTranscript = async (
+    transcription: string,
+    summarizeSection: (section: string, index: number, total: number) => Promise<{ text: string, usage?: Partial<Usage> }>,
+    onProgress?: ProgressCallback
+): Promise<{ text: string, usage: Usage, rounds: number }> => {
+    let text = transcription;
+    let usage = emptyUsage();
+    let rounds = 0;
+
+    while (estimateTokens(text) > SUMMARY_CONTEXT_TOKENS && rounds < MAX_REDUCE_ROUNDS) {
+        const sections = splitByTokens(text, SUMMARY_SECTION_TOKENS);
+        let done = 0;
+        if (onProgress) onProgress(`Resumindo ${sections.length} partes do conteúdo...`);
+
+        const partials = await mapWithConcurrency(sections, SUMMARY_MAP_CONCURRENCY, async (section, index) => {
+            const partial = await summarizeSection(section, index, sections.length);
+            done++;
+            if (onProgress) onProgress(`Resumindo partes: ${done}/${sections.length}...`);
+            return partial;
+        });
+
+        usage = partials.reduce((total, partial) => addUsage(total, partial.usage), usage);
+        text = partials.map((partial, index) => `[Parte ${index + 1}/${sections.length}]\n${partial.text.trim()}`).join('\n\n');
+        rounds++;
+    }
+
+    return { text, usage, rounds };
+};
@@ -1,6 +1,7 @@
 
 import { createClient } from '@supabase/supabase-js';
 import dotenv from 'dotenv';
+import { LruCache } from './cache';
 
 dotenv.config();
 
@@ -46,96 +47,136 @@ export const calculateCost = (model: string, input: number, output: number, dura
     return textCost + audioCost;
 };
 
-export const saveProcessingResult = async (
+export interface ProcessingUsage {
+    provider: string;
+    model: string;
+    inputTokens: number;
+    outputTokens: number;
+    serviceType: string;
+    audioDuration?: number;
+}
+
+// Writes all four rows (video, transcription, summary, usage log) in one round-trip and one transaction.
+// Throws on failure; the write-behind queue retries it. Calls with the same `idempotencyKey` write once.
+export const persistProcessingResult = async (
     userId: string,
     videoUrl: string,
     transcription: string,
     summary: string,
     keyTopics: string[],
-    usageData: { provider: string, model: string, inputTokens: number, outputTokens: number, serviceType: string, audioDuration?: number }
-) => {
+    usageData: ProcessingUsage,
+    contentHash?: string,
+    idempotencyKey?: string
+): Promise<string> => {
     // Bypass for testing (ONLY in test environment)
     if (process.env.NODE_ENV === 'test' && userId === 'test-user-id') {
         console.log('Skipping Supabase save for test user');
-        return { success: true, videoId: 'test-video-id' };
+        return 'test-video-id';
     }
 
-    try {
-        // 1. Insert Video
-        const { data: videoData, error: videoError } = await supabase
-            .from('videos')
-            .insert({ user_id: userId, original_url: videoUrl })
-            .select()
-            .single();
-
-        if (videoError) throw videoError;
-
-        const videoId = videoData.id;
-
-        // 2. Insert Transcription
-        const { error: transError } = await supabase
-            .from('transcriptions')
-            .insert({ user_id: userId, video_id: videoId, content: transcription });
-
-        if (transError) throw transError;
-
-        // 3. Insert Summary
-        const { error: summaryError } = await supabase
-            .from('summaries')
-            .insert({
-                user_id: userId,
-                video_id: videoId,
-                content: summary,
-                key_topics: keyTopics
-            });
-
-        if (summaryError) throw summaryError;
-
-        // 4. Insert Usage Log
-        const totalTokens = usageData.inputTokens + usageData.outputTokens;
-        const cost = calculateCost(usageData.model, usageData.inputTokens, usageData.outputTokens, usageData.audioDuration || 0);
-
-        const { error: usageError } = await supabase
-            .from('usage_logs')
-            .insert({
-                user_id: userId,
-                video_id: videoId,
-                provider: usageData.provider,
-                model: usageData.model,
-                service_type: usageData.serviceType,
-                input_tokens: usageData.inputTokens,
-                output_tokens: usageData.outputTokens,
-                total_tokens: totalTokens,
-                cost_brl: cost
-            });
-
-        if (usageError) throw usageError;
-
-        return { success: true, videoId };
-
-    } catch (error) {
-        console.error("Error saving to Supabase:", error);
-        return { success: false, error };
-    }
+    const cost = calculateCost(usageData.model, usageData.inputTokens, usageData.outputTokens, usageData.audioDuration || 0);
+
+    const { data: videoId, error } = await supabase.rpc('save_processing_result', {
+        p_user_id: userId,
+        p_video_url: videoUrl,
+        p_transcription: transcription,
+        p_summary: summary,
+        p_key_topics: keyTopics,
+        p_provider: usageData.provider,
+        p_model: usageData.model,
+        p_service_type: usageData.serviceType,
+        p_input_tokens: usageData.inputTokens,
+        p_output_tokens: usageData.outputTokens,
+        p_cost_brl: cost,
+        p_content_hash: contentHash || null,
+        p_idempotency_key: idempotencyKey || null
+    });
+
+    if (error) throw error;
+    return videoId;
 };
 
-export async function getApiKey(provider: string, userId: string): Promise<string | null> {
-    // Bypass for testing (ONLY in test environment)
-    if (process.env.NODE_ENV === 'test' && userId === 'test-user-id') {
-        return 'TEST_API_KEY';
+// Most recent stored result for uploaded audio with this SHA-256, processed by `provider`
+export const findResultByContentHash = async (contentHash: string, provider: string) => {
+    const { data, error } = await supabase
+        .from('videos')
+        .select('transcriptions(content), summaries(content, key_topics), usage_logs(provider)')
+        .eq('content_hash', contentHash)
+        .order('created_at', { ascending: false })
+        .limit(10);
+
+    if (error) {
+        console.error('Content hash lookup failed:', error.message);
+        return null;
     }
 
+    for (const video of data || []) {
+        const transcription = video.transcriptions?.[0]?.content;
+        const summary = video.summaries?.[0];
+        const processedBy = (video.usage_logs || []).some((log: any) => log.provider === provider);
+        if (transcription && summary?.content && processedBy) {
+            return { transcription, summary: summary.content, key_topics: summary.key_topics || [] };
+        }
+    }
+    return null;
+};
+
+// Per-(user, provider) API key cache. "Not configured" is cached too, for a shorter time,
+// so users without a stored key don't cost a query per job either.
+const API_KEY_CACHE_TTL_MS = (Number(process.env.API_KEY_CACHE_TTL_SECONDS) || 300) * 1000;
+const API_KEY_NEGATIVE_TTL_MS = (Number(process.env.API_KEY_NEGATIVE_TTL_SECONDS) || 30) * 1000;
+
+const apiKeyCache = new LruCache<string | null>(Number(process.env.API_KEY_CACHE_MAX_ENTRIES) || 10000, API_KEY_CACHE_TTL_MS);
+// Lookups in progress, so concurrent jobs of the same user share one query
+const pendingApiKeyLookups = new Map<string, Promise<string | null>>();
+const apiKeyCacheCounters = { hits: 0, misses: 0 };
+
+const apiKeyCacheKey = (provider: string, userId: string) => `${userId}:${provider}`;
+
+export const getApiKeyCacheStats = () => ({ ...apiKeyCacheCounters, size: apiKeyCache.size, evictions: apiKeyCache.evictions });
+
+const fetchApiKey = async (provider: string, userId: string) => {
     const { data, error } = await supabase
         .from('api_keys')
         .select('key_value')
         .eq('user_id', userId)
         .eq('provider', provider)
-        .single();
+        .maybeSingle();
 
-    if (error || !data) {
-        return null;
+    return { key: error || !data ? null : data.key_value as string, failed: !!error };
+};
+
+export async function getApiKey(provider: string, userId: string): Promise<string | null> {
+    // Bypass for testing (ONLY in test environment)
+    if (process.env.NODE_ENV === 'test' && userId === 'test-user-id') {
+        return 'TEST_API_KEY';
+    }
+
+    const cacheKey = apiKeyCacheKey(provider, userId);
+    const cached = apiKeyCache.get(cacheKey);
+    if (cached !== undefined) {
+        apiKeyCacheCounters.hits++;
+        return cached;
     }
-    return data.key_value;
+
+    let pending = pendingApiKeyLookups.get(cacheKey);
+    if (!pending) {
+        apiKeyCacheCounters.misses++;
+        const lookup: Promise<string | null> = fetchApiKey(provider, userId).then(({ key, failed }) => {
+            // Query errors are not cached, and neither is a lookup that saveApiKey superseded
+            if (pendingApiKeyLookups.get(cacheKey) === lookup) {
+                pendingApiKeyLookups.delete(cacheKey);
+                if (!failed) apiKeyCache.set(cacheKey, key, key ? API_KEY_CACHE_TTL_MS : API_KEY_NEGATIVE_TTL_MS);
+            }
+            return key;
+        }, (error) => {
+            if (pendingApiKeyLookups.get(cacheKey) === lookup) pendingApiKeyLookups.delete(cacheKey);
+            throw error;
+        });
+        pending = lookup;
+        pendingApiKeyLookups.set(cacheKey, pending);
+    }
+    return pending;
 }
 
 export async function saveApiKey(provider: string, keyValue: string, userId: string): Promise<void> {
@@ -145,6 +186,11 @@ export async function saveApiKey(provider: string, keyValue: string, userId: str
         return;
     }
 
+    // Drop the cached key (and any lookup in flight, so it can't write back the old value)
+    const cacheKey = apiKeyCacheKey(provider, userId);
+    apiKeyCache.delete(cacheKey);
+    pendingApiKeyLookups.delete(cacheKey);
+
     const { error } = await supabase
         .from('api_keys')
         .upsert({ user_id: userId, provider, key_value: keyValue, updated_at: new Date() }, { onConflict: 'user_id,provider' });
@@ -0,0 +1,181 @@
+import path from 'path';
+import fs from 'fs';
+import os from 'os';
+import { splitAudio, getAudioDuration, removeFiles } from './audio';
+import { mapWithConcurrency, StageQueue } from './scheduler';
+import { ProgressCallback, createOrderedTextEmitter } from './progress';
+
+// Target chunk length; audio longer than ~1.2x this is transcribed in parallel chunks
+export const CHUNK_SECONDS = Number(process.env.TRANSCRIPTION_CHUNK_SECONDS) || 600;
+const CHUNK_OVERLAP_SECONDS = Number(process.env.TRANSCRIPTION_CHUNK_OVERLAP_SECONDS) || 3;
+const CHUNK_CONCURRENCY = Number(process.env.TRANSCRIPTION_CHUNK_CONCURRENCY) || 4;
+
+export interface Usage {
+    promptTokenCount: number;
+    candidatesTokenCount: number;
+    totalTokenCount: number;
+}
+
+export interface ChunkTranscript {
+    text: string;
+    // Billed audio seconds (Whisper)
+    duration?: number;
+    usage?: Partial<Usage>;
+}
+
+export const emptyUsage = (): Usage => ({ promptTokenCount: 0, candidatesTokenCount: 0, totalTokenCount: 0 });
+
+export const addUsage = (total: Usage, usage?: Partial<Usage>): Usage => ({
+    promptTokenCount: total.promptTokenCount + (usage?.promptTokenCount || 0),
+    candidatesTokenCount: total.candidatesTokenCount + (usage?.candidatesTokenCount || 0),
+    totalTokenCount: total.totalTokenCount + (usage?.totalTokenCount || 0),
+});
+
+// Chunk when the file is over the provider's upload limit or long enough to benefit from parallelism
+export const shouldChunk = async (audioPath: string, maxBytes: number = Infinity, signal?: AbortSignal): Promise<boolean> => {
+    if (fs.statSync(audioPath).size > maxBytes) return true;
+    try {
+        return (await getAudioDuration(audioPath, signal)) > CHUNK_SECONDS * 1.2;
+    } catch (e: any) {
+        if (signal && signal.aborted) throw e;
+        console.error('Could not probe audio duration, skipping chunking:', e.message);
+        return false;
+    }
+};
+
+const MIN_OVERLAP_WORDS = 3;
+const MAX_OVERLAP_WORDS = 80;
+// The first words of a chunk may be a partial word cut at the overlap start
+const MAX_PREFIX_SKIP = 6;
+
+const normalizeWord = (word: string) => word.toLowerCase().replace(/[^\p{L}\p{N}]/gu, '');
+
+// Number of leading words of `next` that repeat the end of `previous`
+const findOverlap = (previous: string[], next: string[]): number => {
+    const previousTail = previous.slice(-MAX_OVERLAP_WORDS).map(normalizeWord);
+    const nextHead = next.slice(0, MAX_OVERLAP_WORDS + MAX_PREFIX_SKIP).map(normalizeWord);
+
+    for (let size = Math.min(previousTail.length, MAX_OVERLAP_WORDS); size >= MIN_OVERLAP_WORDS; size--) {
+        const tail = previousTail.slice(-size).join(' ');
+        for (let skip = 0; skip <= MAX_PREFIX_SKIP && skip + size <= nextHead.length; skip++) {
+            if (nextHead.slice(skip, skip + size).join(' ') === tail) return skip + size;
+        }
+    }
+    return 0;
+};
+
+// Joins chunk transcripts, dropping the words each chunk repeats from the previous overlap
+export const stitchTranscripts = (parts: string[]): string => {
+    const seenWords: string[] = [];
+    const output: string[] = [];
+
+    for (const part of parts) {
+        // Odd indices are the whitespace separators, so paragraph breaks survive
+        const tokens = part.trim().split(/(\s+)/);
+        const words = tokens.filter((_, index) => index % 2 === 0 && tokens[index] !== '');
+        if (words.length === 0) continue;
+
+        const drop = seenWords.length ? findOverlap(seenWords, words) : 0;
+        const kept = tokens.slice(drop * 2).join('');
+        if (kept) output.push(kept);
+
+        seenWords.push(...words.slice(drop));
+    }
+
+    return output.join(' ');
+};
+
+// Splits audio at silences, transcribes the chunks with bounded concurrency and stitches the text back.
+// Chunks go to a directory of their own: the same (cached) audio may be chunked by several runs at once.
+export const transcribeInChunks = async (
+    audioPath: string,
+    transcribeChunk: (chunkPath: string, signal?: AbortSignal) => Promise<ChunkTranscript>,
+    onProgress?: ProgressCallback,
+    signal?: AbortSignal
+): Promise<ChunkTranscript & { usage: Usage, chunks: number }> => {
+    const chunkDir = await fs.promises.mkdtemp(path.join(os.tmpdir(), 'cognistream-chunks-'));
+    try {
+        return await transcribeChunks(audioPath, chunkDir, transcribeChunk, onProgress, signal);
+    } finally {
+        await fs.promises.rm(chunkDir, { recursive: true, force: true });
+    }
+};
+
+const transcribeChunks = async (
+    audioPath: string,
+    chunkDir: string,
+    transcribeChunk: (chunkPath: string, signal?: AbortSignal) => Promise<ChunkTranscript>,
+    onProgress?: ProgressCallback,
+    signal?: AbortSignal
+): Promise<ChunkTranscript & { usage: Usage, chunks: number }> => {
+    const chunks = await splitAudio(audioPath, chunkDir, CHUNK_SECONDS, CHUNK_OVERLAP_SECONDS, signal);
+    console.log(`Transcribing ${chunks.length} chunks (concurrency ${CHUNK_CONCURRENCY})`);
+    if (onProgress) onProgress(`Transcrevendo em ${chunks.length} partes...`);
+
+    const emitText = createOrderedTextEmitter(stitchTranscripts, (text) => {
+        if (onProgress) onProgress({ type: 'transcript.delta', text });
+    });
+
+    let completed = 0;
+    // A failed chunk stops the rest (and aborts the ones in flight) before chunkDir is removed
+    const parts = await mapWithConcurrency(chunks, CHUNK_CONCURRENCY, async (chunk, index, chunkSignal) => {
+        const part = await transcribeChunk(chunk.path, chunkSignal);
+        emitText(index, part.text);
+        completed++;
+        if (onProgress) onProgress(`Transcrevendo: ${completed}/${chunks.length} partes concluídas...`);
+        return part;
+    }, signal);
+
+    return {
+        text: stitchTranscripts(parts.map((part) => part.text)),
+        duration: parts.reduce((total, part) => total + (part.duration || 0), 0),
+        usage: parts.reduce((total, part) => addUsage(total, part.usage), emptyUsage()),
+        chunks: chunks.length,
+    };
+};
+
+// Fixed-length segments don't overlap, so they are simply concatenated
+const joinSegments = (parts: string[]) => parts.map((part) => part.trim()).filter(Boolean).join(' ');
+
+// Transcribes segments as they are produced (e.g. while the download is still running).
+// finish() waits for every segment added so far and joins them in order.
+export const createSegmentTranscriber = (
+    transcribeChunk: (chunkPath: string) => Promise<ChunkTranscript>,
+    onProgress?: ProgressCallback
+) => {
+    const limiter = new StageQueue('segmentos', CHUNK_CONCURRENCY, Infinity);
+    const parts: Promise<ChunkTranscript>[] = [];
+    let completed = 0;
+
+    const emitText = createOrderedTextEmitter(joinSegments, (text) => {
+        if (onProgress) onProgress({ type: 'transcript.delta', text });
+    });
+
+    const add = (segmentPath: string) => {
+        const index = parts.length;
+        const part = limiter.run(() => transcribeChunk(segmentPath))
+            .then((transcript) => {
+                emitText(index, transcript.text);
+                completed++;
+                if (onProgress) onProgress(`Transcrevendo: ${completed}/${parts.length} trechos concluídos...`);
+                return transcript;
+            })
+            .finally(() => removeFiles([segmentPath]));
+
+        // Failures are reported by finish()
+        part.catch(() => undefined);
+        parts.push(part);
+    };
+
+    const finish = async () => {
+        const results = await Promise.all(parts);
+        return {
+            text: joinSegments(results.map((part) => part.text)),
+            duration: results.reduce((total, part) => total + (part.duration || 0), 0),
+            usage: results.reduce((total, part) => addUsage(total, part.usage), emptyUsage()),
+            chunks: results.length,
+        };
+    };
+
+    return { add, finish };
+};
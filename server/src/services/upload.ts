@@ -0,0 +1,186 @@
+import { spawn } from 'child_process';
+import { Readable } from 'stream';
+import path from 'path';
+import fs from 'fs';
+import crypto from 'crypto';
+import busboy from 'busboy';
+import express from 'express';
+import { getAudioProfile, removeFiles } from './audio';
+
+const UPLOAD_MAX_BYTES = (Number(process.env.UPLOAD_MAX_MB) || 500) * 1024 * 1024;
+const UPLOAD_MAX_SECONDS = (Number(process.env.UPLOAD_MAX_MINUTES) || 180) * 60;
+// MP4-family containers usually keep their index at the end and can't be decoded from a pipe,
+// so these are written to disk first; everything else is transcoded while it is still arriving.
+const SEEKABLE_ONLY_EXTENSIONS = new Set(['.mp4', '.m4a', '.m4v', '.mov', '.3gp']);
+
+// Upload over the size/duration limits; mapped to HTTP 413
+export class UploadLimitError extends Error { }
+
+// Request that isn't a usable upload (not multipart, malformed body, no audio file, undecodable audio); mapped to HTTP 400
+export class InvalidUploadError extends Error { }
+
+export interface ReceivedUpload {
+    path: string;
+    // Already in the normalization profile (processAudio can skip that stage)
+    normalized: boolean;
+    fields: Record<string, string>;
+    filename: string;
+    // SHA-256 of the uploaded bytes, computed while streaming
+    sha256: string;
+    receivedBytes: number;
+    durationSeconds: number;
+}
+
+// Encodes `input` with the normalization profile, aborting once the decoded audio exceeds `maxSeconds`
+const transcode = (input: Readable | string, outputPath: string, args: string[], maxSeconds: number) => {
+    const ffmpeg = spawn('ffmpeg', [
+        '-hide_banner', '-nostdin', '-y', '-loglevel', 'error',
+        '-i', typeof input === 'string' ? input : 'pipe:0',
+        '-vn', '-map_metadata', '-1', ...args,
+        '-progress', 'pipe:1', '-nostats',
+        outputPath,
+    ], { shell: false });
+
+    let durationSeconds = 0;
+    let tooLong = false;
+    let stderr = '';
+
+    ffmpeg.stdout.on('data', (data) => {
+        const match = data.toString().match(/out_time_us=(\d+)/g);
+        if (!match) return;
+        durationSeconds = Number(match[match.length - 1].split('=')[1]) / 1e6;
+        if (durationSeconds > maxSeconds && !tooLong) {
+            tooLong = true;
+            ffmpeg.kill();
+        }
+    });
+    ffmpeg.stderr.on('data', (data) => {
+        stderr = (stderr + data.toString()).slice(-4000);
+    });
+
+    if (typeof input !== 'string') {
+        input.pipe(ffmpeg.stdin);
+        // ffmpeg closes stdin when it is killed or fails; the exit code reports it
+        ffmpeg.stdin.on('error', () => undefined);
+    }
+
+    const done = new Promise<number>((resolve, reject) => {
+        ffmpeg.on('error', reject);
+        ffmpeg.on('close', (code) => {
+            if (tooLong) reject(new UploadLimitError(`O áudio excede o limite de ${Math.round(maxSeconds / 60)} minutos`));
+            else if (code !== 0) reject(new InvalidUploadError(`ffmpeg could not decode the upload: ${stderr}`));
+            else resolve(durationSeconds);
+        });
+    });
+
+    return { done, kill: () => ffmpeg.kill() };
+};
+
+const writeToFile = (input: Readable, outputPath: string) => new Promise<void>((resolve, reject) => {
+    const output = fs.createWriteStream(outputPath);
+    input.on('error', reject);
+    output.on('error', reject);
+    output.on('finish', resolve);
+    input.pipe(output);
+});
+
+// Parses a multipart upload without staging it: the `audio` file part is piped into ffmpeg as it arrives,
+// so transcoding to the (much smaller) normalization profile overlaps the upload itself.
+// Size and duration limits are enforced while streaming.
+export const receiveAudioUpload = (req: express.Request, outputDir: string): Promise<ReceivedUpload> => {
+    return new Promise((resolve, reject) => {
+        let parser: ReturnType<typeof busboy>;
+        try {
+            parser = busboy({ headers: req.headers, limits: { files: 1, fields: 20, fileSize: UPLOAD_MAX_BYTES } });
+        } catch (e: any) {
+            return reject(new InvalidUploadError(`Invalid upload: ${e.message}`));
+        }
+
+        const fields: Record<string, string> = {};
+        const base = path.join(outputDir, `${Date.now()}_${crypto.randomBytes(4).toString('hex')}_upload`);
+        const createdFiles: string[] = [];
+        let fileTask: Promise<Omit<ReceivedUpload, 'fields' | 'filename' | 'sha256'>> | null = null;
+        const hash = crypto.createHash('sha256');
+        let filename = '';
+        let abort: (() => void) | null = null;
+        let failed = false;
+
+        const fail = (error: Error) => {
+            if (failed) return;
+            failed = true;
+            if (abort) abort();
+            req.unpipe(parser);
+            req.resume(); // drain the rest of the body so the error response can be sent
+            // Let ffmpeg exit before deleting what it wrote
+            (fileTask || Promise.resolve()).catch(() => undefined).finally(() => removeFiles(createdFiles));
+            reject(error);
+        };
+
+        parser.on('field', (name: string, value: string) => {
+            fields[name] = value;
+        });
+
+        parser.on('file', (name: string, stream: Readable, info: { filename?: string }) => {
+            if (name !== 'audio' || fileTask) {
+                stream.resume();
+                return;
+            }
+
+            filename = info.filename || 'upload';
+            let receivedBytes = 0;
+            stream.on('data', (chunk: Buffer) => {
+                receivedBytes += chunk.length;
+                hash.update(chunk);
+            });
+            stream.on('limit', () => fail(new UploadLimitError(`O arquivo excede o limite de ${Math.round(UPLOAD_MAX_BYTES / 1024 / 1024)} MB`)));
+
+            const ext = path.extname(info.filename || '').toLowerCase();
+            const profile = getAudioProfile();
+
+            fileTask = (async () => {
+                if (!profile) {
+                    // Normalization disabled: keep the original bytes
+                    const rawPath = `${base}${ext || '.mp3'}`;
+                    createdFiles.push(rawPath);
+                    await writeToFile(stream, rawPath);
+                    return { path: rawPath, normalized: false, receivedBytes, durationSeconds: 0 };
+                }
+
+                const outputPath = `${base}${profile.ext}`;
+                createdFiles.push(outputPath);
+
+                let input: Readable | string = stream;
+                if (SEEKABLE_ONLY_EXTENSIONS.has(ext)) {
+                    const stagedPath = `${base}_source${ext}`;
+                    createdFiles.push(stagedPath);
+                    await writeToFile(stream, stagedPath);
+                    if (failed) throw new Error('Upload aborted');
+                    input = stagedPath;
+                }
+
+                const job = transcode(input, outputPath, profile.args, UPLOAD_MAX_SECONDS);
+                abort = job.kill;
+                const durationSeconds = await job.done;
+                if (typeof input === 'string') removeFiles([input]);
+
+                return { path: outputPath, normalized: true, receivedBytes, durationSeconds };
+            })();
+            fileTask.catch((e) => fail(e));
+        });
+
+        parser.on('error', (e: Error) => fail(new InvalidUploadError(`Invalid upload: ${e.message}`)));
+        parser.on('close', async () => {
+            if (failed) return;
+            if (!fileTask) return fail(new InvalidUploadError('No file uploaded'));
+            try {
+                const file = await fileTask;
+                if (!failed) resolve({ ...file, fields, filename, sha256: hash.digest('hex') });
+            } catch (e: any) {
+                fail(e);
+            }
+        });
+
+        req.on('aborted', () => fail(new Error('Upload aborted by client')));
+        req.pipe(parser);
+    });
+};
@@ -1,6 +1,10 @@
 import { spawn } from 'child_process';
 import path from 'path';
 import fs from 'fs';
+import crypto from 'crypto';
+import { getAudioProfile, runFfmpeg, removeFiles } from './audio';
+import { runWorkerJob, isWorkerEnabled, WorkerUnavailableError } from './ytdlp';
+import { downloadWithRanges, prunePartialDownloads } from './download';
 
 // Helper to find yt-dlp binary
 const getYtDlpPath = () => {
@@ -15,37 +19,265 @@ const getYtDlpPath = () => {
     return 'yt-dlp'; // Fallback to global path
 };
 
-export const extractAudio = async (videoUrl: string, outputDir: string, onProgress?: (status: string) => void): Promise<string> => {
+const YOUTUBE_HOST_PATTERN = /(^|\.)(youtube\.com|youtube-nocookie\.com|youtu\.be)$/i;
+const VIDEO_ID_PATTERN = /^[A-Za-z0-9_-]{11}$/;
+// Query params that never change the content (timestamps, share/tracking ids)
+const IGNORED_PARAM_PATTERN = /^(utm_.*|t|start|si|feature|fbclid|gclid|pp|ab_channel|list|index)$/i;
+
+// Extracts the 11-char YouTube video ID from watch, youtu.be, shorts, embed and live URLs
+export const getVideoId = (videoUrl: string): string | null => {
+    let parsed: URL;
+    try {
+        parsed = new URL(videoUrl.trim());
+    } catch {
+        return null;
+    }
+
+    const host = parsed.hostname.toLowerCase();
+    if (!YOUTUBE_HOST_PATTERN.test(host)) return null;
+
+    let candidate: string | null = null;
+    if (host === 'youtu.be') {
+        candidate = parsed.pathname.split('/')[1] || null;
+    } else if (parsed.searchParams.get('v')) {
+        candidate = parsed.searchParams.get('v');
+    } else {
+        const match = parsed.pathname.match(/^\/(?:shorts|embed|live|v|e)\/([^/]+)/);
+        if (match) candidate = match[1];
+    }
+
+    return candidate && VIDEO_ID_PATTERN.test(candidate) ? candidate : null;
+};
+
+// Canonical key for a video URL, so different links to the same video share cache entries.
+// Non-YouTube URLs (other yt-dlp extractors) fall back to the URL without fragment and tracking params.
+export const getCanonicalVideoKey = (videoUrl: string): string => {
+    const videoId = getVideoId(videoUrl);
+    if (videoId) return `youtube:${videoId}`;
+
+    try {
+        const parsed = new URL(videoUrl.trim());
+        parsed.protocol = 'https:';
+        parsed.hash = '';
+        parsed.hostname = parsed.hostname.toLowerCase().replace(/^(www|m)\./, '');
+        for (const name of Array.from(parsed.searchParams.keys())) {
+            if (IGNORED_PARAM_PATTERN.test(name)) parsed.searchParams.delete(name);
+        }
+        parsed.searchParams.sort();
+        return `url:${parsed.toString()}`;
+    } catch {
+        return `url:${videoUrl.trim()}`;
+    }
+};
+
+const COMMON_ARGS = [
+    '--no-playlist',
+    // Fixes for bot detection
+    '--js-runtimes', 'node',
+    '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+];
+
+export interface AudioFormat {
+    formatId: string;
+    ext: string;
+    acodec: string;
+    // kbit/s
+    abr: number;
+    bytes: number;
+}
+
+// Direct URL of the stream PASSTHROUGH_FORMAT selects, so the range engine can skip a second extraction
+export interface AudioSource {
+    formatId: string;
+    ext: string;
+    acodec: string;
+    url: string;
+    httpHeaders: Record<string, string>;
+    // The signed URL stops working after this (ms epoch)
+    expiresAt: number;
+}
+
+export interface VideoMetadata {
+    id: string;
+    title: string;
+    durationSeconds: number;
+    isLive: boolean;
+    audioFormats: AudioFormat[];
+    // Size of the audio stream extractAudio would download
+    estimatedAudioBytes: number;
+    audioSource?: AudioSource;
+}
+
+// Stream URLs without an `expire` param are trusted for this long after the lookup
+const AUDIO_SOURCE_DEFAULT_TTL_MS = 60 * 60 * 1000;
+// A URL this close to expiring is fetched again rather than risk it failing mid-download
+const AUDIO_SOURCE_MIN_REMAINING_MS = 30 * 60 * 1000;
+
+const toAudioSource = (format: any): AudioSource | undefined => {
+    if (!format || !format.url || !/^https?$/.test(format.protocol || '')) return undefined;
+    let expiresAt = Date.now() + AUDIO_SOURCE_DEFAULT_TTL_MS;
+    try {
+        const expire = Number(new URL(format.url).searchParams.get('expire'));
+        if (expire) expiresAt = expire * 1000;
+    } catch {
+        return undefined;
+    }
+    return {
+        formatId: String(format.format_id),
+        ext: format.ext,
+        acodec: String(format.acodec || ''),
+        url: format.url,
+        httpHeaders: format.http_headers || {},
+        expiresAt,
+    };
+};
+
+const toVideoMetadata = (info: any): VideoMetadata => {
+    const durationSeconds = Number(info.duration) || 0;
+    const rawFormats = (info.formats || [])
+        .filter((format: any) => format.acodec && format.acodec !== 'none' && (!format.vcodec || format.vcodec === 'none'));
+    const audioFormats: AudioFormat[] = rawFormats.map((format: any) => {
+        const abr = Number(format.abr || format.tbr) || 0;
+        return {
+            formatId: String(format.format_id),
+            ext: format.ext,
+            acodec: format.acodec,
+            abr,
+            bytes: Number(format.filesize || format.filesize_approx) || Math.round(abr * 1000 / 8 * durationSeconds),
+        };
+    });
+
+    // Mirrors PASSTHROUGH_FORMAT: best Opus stream, else best m4a, else best audio-only stream
+    const byBitrate = (a: AudioFormat, b: AudioFormat) => b.abr - a.abr;
+    const chosen = audioFormats.filter((format) => format.acodec.startsWith('opus')).sort(byBitrate)[0]
+        || audioFormats.filter((format) => format.ext === 'm4a').sort(byBitrate)[0]
+        || [...audioFormats].sort(byBitrate)[0];
+
+    return {
+        id: String(info.id || ''),
+        title: info.title || '',
+        durationSeconds,
+        isLive: !!info.is_live,
+        audioFormats,
+        // No audio-only stream: assume a 128 kbit/s track inside the muxed file
+        estimatedAudioBytes: chosen ? chosen.bytes : Math.round(128 * 1000 / 8 * durationSeconds),
+        audioSource: chosen ? toAudioSource(rawFormats[audioFormats.indexOf(chosen)]) : undefined,
+    };
+};
+
+const spawnMetadataRequest = (videoUrl: string, args: string[], signal?: AbortSignal): Promise<any> => new Promise((resolve, reject) => {
+    const ytDlpProcess = spawn(getYtDlpPath(), [videoUrl, '--dump-single-json', ...args], { shell: false, signal });
+
+    const chunks: Buffer[] = [];
+    let stderrOutput = '';
+    ytDlpProcess.stdout.on('data', (data: Buffer) => chunks.push(data));
+    ytDlpProcess.stderr.on('data', (data) => {
+        stderrOutput = (stderrOutput + data.toString()).slice(-4000);
+    });
+    ytDlpProcess.on('error', (e) => reject(signal && signal.aborted ? signal.reason : e));
+
+    ytDlpProcess.on('close', (code) => {
+        if (code !== 0) {
+            if (signal && signal.aborted) return reject(signal.reason);
+            return reject(new Error(`yt-dlp metadata request exited with code ${code}. Error details: ${stderrOutput}`));
+        }
+        try {
+            resolve(JSON.parse(Buffer.concat(chunks).toString('utf8')));
+        } catch (e: any) {
+            reject(new Error(`Invalid yt-dlp metadata: ${e.message}`));
+        }
+    });
+});
+
+// yt-dlp info dict for `videoUrl` (no media download), from the worker when it is available
+const requestInfo = async (videoUrl: string, args: string[], signal?: AbortSignal): Promise<any> => {
+    if (isWorkerEnabled()) {
+        try {
+            return await runWorkerJob({ op: 'info', url: videoUrl, args }, getYtDlpPath(), undefined, signal);
+        } catch (e: any) {
+            if (!(e instanceof WorkerUnavailableError)) throw e;
+            console.error('yt-dlp worker unavailable, spawning yt-dlp:', e.message);
+        }
+    }
+    return spawnMetadataRequest(videoUrl, args, signal);
+};
+
+// Metadata only (never downloads media): duration, live status and the available audio formats
+export const fetchVideoMetadata = async (videoUrl: string): Promise<VideoMetadata> =>
+    toVideoMetadata(await requestInfo(videoUrl, ['--no-warnings', ...COMMON_ARGS]));
+
+// Passthrough keeps the source audio stream (remux only); `AUDIO_PASSTHROUGH=false` restores the mp3 transcode
+const AUDIO_PASSTHROUGH = process.env.AUDIO_PASSTHROUGH !== 'false';
+// Opus first (smallest, and Ogg is accepted by both providers), then AAC in m4a
+const PASSTHROUGH_FORMAT = 'bestaudio[acodec=opus]/bestaudio[ext=m4a]/bestaudio/best';
+// Containers both providers take as-is; anything else is transcoded to mp3
+const PASSTHROUGH_EXTENSIONS = new Set(['.ogg', '.m4a', '.webm', '.mp3', '.wav', '.flac']);
+
+const extractionCounters = { passthrough: 0, transcoded: 0, ranged: 0, sourceReused: 0 };
+
+export const getExtractionStats = () => ({ enabled: AUDIO_PASSTHROUGH, ...extractionCounters });
+
+// Finds what yt-dlp wrote for `${timestamp}.%(ext)s` and makes sure the providers accept its container
+const resolveDownloadedAudio = async (outputDir: string, timestamp: number, signal?: AbortSignal): Promise<string | null> => {
+    const name = (await fs.promises.readdir(outputDir))
+        .find((file) => file.startsWith(`${timestamp}.`) && !/\.(part|ytdl|temp)$/.test(file));
+    if (!name) return null;
+
+    const downloadedPath = path.join(outputDir, name);
+    const ext = path.extname(name).toLowerCase();
+
+    // Opus extracted from webm lands in an Ogg container named .opus, which Whisper rejects by name
+    if (ext === '.opus') {
+        const oggPath = path.join(outputDir, `${timestamp}.ogg`);
+        await fs.promises.rename(downloadedPath, oggPath);
+        extractionCounters.passthrough++;
+        return oggPath;
+    }
+    if (PASSTHROUGH_EXTENSIONS.has(ext)) {
+        if (AUDIO_PASSTHROUGH) extractionCounters.passthrough++;
+        else extractionCounters.transcoded++;
+        return downloadedPath;
+    }
+
+    const mp3Path = path.join(outputDir, `${timestamp}.mp3`);
+    await runFfmpeg(['-i', downloadedPath, '-vn', '-c:a', 'libmp3lame', '-q:a', '4', mp3Path], signal);
+    removeFiles([downloadedPath]);
+    extractionCounters.transcoded++;
+    return mp3Path;
+};
+
+// Runs the download in the persistent worker; progress arrives as structured events
+const extractInWorker = async (videoUrl: string, args: string[], onProgress?: (status: string) => void, signal?: AbortSignal) => {
+    let lastPercent = -1;
+    await runWorkerJob({ op: 'download', url: videoUrl, args }, getYtDlpPath(), (event) => {
+        if (!onProgress) return;
+        if (event.event === 'progress' && event.status === 'downloading' && event.percent !== null) {
+            // Whole percents are enough for the client
+            if (Math.floor(event.percent) === lastPercent) return;
+            lastPercent = Math.floor(event.percent);
+            onProgress(`Baixando: ${event.percent.toFixed(1)}%...`);
+        } else if (event.event === 'postprocess' && event.status === 'started' && event.postprocessor === 'ExtractAudio') {
+            onProgress('Extraindo áudio...');
+        }
+    }, signal);
+};
+
+const spawnExtract = (videoUrl: string, args: string[], onProgress?: (status: string) => void, signal?: AbortSignal): Promise<void> => {
     return new Promise((resolve, reject) => {
-        const timestamp = Date.now();
-        const outputTemplate = path.join(outputDir, `${timestamp}.%(ext)s`);
         const binaryPath = getYtDlpPath();
-
         console.log(`Using yt-dlp binary at: "${binaryPath}"`);
-        if (onProgress) onProgress('Iniciando download do áudio...');
 
-        const args = [
-            videoUrl,
-            '--extract-audio',
-            '--audio-format', 'mp3',
-            '--output', outputTemplate,
-            '--no-playlist',
-            // Fixes for bot detection
-            '--js-runtimes', 'node',
-            '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        ];
-
-        const ytDlpProcess = spawn(binaryPath, args, {
-            shell: false
+        const ytDlpProcess = spawn(binaryPath, [videoUrl, ...args], {
+            shell: false,
+            signal
         });
 
+        // Only the tail of stderr is kept for the error message
         let stderrOutput = '';
-        let stdoutOutput = '';
 
         ytDlpProcess.stdout.on('data', (data) => {
             const output = data.toString();
             console.log(`yt-dlp out: ${output}`);
-            stdoutOutput += output;
 
             // Parse progress from yt-dlp output
             if (onProgress) {
@@ -61,25 +293,252 @@ export const extractAudio = async (videoUrl: string, outputDir: string, onProgre
 
         ytDlpProcess.stderr.on('data', (data) => {
             console.error(`yt-dlp err: ${data}`);
-            stderrOutput += data.toString();
+            stderrOutput = (stderrOutput + data.toString()).slice(-4000);
         });
 
         ytDlpProcess.on('close', (code) => {
             if (code === 0) {
-                const expectedPath = path.join(outputDir, `${timestamp}.mp3`);
-                if (fs.existsSync(expectedPath)) {
-                    if (onProgress) onProgress('Download concluído.');
-                    resolve(expectedPath);
-                } else {
-                    reject(new Error('Download success but file not found'));
-                }
+                resolve();
+            } else if (signal && signal.aborted) {
+                reject(signal.reason);
             } else {
                 reject(new Error(`yt-dlp process exited with code ${code}. Error details: ${stderrOutput}`));
             }
         });
 
         ytDlpProcess.on('error', (err) => {
-            reject(err);
+            reject(signal && signal.aborted ? signal.reason : err);
+        });
+    });
+};
+
+// Range mode: the selected audio stream is fetched by download.ts in concurrent fragments and kept under
+// partial/ by video ID, so a failed or interrupted download resumes on the next attempt.
+// The stream URL comes from the preflight metadata when it is still fresh, so the download costs no extra
+// extraction. `RANGE_DOWNLOAD=false` leaves the whole download to yt-dlp.
+const RANGE_DOWNLOAD = process.env.RANGE_DOWNLOAD !== 'false';
+const PARTIAL_MAX_AGE_MS = (Number(process.env.PARTIAL_DOWNLOAD_TTL_HOURS) || 24) * 60 * 60 * 1000;
+let partialPruneTimer: NodeJS.Timeout | null = null;
+
+// Downloads the passthrough audio stream with range requests, then remuxes it into the job's file.
+// Returns null when the selected format isn't a single plain HTTP stream (HLS/DASH fragments), which yt-dlp handles.
+const extractWithRanges = async (videoUrl: string, outputDir: string, timestamp: number, metadata?: VideoMetadata, onProgress?: (status: string) => void, signal?: AbortSignal): Promise<string | null> => {
+    let source = metadata && metadata.audioSource;
+    if (source && source.expiresAt - Date.now() > AUDIO_SOURCE_MIN_REMAINING_MS) {
+        extractionCounters.sourceReused++;
+    } else {
+        const info = await requestInfo(videoUrl, ['--format', PASSTHROUGH_FORMAT, '--no-warnings', ...COMMON_ARGS], signal);
+        if (info.requested_formats) return null;
+        source = toAudioSource(info);
+        if (!source) return null;
+    }
+
+    const partialDir = path.join(outputDir, 'partial');
+    await fs.promises.mkdir(partialDir, { recursive: true });
+    if (!partialPruneTimer) {
+        partialPruneTimer = setInterval(() => prunePartialDownloads(partialDir, PARTIAL_MAX_AGE_MS), 60 * 60 * 1000);
+        partialPruneTimer.unref();
+    }
+
+    // Same video + format -> same partial file, whichever link or attempt asks for it
+    const videoKey = crypto.createHash('sha1').update(getCanonicalVideoKey(videoUrl)).digest('hex').slice(0, 16);
+    const formatId = (source.formatId || 'audio').replace(/[^A-Za-z0-9_-]/g, '');
+    const rawPath = path.join(partialDir, `${videoKey}_${formatId}.${source.ext}`);
+
+    let lastPercent = -1;
+    await downloadWithRanges(source.url, rawPath, {
+        headers: source.httpHeaders,
+        onProgress: (downloaded, total) => {
+            const percent = Math.floor(downloaded / total * 100);
+            if (!onProgress || percent === lastPercent) return;
+            lastPercent = percent;
+            onProgress(`Baixando: ${percent}%...`);
+        },
+        signal,
+    });
+
+    // Opus in WebM: copy the stream into Ogg, which both providers accept (no re-encode)
+    if (source.ext === 'webm' && source.acodec.startsWith('opus')) {
+        if (onProgress) onProgress('Extraindo áudio...');
+        const oggPath = path.join(outputDir, `${timestamp}.ogg`);
+        try {
+            await runFfmpeg(['-i', rawPath, '-vn', '-map_metadata', '-1', '-c:a', 'copy', oggPath], signal);
+        } finally {
+            removeFiles([rawPath]);
+        }
+        extractionCounters.passthrough++;
+        return oggPath;
+    }
+
+    await fs.promises.rename(rawPath, path.join(outputDir, `${timestamp}.${source.ext}`));
+    return resolveDownloadedAudio(outputDir, timestamp, signal);
+};
+
+// Whatever a failed or cancelled job left under its `${timestamp}.*` name (.part files, unfinished remuxes)
+const removeJobFiles = async (outputDir: string, timestamp: number) => {
+    const names = await fs.promises.readdir(outputDir).catch(() => [] as string[]);
+    removeFiles(names.filter((file) => file.startsWith(`${timestamp}.`)).map((file) => path.join(outputDir, file)));
+};
+
+// Aborting `signal` kills yt-dlp/ffmpeg (or cancels the worker job) and removes the job's files.
+// `metadata` is the preflight's, when the job has one.
+export const extractAudio = async (videoUrl: string, outputDir: string, onProgress?: (status: string) => void, signal?: AbortSignal, metadata?: VideoMetadata): Promise<string> => {
+    const timestamp = Date.now();
+    try {
+        return await runExtraction(videoUrl, outputDir, timestamp, metadata, onProgress, signal);
+    } catch (e) {
+        await removeJobFiles(outputDir, timestamp);
+        throw e;
+    }
+};
+
+const runExtraction = async (videoUrl: string, outputDir: string, timestamp: number, metadata?: VideoMetadata, onProgress?: (status: string) => void, signal?: AbortSignal): Promise<string> => {
+    const outputTemplate = path.join(outputDir, `${timestamp}.%(ext)s`);
+
+    if (onProgress) onProgress('Iniciando download do áudio...');
+
+    // With `--audio-format best` yt-dlp stream-copies known codecs into their audio container
+    // and only transcodes (to mp3) the ones it can't copy
+    const args = [
+        ...(AUDIO_PASSTHROUGH
+            ? ['--format', PASSTHROUGH_FORMAT, '--extract-audio', '--audio-format', 'best']
+            : ['--extract-audio', '--audio-format', 'mp3']),
+        '--output', outputTemplate,
+        // Parallel fragment downloads for HLS/DASH formats
+        '--concurrent-fragments', String(Number(process.env.DOWNLOAD_CONCURRENCY) || 4),
+        ...COMMON_ARGS,
+    ];
+
+    if (RANGE_DOWNLOAD && AUDIO_PASSTHROUGH) {
+        try {
+            const audioPath = await extractWithRanges(videoUrl, outputDir, timestamp, metadata, onProgress, signal);
+            if (audioPath) {
+                extractionCounters.ranged++;
+                if (onProgress) onProgress('Download concluído.');
+                return audioPath;
+            }
+        } catch (e: any) {
+            if (signal && signal.aborted) throw e;
+            // The partial file stays for the next attempt; this one falls back to yt-dlp's own downloader
+            console.error('Range download failed, falling back to yt-dlp:', e.message);
+        }
+    }
+
+    let inWorker = false;
+    if (isWorkerEnabled()) {
+        try {
+            await extractInWorker(videoUrl, args, onProgress, signal);
+            inWorker = true;
+        } catch (e: any) {
+            if (!(e instanceof WorkerUnavailableError)) throw e;
+            console.error('yt-dlp worker unavailable, spawning yt-dlp:', e.message);
+        }
+    }
+    if (!inWorker) await spawnExtract(videoUrl, args, onProgress, signal);
+
+    const audioPath = await resolveDownloadedAudio(outputDir, timestamp, signal);
+    if (!audioPath) throw new Error('Download success but file not found');
+    if (onProgress) onProgress('Download concluído.');
+    return audioPath;
+};
+
+// Streaming mode: yt-dlp writes the audio to stdout and ffmpeg cuts it into fixed-length segments.
+// ffmpeg lists each segment on its stdout once the segment is closed, so `onSegment` fires while
+// the download is still in progress. Resolves with all segment paths when both processes exit.
+// Aborting `signal` kills both processes; segments already handed to `onSegment` belong to the caller.
+export const extractAudioSegments = async (
+    videoUrl: string,
+    outputDir: string,
+    segmentSeconds: number,
+    onSegment: (segmentPath: string) => void,
+    onProgress?: (status: string) => void,
+    signal?: AbortSignal
+): Promise<string[]> => {
+    return new Promise((resolve, reject) => {
+        const prefix = path.join(outputDir, `${Date.now()}_seg`);
+        const binaryPath = getYtDlpPath();
+        // Segments are encoded straight to the normalization profile (mono mp3 if it is disabled)
+        const profile = getAudioProfile() || { ext: '.mp3', args: ['-ac', '1', '-c:a', 'libmp3lame', '-b:a', '64k'] };
+
+        if (onProgress) onProgress('Iniciando download do áudio (modo contínuo)...');
+
+        const ytDlpProcess = spawn(binaryPath, [
+            videoUrl,
+            '--format', 'bestaudio/best',
+            '--output', '-',
+            '--quiet', '--progress', '--newline',
+            ...COMMON_ARGS,
+        ], { shell: false, signal });
+
+        const ffmpegProcess = spawn('ffmpeg', [
+            '-hide_banner', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-vn', ...profile.args,
+            '-f', 'segment',
+            '-segment_time', String(segmentSeconds),
+            '-segment_list', 'pipe:1',
+            '-segment_list_type', 'flat',
+            `${prefix}%03d${profile.ext}`,
+        ], { shell: false, signal });
+
+        ytDlpProcess.stdout.pipe(ffmpegProcess.stdin);
+        // ffmpeg may close stdin early on error; the exit code reports it
+        ffmpegProcess.stdin.on('error', () => undefined);
+
+        const segments: string[] = [];
+        let listBuffer = '';
+        ffmpegProcess.stdout.on('data', (data) => {
+            listBuffer += data.toString();
+            const lines = listBuffer.split('\n');
+            listBuffer = lines.pop() || '';
+            for (const line of lines) {
+                const name = line.trim();
+                if (!name) continue;
+                const segmentPath = path.isAbsolute(name) ? name : path.join(outputDir, path.basename(name));
+                segments.push(segmentPath);
+                if (onProgress) onProgress(`Trecho ${segments.length} baixado, transcrevendo...`);
+                onSegment(segmentPath);
+            }
+        });
+
+        let ytDlpError = '';
+        let ffmpegError = '';
+        ytDlpProcess.stderr.on('data', (data) => {
+            const output = data.toString();
+            ytDlpError = (ytDlpError + output).slice(-4000);
+            const match = output.match(/\[download\]\s+(\d+\.?\d*%)/);
+            if (match && onProgress) onProgress(`Baixando: ${match[1]}...`);
+        });
+        ffmpegProcess.stderr.on('data', (data) => {
+            ffmpegError = (ffmpegError + data.toString()).slice(-4000);
+        });
+
+        const exitCode = (child: typeof ytDlpProcess) => new Promise<number | null>((done) => child.on('close', done));
+        // Cancellation is reported once both processes are gone (below)
+        ytDlpProcess.on('error', (e) => signal && signal.aborted ? undefined : reject(e));
+        ffmpegProcess.on('error', (e) => signal && signal.aborted ? undefined : reject(e));
+
+        // If ffmpeg dies there is no point in downloading the rest
+        ffmpegProcess.on('close', (code) => {
+            if (code !== 0) ytDlpProcess.kill();
+        });
+
+        Promise.all([exitCode(ytDlpProcess), exitCode(ffmpegProcess)]).then(async ([ytDlpCode, ffmpegCode]) => {
+            if (signal && signal.aborted) {
+                // The segment ffmpeg was still writing
+                const names = await fs.promises.readdir(outputDir).catch(() => [] as string[]);
+                removeFiles(names
+                    .map((file) => path.join(outputDir, file))
+                    .filter((file) => file.startsWith(prefix) && !segments.includes(file)));
+                reject(signal.reason);
+            } else if (ffmpegCode !== 0) {
+                reject(new Error(`ffmpeg segmenter exited with code ${ffmpegCode}: ${ffmpegError}`));
+            } else if (ytDlpCode !== 0) {
+                reject(new Error(`yt-dlp process exited with code ${ytDlpCode}. Error details: ${ytDlpError}`));
+            } else {
+                if (onProgress) onProgress('Download concluído.');
+                resolve(segments);
+            }
         });
     });
 };
@@ -0,0 +1,161 @@
+import net from 'net';
+import os from 'os';
+import path from 'path';
+import { spawn, ChildProcess } from 'child_process';
+
+// Persistent yt-dlp worker (sidecar/ytdlp_worker.py). `YTDLP_WORKER=false` spawns yt-dlp per job instead.
+const WORKER_ENABLED = process.env.YTDLP_WORKER !== 'false';
+const WORKER_CONCURRENCY = Number(process.env.YTDLP_WORKER_CONCURRENCY) || 4;
+const WORKER_PYTHON = process.env.YTDLP_WORKER_PYTHON || 'python3';
+const WORKER_SCRIPT = path.join(__dirname, '../../sidecar/ytdlp_worker.py');
+const WORKER_SOCKET = path.join(os.tmpdir(), `cognistream-ytdlp-${process.pid}.sock`);
+const WORKER_START_TIMEOUT_MS = 30 * 1000;
+// After a failed start, jobs use the spawn path for this long before the worker is tried again
+const WORKER_RETRY_MS = 60 * 1000;
+
+export interface WorkerRequest {
+    op: 'download' | 'info';
+    url: string;
+    // yt-dlp CLI options, without the URL
+    args: string[];
+}
+
+export interface WorkerEvent {
+    event: 'started' | 'progress' | 'postprocess';
+    [field: string]: any;
+}
+
+// The worker can't take the job (not running, failed to start, died mid-job); the caller should spawn yt-dlp
+export class WorkerUnavailableError extends Error { }
+
+let worker: ChildProcess | null = null;
+let workerReady: Promise<void> | null = null;
+let workerFailedAt = 0;
+const workerCounters = { jobs: 0, failedJobs: 0, cancelledJobs: 0, starts: 0, startFailures: 0, lastStartMs: 0, warmJobs: 0, totalQueuedMs: 0 };
+
+export const isWorkerEnabled = () => WORKER_ENABLED && Date.now() - workerFailedAt > WORKER_RETRY_MS;
+
+const startWorker = (ytDlpPath: string) => new Promise<void>((resolve, reject) => {
+    const started = Date.now();
+    const child = spawn(WORKER_PYTHON, [
+        WORKER_SCRIPT,
+        '--socket', WORKER_SOCKET,
+        '--concurrency', String(WORKER_CONCURRENCY),
+        ...(path.isAbsolute(ytDlpPath) ? ['--yt-dlp', ytDlpPath] : []),
+    ], { shell: false, stdio: ['pipe', 'pipe', 'pipe'] });
+    worker = child;
+    workerCounters.starts++;
+
+    let stderr = '';
+    let ready = false;
+    const timer = setTimeout(() => {
+        child.kill();
+        reject(new Error('yt-dlp worker did not become ready'));
+    }, WORKER_START_TIMEOUT_MS);
+
+    child.stdout!.on('data', (data) => {
+        if (ready || !data.toString().includes('"ready"')) return;
+        ready = true;
+        clearTimeout(timer);
+        workerCounters.lastStartMs = Date.now() - started;
+        console.log(`yt-dlp worker ready in ${workerCounters.lastStartMs}ms`);
+        resolve();
+    });
+    child.stderr!.on('data', (data) => {
+        stderr = (stderr + data.toString()).slice(-4000);
+    });
+    child.on('error', (e) => {
+        clearTimeout(timer);
+        reject(e);
+    });
+    child.on('close', (code) => {
+        clearTimeout(timer);
+        if (worker === child) {
+            worker = null;
+            workerReady = null;
+        }
+        if (!ready) reject(new Error(`yt-dlp worker exited with code ${code}: ${stderr}`));
+        else console.error(`yt-dlp worker exited with code ${code}: ${stderr}`);
+    });
+});
+
+// Starts the worker on first use and after it dies; concurrent callers wait for the same start
+const ensureWorker = async (ytDlpPath: string) => {
+    if (!workerReady) {
+        workerReady = startWorker(ytDlpPath).catch((e) => {
+            workerCounters.startFailures++;
+            workerFailedAt = Date.now();
+            workerReady = null;
+            if (worker) worker.kill();
+            throw new WorkerUnavailableError(`yt-dlp worker failed to start: ${e.message}`);
+        });
+    }
+    await workerReady;
+};
+
+// Runs one yt-dlp job in the worker, forwarding its structured progress events.
+// Resolves with the job result (`{ filepath }` for downloads, the info dict for `info`).
+// Aborting `signal` closes the connection, which makes the worker stop the job.
+export const runWorkerJob = async (request: WorkerRequest, ytDlpPath: string, onEvent?: (event: WorkerEvent) => void, signal?: AbortSignal): Promise<any> => {
+    await ensureWorker(ytDlpPath);
+    if (signal) signal.throwIfAborted();
+    workerCounters.jobs++;
+
+    return new Promise((resolve, reject) => {
+        const socket = net.createConnection(WORKER_SOCKET);
+        let buffer = '';
+        let settled = false;
+
+        const onAbort = () => {
+            workerCounters.cancelledJobs++;
+            finish(signal!.reason);
+        };
+        if (signal) signal.addEventListener('abort', onAbort, { once: true });
+
+        const finish = (error: Error | null, result?: any) => {
+            if (settled) return;
+            settled = true;
+            socket.destroy();
+            if (signal) signal.removeEventListener('abort', onAbort);
+            if (error) {
+                workerCounters.failedJobs++;
+                reject(error);
+            } else {
+                resolve(result);
+            }
+        };
+
+        socket.on('connect', () => socket.write(JSON.stringify(request) + '\n'));
+        socket.on('data', (data) => {
+            buffer += data.toString();
+            const lines = buffer.split('\n');
+            buffer = lines.pop() || '';
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                let message: any;
+                try {
+                    message = JSON.parse(line);
+                } catch {
+                    continue;
+                }
+
+                if (message.event === 'done') return finish(null, message.result);
+                if (message.event === 'error') return finish(new Error(`yt-dlp failed: ${message.message}`));
+                if (message.event === 'started') {
+                    workerCounters.totalQueuedMs += message.queuedMs || 0;
+                    if (message.warm) workerCounters.warmJobs++;
+                }
+                if (onEvent) onEvent(message);
+            }
+        });
+        socket.on('error', (e) => finish(new WorkerUnavailableError(`yt-dlp worker connection failed: ${e.message}`)));
+        socket.on('close', () => finish(new WorkerUnavailableError('yt-dlp worker closed the connection without a result')));
+    });
+};
+
+export const getWorkerStats = () => ({
+    enabled: WORKER_ENABLED,
+    running: !!worker,
+    concurrency: WORKER_CONCURRENCY,
+    ...workerCounters,
+});
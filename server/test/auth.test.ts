@@ -0,0 +1,125 @@
+import { test, before, after } from 'node:test';
+import assert from 'node:assert/strict';
+import crypto from 'crypto';
+import http from 'http';
+import { AddressInfo } from 'net';
+
+// A local server stands in for Supabase Auth: it publishes the JWKS and rejects every token sent to
+// /auth/v1/user, so a token that can't be verified locally must come back rejected.
+const JWT_SECRET = 'test-jwt-secret';
+const KEY_ID = 'test-key';
+const { privateKey, publicKey } = crypto.generateKeyPairSync('ec', { namedCurve: 'P-256' });
+
+let server: http.Server;
+let issuer: string;
+let auth: typeof import('../src/services/auth');
+
+const encode = (value: object) => Buffer.from(JSON.stringify(value)).toString('base64url');
+
+const sign = (header: Record<string, any>, claims: Record<string, any>, key: crypto.KeyObject | string = JWT_SECRET) => {
+    const now = Math.floor(Date.now() / 1000);
+    const payload = { sub: crypto.randomUUID(), aud: 'authenticated', iss: issuer, iat: now, exp: now + 3600, ...claims };
+    const signingInput = `${encode(header)}.${encode(payload)}`;
+
+    let signature: Buffer;
+    if (header.alg === 'HS256') {
+        signature = crypto.createHmac('sha256', key as string | crypto.KeyObject).update(signingInput).digest();
+    } else if (header.alg === 'ES256') {
+        signature = crypto.sign('sha256', Buffer.from(signingInput), { key: key as crypto.KeyObject, dsaEncoding: 'ieee-p1363' });
+    } else {
+        signature = Buffer.alloc(0);
+    }
+    return { token: `${signingInput}.${signature.toString('base64url')}`, sub: payload.sub };
+};
+
+before(async () => {
+    server = http.createServer((req, res) => {
+        res.setHeader('Content-Type', 'application/json');
+        if (req.url === '/auth/v1/.well-known/jwks.json') {
+            res.end(JSON.stringify({ keys: [{ ...publicKey.export({ format: 'jwk' }), kid: KEY_ID, alg: 'ES256', use: 'sig' }] }));
+        } else {
+            res.statusCode = 401;
+            res.end(JSON.stringify({ code: 401, message: 'invalid JWT' }));
+        }
+    });
+    await new Promise<void>((resolve) => server.listen(0, '127.0.0.1', resolve));
+
+    const url = `http://127.0.0.1:${(server.address() as AddressInfo).port}`;
+    issuer = `${url}/auth/v1`;
+    process.env.SUPABASE_URL = url;
+    process.env.SUPABASE_SERVICE_ROLE_KEY = 'test-service-role-key';
+    process.env.SUPABASE_JWT_SECRET = JWT_SECRET;
+    delete process.env.SUPABASE_JWKS_URL;
+    delete process.env.SUPABASE_JWT_AUDIENCE;
+    delete process.env.SUPABASE_JWT_ISSUER;
+    // auth.ts reads its configuration when it is loaded
+    auth = await import('../src/services/auth');
+});
+
+after(() => {
+    server.closeAllConnections();
+    server.close();
+});
+
+test('accepts an HS256 token signed with the project secret', async () => {
+    const { token, sub } = sign({ alg: 'HS256', typ: 'JWT' }, {});
+    const statsBefore = auth.getAuthStats();
+
+    assert.equal(await auth.verifyAccessToken(token), sub);
+    assert.equal(auth.getAuthStats().local - statsBefore.local, 1);
+
+    // Verified tokens are remembered
+    assert.equal(await auth.verifyAccessToken(token), sub);
+    assert.equal(auth.getAuthStats().cached - statsBefore.cached, 1);
+});
+
+test('accepts an ES256 token signed with a published key', async () => {
+    const { token, sub } = sign({ alg: 'ES256', typ: 'JWT', kid: KEY_ID }, {}, privateKey);
+    assert.equal(await auth.verifyAccessToken(token), sub);
+});
+
+test('rejects a token with a bad signature', async () => {
+    const { token } = sign({ alg: 'HS256', typ: 'JWT' }, {}, 'some-other-secret');
+    await assert.rejects(auth.verifyAccessToken(token), /Invalid token signature/);
+
+    // A valid signature over a different payload
+    const [header, , signature] = sign({ alg: 'ES256', typ: 'JWT', kid: KEY_ID }, {}, privateKey).token.split('.');
+    const tampered = `${header}.${encode({ sub: 'someone-else', aud: 'authenticated', iss: issuer, exp: Math.floor(Date.now() / 1000) + 3600 })}.${signature}`;
+    await assert.rejects(auth.verifyAccessToken(tampered), auth.InvalidTokenError);
+});
+
+test('rejects an expired token', async () => {
+    const { token } = sign({ alg: 'HS256', typ: 'JWT' }, { exp: Math.floor(Date.now() / 1000) - 120 });
+    await assert.rejects(auth.verifyAccessToken(token), /Token expired/);
+});
+
+test('rejects a token for another audience or issuer', async () => {
+    const wrongAudience = sign({ alg: 'HS256', typ: 'JWT' }, { aud: 'anon' }).token;
+    await assert.rejects(auth.verifyAccessToken(wrongAudience), /Invalid token audience/);
+
+    const wrongIssuer = sign({ alg: 'HS256', typ: 'JWT' }, { iss: 'https://attacker.example/auth/v1' }).token;
+    await assert.rejects(auth.verifyAccessToken(wrongIssuer), /Invalid token issuer/);
+});
+
+test('rejects unsigned tokens and algorithm confusion', async () => {
+    const statsBefore = auth.getAuthStats();
+
+    // alg none can't be verified locally, and the auth server refuses it
+    const unsigned = sign({ alg: 'none', typ: 'JWT' }, {}).token;
+    await assert.rejects(auth.verifyAccessToken(unsigned), auth.InvalidTokenError);
+
+    // HS256 "signed" with the public key, hoping it is used as the HMAC secret
+    const publicPem = publicKey.export({ format: 'pem', type: 'spki' }).toString();
+    const confused = sign({ alg: 'HS256', typ: 'JWT', kid: KEY_ID }, {}, publicPem).token;
+    await assert.rejects(auth.verifyAccessToken(confused), /Invalid token signature/);
+
+    assert.equal(auth.getAuthStats().rejected - statsBefore.rejected, 2);
+    assert.equal(auth.getAuthStats().remote, statsBefore.remote);
+});
+
+test('rejects a token signed with an unknown key id', async () => {
+    const { privateKey: otherKey } = crypto.generateKeyPairSync('ec', { namedCurve: 'P-256' });
+    const { token } = sign({ alg: 'ES256', typ: 'JWT', kid: 'unknown-key' }, {}, otherKey);
+
+    await assert.rejects(auth.verifyAccessToken(token), auth.InvalidTokenError);
+});
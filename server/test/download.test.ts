@@ -0,0 +1,91 @@
+import { test, before, after } from 'node:test';
+import assert from 'node:assert/strict';
+import { spawn, spawnSync, ChildProcess } from 'child_process';
+import crypto from 'crypto';
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import readline from 'readline';
+import { downloadWithRanges, getDownloadStats } from '../src/services/download';
+
+// Runs the range download engine against sidecar/range_server.py, with the server cutting responses
+// part way, and checks the downloaded bytes against the source file.
+const RANGE_SERVER = path.join(__dirname, '../sidecar/range_server.py');
+const PYTHON = process.env.PYTHON || 'python3';
+const hasPython = spawnSync(PYTHON, ['--version']).status === 0;
+
+const FILE_BYTES = 3 * 1024 * 1024 + 12345;
+const FRAGMENT_BYTES = 256 * 1024;
+
+let dir: string;
+let sourcePath: string;
+let sourceHash: string;
+const servers: ChildProcess[] = [];
+
+const sha256 = (filePath: string) => crypto.createHash('sha256').update(fs.readFileSync(filePath)).digest('hex');
+
+// Starts range_server.py on a free port with `args` and resolves with the file URL
+const startServer = (args: string[]) => new Promise<string>((resolve, reject) => {
+    const server = spawn(PYTHON, [RANGE_SERVER, sourcePath, '--port', '0', ...args], { stdio: ['ignore', 'pipe', 'inherit'] });
+    servers.push(server);
+    server.on('error', reject);
+    server.on('exit', (code) => reject(new Error(`range_server.py exited with code ${code}`)));
+    readline.createInterface({ input: server.stdout! }).once('line', (line) => resolve(JSON.parse(line).url));
+});
+
+before(() => {
+    dir = fs.mkdtempSync(path.join(os.tmpdir(), 'cognistream-download-test-'));
+    sourcePath = path.join(dir, 'source.webm');
+    fs.writeFileSync(sourcePath, crypto.randomBytes(FILE_BYTES));
+    sourceHash = sha256(sourcePath);
+});
+
+after(() => {
+    for (const server of servers) server.kill();
+    fs.rmSync(dir, { recursive: true, force: true });
+});
+
+test('retries fragments the server cuts short', { skip: !hasPython }, async () => {
+    const url = await startServer(['--fail-after', String(64 * 1024), '--failures', '3']);
+    const outputPath = path.join(dir, 'retry.webm');
+    const retriesBefore = getDownloadStats().fragmentRetries;
+
+    await downloadWithRanges(url, outputPath, { fragmentBytes: FRAGMENT_BYTES });
+
+    assert.equal(sha256(outputPath), sourceHash);
+    assert.equal(getDownloadStats().fragmentRetries - retriesBefore, 3);
+    assert.ok(!fs.existsSync(`${outputPath}.part`) && !fs.existsSync(`${outputPath}.part.json`));
+});
+
+test('resumes an interrupted download from its finished fragments', { skip: !hasPython }, async () => {
+    // Throttled, so the first attempt is aborted with some fragments done and the rest still pending
+    const url = await startServer(['--rate-kbps', '2048']);
+    const outputPath = path.join(dir, 'resume.webm');
+
+    const controller = new AbortController();
+    setTimeout(() => controller.abort(new Error('interrupted')), 400);
+    await assert.rejects(downloadWithRanges(url, outputPath, { fragmentBytes: FRAGMENT_BYTES, concurrency: 2, signal: controller.signal }), /interrupted/);
+
+    const state = JSON.parse(fs.readFileSync(`${outputPath}.part.json`, 'utf8'));
+    const fragments = Math.ceil(FILE_BYTES / FRAGMENT_BYTES);
+    assert.ok(state.done.length > 0 && state.done.length < fragments, `${state.done.length}/${fragments} fragments done`);
+
+    const statsBefore = getDownloadStats();
+    await downloadWithRanges(url, outputPath, { fragmentBytes: FRAGMENT_BYTES, concurrency: 2 });
+    const stats = getDownloadStats();
+
+    assert.equal(sha256(outputPath), sourceHash);
+    assert.equal(stats.resumed - statsBefore.resumed, 1);
+    const doneBytes = state.done.reduce((total: number, index: number) => total + Math.min(FRAGMENT_BYTES, FILE_BYTES - index * FRAGMENT_BYTES), 0);
+    assert.equal(stats.resumedBytes - statsBefore.resumedBytes, doneBytes);
+});
+
+test('falls back to a plain download when the server ignores ranges', { skip: !hasPython }, async () => {
+    const url = await startServer(['--no-ranges']);
+    const outputPath = path.join(dir, 'whole.webm');
+
+    await downloadWithRanges(url, outputPath, { fragmentBytes: FRAGMENT_BYTES });
+
+    assert.equal(sha256(outputPath), sourceHash);
+    assert.ok(!fs.existsSync(`${outputPath}.part.json`));
+});
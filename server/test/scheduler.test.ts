@@ -0,0 +1,120 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { StageQueue, QueueFullError, mapWithConcurrency } from '../src/services/scheduler';
+
+// A task that finishes when the test says so
+const deferred = () => {
+    let resolve!: () => void;
+    const promise = new Promise<void>((done) => { resolve = done; });
+    return { promise, resolve };
+};
+
+const tick = () => new Promise((resolve) => setImmediate(resolve));
+
+test('runs at most `concurrency` tasks, starting waiters in FIFO order', async () => {
+    const queue = new StageQueue('test', 2, 10);
+    const started: string[] = [];
+    const tasks = ['a', 'b', 'c', 'd'].map((name) => ({ name, gate: deferred() }));
+
+    const runs = tasks.map(({ name, gate }) => queue.run(async () => {
+        started.push(name);
+        await gate.promise;
+        return name;
+    }));
+    await tick();
+    assert.deepEqual(started, ['a', 'b']);
+    assert.equal(queue.stats().active, 2);
+    assert.equal(queue.stats().queued, 2);
+
+    tasks[1].gate.resolve();
+    await tick();
+    assert.deepEqual(started, ['a', 'b', 'c']);
+
+    tasks[0].gate.resolve();
+    tasks[2].gate.resolve();
+    tasks[3].gate.resolve();
+    assert.deepEqual(await Promise.all(runs), ['a', 'b', 'c', 'd']);
+    assert.equal(queue.stats().active, 0);
+    assert.equal(queue.stats().completed, 4);
+});
+
+test('reports each waiter its position as the queue moves', async () => {
+    const queue = new StageQueue('test', 1, 10);
+    const positions: Record<string, number[]> = { b: [], c: [] };
+    const first = deferred();
+    const second = deferred();
+
+    const runs = [
+        queue.run(() => first.promise),
+        queue.run(() => second.promise, (position) => positions.b.push(position)),
+        queue.run(async () => undefined, (position) => positions.c.push(position)),
+    ];
+    assert.deepEqual(positions, { b: [1], c: [2] });
+
+    first.resolve();
+    await tick();
+    assert.deepEqual(positions, { b: [1], c: [2, 1] });
+
+    second.resolve();
+    await Promise.all(runs);
+    assert.deepEqual(positions, { b: [1], c: [2, 1] });
+});
+
+test('rejects new work once `maxQueued` tasks are waiting', async () => {
+    const queue = new StageQueue('test', 1, 1);
+    const gate = deferred();
+
+    const running = queue.run(() => gate.promise);
+    const waiting = queue.run(async () => 'ran');
+    await assert.rejects(queue.run(async () => 'rejected'), QueueFullError);
+    assert.equal(queue.stats().rejected, 1);
+
+    gate.resolve();
+    await running;
+    assert.equal(await waiting, 'ran');
+});
+
+test('a failed task frees its slot for the next waiter', async () => {
+    const queue = new StageQueue('test', 1, 10);
+
+    const failing = queue.run(async () => { throw new Error('boom'); });
+    const next = queue.run(async () => 'next');
+
+    await assert.rejects(failing, /boom/);
+    assert.equal(await next, 'next');
+    assert.equal(queue.stats().failed, 1);
+});
+
+test('mapWithConcurrency preserves order and limits calls in flight', async () => {
+    let inFlight = 0;
+    let maxInFlight = 0;
+    const results = await mapWithConcurrency([30, 10, 20, 0, 5], 2, async (delay) => {
+        inFlight++;
+        maxInFlight = Math.max(maxInFlight, inFlight);
+        await new Promise((resolve) => setTimeout(resolve, delay));
+        inFlight--;
+        return delay * 2;
+    });
+
+    assert.deepEqual(results, [60, 20, 40, 0, 10]);
+    assert.equal(maxInFlight, 2);
+});
+
+test('mapWithConcurrency stops after a failure and waits for the calls in flight', async () => {
+    const started: number[] = [];
+    let inFlightAborted = false;
+    let inFlightSettled = false;
+
+    await assert.rejects(mapWithConcurrency([0, 1, 2, 3, 4, 5], 2, async (item, _index, signal) => {
+        started.push(item);
+        if (item === 1) throw new Error('chunk failed');
+        // Item 0 is still running when item 1 fails
+        await new Promise<void>((resolve) => signal.addEventListener('abort', () => resolve(), { once: true }));
+        inFlightAborted = signal.aborted;
+        await tick();
+        inFlightSettled = true;
+    }), /chunk failed/);
+
+    assert.deepEqual(started, [0, 1]);
+    assert.ok(inFlightAborted && inFlightSettled);
+});
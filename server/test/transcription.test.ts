@@ -0,0 +1,45 @@
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { stitchTranscripts } from '../src/services/transcription';
+
+test('drops the words a chunk repeats from the previous overlap', () => {
+    assert.equal(
+        stitchTranscripts(['we went to the market on sunday morning', 'on sunday morning and bought bread']),
+        'we went to the market on sunday morning and bought bread'
+    );
+});
+
+test('matches the overlap regardless of case and punctuation', () => {
+    assert.equal(
+        stitchTranscripts(['we went to the market on sunday morning.', 'On Sunday, morning and bought bread']),
+        'we went to the market on sunday morning. and bought bread'
+    );
+});
+
+test('skips a partial word cut at the start of the overlap', () => {
+    assert.equal(
+        stitchTranscripts(['we went to the market on sunday morning', 'ket on sunday morning and bought bread']),
+        'we went to the market on sunday morning and bought bread'
+    );
+});
+
+test('keeps both chunks whole when they share no overlap', () => {
+    assert.equal(
+        stitchTranscripts(['we went to the market', 'the bakery was closed']),
+        'we went to the market the bakery was closed'
+    );
+});
+
+test('ignores overlaps shorter than three words', () => {
+    assert.equal(
+        stitchTranscripts(['see you on sunday morning', 'sunday morning was sunny']),
+        'see you on sunday morning sunday morning was sunny'
+    );
+});
+
+test('skips empty chunks and keeps paragraph breaks', () => {
+    assert.equal(
+        stitchTranscripts(['first paragraph ends here.\n\nsecond one', '', 'ends here.\n\nsecond one goes on']),
+        'first paragraph ends here.\n\nsecond one goes on'
+    );
+});
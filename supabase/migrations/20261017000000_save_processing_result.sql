@@ -0,0 +1,49 @@
+-- Persists a processed video (video, transcription, summary and usage log) in one transaction.
+-- Called once per result by the server (services/supabase.ts -> persistProcessingResult).
+create or replace function public.save_processing_result(
+    p_user_id uuid,
+    p_video_url text,
+    p_transcription text,
+    p_summary text,
+    p_key_topics jsonb,
+    p_provider text,
+    p_model text,
+    p_service_type text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost_brl numeric
+)
+returns videos.id%type
+language plpgsql
+set search_path = public
+as $$
+declare
+    v_video_id videos.id%type;
+begin
+    insert into videos (user_id, original_url)
+    values (p_user_id, p_video_url)
+    returning id into v_video_id;
+
+    insert into transcriptions (user_id, video_id, content)
+    values (p_user_id, v_video_id, p_transcription);
+
+    -- jsonb_populate_record converts the topics to the column's type (text[] or jsonb)
+    insert into summaries (user_id, video_id, content, key_topics)
+    select user_id, video_id, content, key_topics
+    from jsonb_populate_record(null::summaries, jsonb_build_object(
+        'user_id', p_user_id,
+        'video_id', v_video_id,
+        'content', p_summary,
+        'key_topics', coalesce(p_key_topics, '[]'::jsonb)
+    ));
+
+    insert into usage_logs (user_id, video_id, provider, model, service_type, input_tokens, output_tokens, total_tokens, cost_brl)
+    values (p_user_id, v_video_id, p_provider, p_model, p_service_type, p_input_tokens, p_output_tokens, p_input_tokens + p_output_tokens, p_cost_brl);
+
+    return v_video_id;
+end;
+$$;
+
+-- Only the backend (service role) writes results
+revoke execute on function public.save_processing_result(uuid, text, text, text, jsonb, text, text, text, integer, integer, numeric) from public, anon, authenticated;
+grant execute on function public.save_processing_result(uuid, text, text, text, jsonb, text, text, text, integer, integer, numeric) to service_role;
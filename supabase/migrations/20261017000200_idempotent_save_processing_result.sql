@@ -0,0 +1,63 @@
+-- Results are delivered at least once (the server's write-behind journal replays a write whose ack was lost),
+-- so each call carries the journal record id and a replay returns the video written by the first delivery.
+alter table public.videos add column if not exists idempotency_key uuid;
+create unique index if not exists videos_idempotency_key_key on public.videos (idempotency_key);
+
+drop function if exists public.save_processing_result(uuid, text, text, text, jsonb, text, text, text, integer, integer, numeric, text);
+
+create or replace function public.save_processing_result(
+    p_user_id uuid,
+    p_video_url text,
+    p_transcription text,
+    p_summary text,
+    p_key_topics jsonb,
+    p_provider text,
+    p_model text,
+    p_service_type text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost_brl numeric,
+    p_content_hash text default null,
+    p_idempotency_key uuid default null
+)
+returns videos.id%type
+language plpgsql
+set search_path = public
+as $$
+declare
+    v_video_id videos.id%type;
+begin
+    insert into videos (user_id, original_url, content_hash, idempotency_key)
+    values (p_user_id, p_video_url, p_content_hash, p_idempotency_key)
+    on conflict (idempotency_key) do nothing
+    returning id into v_video_id;
+
+    -- Already written by an earlier delivery of the same record: nothing else to insert
+    if v_video_id is null then
+        select id into v_video_id from videos where idempotency_key = p_idempotency_key;
+        return v_video_id;
+    end if;
+
+    insert into transcriptions (user_id, video_id, content)
+    values (p_user_id, v_video_id, p_transcription);
+
+    -- jsonb_populate_record converts the topics to the column's type (text[] or jsonb)
+    insert into summaries (user_id, video_id, content, key_topics)
+    select user_id, video_id, content, key_topics
+    from jsonb_populate_record(null::summaries, jsonb_build_object(
+        'user_id', p_user_id,
+        'video_id', v_video_id,
+        'content', p_summary,
+        'key_topics', coalesce(p_key_topics, '[]'::jsonb)
+    ));
+
+    insert into usage_logs (user_id, video_id, provider, model, service_type, input_tokens, output_tokens, total_tokens, cost_brl)
+    values (p_user_id, v_video_id, p_provider, p_model, p_service_type, p_input_tokens, p_output_tokens, p_input_tokens + p_output_tokens, p_cost_brl);
+
+    return v_video_id;
+end;
+$$;
+
+-- Only the backend (service role) writes results
+revoke execute on function public.save_processing_result(uuid, text, text, text, jsonb, text, text, text, integer, integer, numeric, text, uuid) from public, anon, authenticated;
+grant execute on function public.save_processing_result(uuid, text, text, text, jsonb, text, text, text, integer, integer, numeric, text, uuid) to service_role;